@@ -12,7 +12,7 @@ from app.config import settings
 from app.database import Base
 
 # Import all models to ensure they're registered with SQLAlchemy
-from app.models import user, item, category, swap
+from app.models import user, item, category, swap, outbox, announcement, image
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -1,13 +1,18 @@
+import asyncio
 from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func, and_
 
 from app.api.deps import get_current_admin_user, get_db
-from app.models import User, Item, Category, Swap, PointTransaction, ItemStatus, SwapStatus
+from app.models import (
+    User, Item, Category, Swap, PointTransaction, ItemStatus, SwapStatus,
+    Announcement, AnnouncementStatus
+)
 from app.schemas import (
     UserResponse, ItemResponse, SwapResponse, 
-    CategoryCreate, CategoryUpdate, CategoryResponse
+    CategoryCreate, CategoryUpdate, CategoryResponse,
+    AnnouncementCreate, AnnouncementResponse
 )
 
 router = APIRouter()
@@ -247,9 +252,14 @@ def approve_item(
             detail="Item not found"
         )
     
+    from app.services.image_storage import holds_images, image_store
+    held_images = holds_images(item)
     item.status = ItemStatus.AVAILABLE.value
     item.admin_notes = admin_notes
     item.published_at = func.now()
+    if not held_images and holds_images(item):
+        # Approving a rejected item: its images count again
+        image_store.attach(db, item.image_urls or [])
     
     db.commit()
     
@@ -279,6 +289,10 @@ def reject_item(
             detail="Item not found"
         )
     
+    from app.services.image_storage import holds_images, image_store
+    if holds_images(item):
+        # Files stay until the upload GC's grace period ends, in case it's approved after all
+        image_store.detach(db, item.image_urls or [])
     item.status = ItemStatus.REJECTED.value
     item.rejection_reason = rejection_reason
     item.admin_notes = admin_notes
@@ -446,4 +460,110 @@ def get_platform_analytics(
             }
             for user in top_users
         ]
-    }
\ No newline at end of file
+    }
+
+
+@router.post("/announcements", response_model=AnnouncementResponse)
+async def create_announcement(
+    announcement_data: AnnouncementCreate,
+    admin_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Email an announcement to every active user (admin only).
+    Sent in the background; poll GET /announcements/{id} for progress.
+    """
+    from app.services.announcements import announcement_mailer
+    
+    announcement = Announcement(
+        subject=announcement_data.subject,
+        message=announcement_data.message,
+        personalized=announcement_data.personalized,
+        created_by=admin_user.id,
+        status=AnnouncementStatus.PENDING.value
+    )
+    
+    db.add(announcement)
+    db.commit()
+    db.refresh(announcement)
+    announcement_mailer.wake()
+    
+    if announcement_data.notify_online:
+        from app.core.websockets import notification_service
+        await notification_service.notify_system_announcement(announcement_data.message)
+    
+    return announcement
+
+
+@router.get("/announcements/{announcement_id}", response_model=AnnouncementResponse)
+def get_announcement(
+    announcement_id: int,
+    admin_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Get announcement sending progress (admin only)
+    """
+    announcement = db.query(Announcement).filter(Announcement.id == announcement_id).first()
+    
+    if not announcement:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found"
+        )
+    
+    return announcement
+
+
+@router.post("/announcements/{announcement_id}/cancel", response_model=AnnouncementResponse)
+def cancel_announcement(
+    announcement_id: int,
+    admin_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Stop an announcement that is still sending (admin only)
+    """
+    announcement = db.query(Announcement).filter(Announcement.id == announcement_id).first()
+    
+    if not announcement:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found"
+        )
+    
+    if announcement.status not in (AnnouncementStatus.PENDING.value, AnnouncementStatus.SENDING.value):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Announcement is already {announcement.status}"
+        )
+    
+    # The sender notices at its next checkpoint
+    announcement.status = AnnouncementStatus.CANCELLED.value
+    db.commit()
+    db.refresh(announcement)
+    
+    return announcement
+
+
+@router.post("/uploads/gc")
+async def run_upload_gc(
+    dry_run: bool = Query(True, description="Only report what would be deleted"),
+    admin_user: User = Depends(get_current_admin_user)
+) -> Any:
+    """
+    Run an orphaned-upload sweep now and return its report (admin only)
+    """
+    from app.services.upload_gc import upload_gc
+    return await asyncio.to_thread(upload_gc.sweep, dry_run)
+
+
+@router.get("/uploads/gc")
+def get_upload_gc_status(
+    admin_user: User = Depends(get_current_admin_user)
+) -> Any:
+    """
+    Upload GC totals and the last sweep's report (admin only)
+    """
+    from app.services.upload_gc import upload_gc
+    return upload_gc.get_stats()
@@ -8,6 +8,9 @@ from sqlalchemy.orm import Session
 from app.api.deps import get_current_user, get_db
 from app.core.security import create_access_token, get_password_hash, verify_password
 from app.core.utils import generate_username, award_points
+from app.core.events import UserRegistered
+from app.services.outbox import add_outbox_event, outbox_relay
+from app.services.user_contacts import user_contacts
 from app.core.websockets import notification_service
 from app.models import User
 from app.schemas import UserCreate, UserResponse, UserLogin, Token, UserUpdate
@@ -57,8 +60,7 @@ async def register_user(
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    db.flush()  # Assigns user.id
     
     # Award signup bonus points transaction
     award_points(
@@ -66,16 +68,17 @@ async def register_user(
         amount=settings.SIGNUP_BONUS_POINTS,
         transaction_type="signup_bonus",
         description="Welcome bonus for joining ReWear",
-        db=db
+        db=db,
+        commit=False
     )
     
-    # 🎉 Send Welcome Notifications (WebSocket + Email)
-    try:
-        await notification_service.send_welcome_notification(user.id)
-        print(f"✅ Welcome notifications sent to {user.email}")
-    except Exception as e:
-        print(f"⚠️ Failed to send welcome notifications: {e}")
-        # Don't fail registration if notifications fail
+    # 🎉 Welcome Notifications (WebSocket + Email), sent after the response;
+    # failures are retried by the outbox relay and never fail registration
+    add_outbox_event(db, UserRegistered(user_id=user.id))
+    
+    db.commit()
+    db.refresh(user)
+    outbox_relay.wake()
     
     return user
 
@@ -187,6 +190,7 @@ def update_current_user_profile(
     
     db.commit()
     db.refresh(current_user)
+    user_contacts.invalidate(current_user.id)
     
     return current_user
 
@@ -6,7 +6,9 @@ from sqlalchemy import desc, and_, or_
 
 from app.api.deps import get_current_user, get_db, get_optional_current_user
 from app.core.utils import calculate_item_points, award_points
-from app.core.websockets import notification_service
+from app.core.events import ItemApproved, PointsAwarded
+from app.services.image_storage import holds_images, image_store
+from app.services.outbox import add_outbox_event, outbox_relay
 from app.services.search import SearchService
 from app.models import User, Item, Category, ItemStatus, ItemCondition, ItemSize
 from app.schemas import (
@@ -59,8 +61,7 @@ async def create_item(
     )
     
     db.add(item)
-    db.commit()
-    db.refresh(item)
+    db.flush()  # Assigns item.id for the points transaction and events
     
     # Award points for listing an item
     listing_points = max(5, points_value // 4)  # 25% of item value, minimum 5
@@ -70,24 +71,27 @@ async def create_item(
         transaction_type="item_listed",
         description=f"Points earned for listing '{item.title}'",
         db=db,
-        item_id=item.id
+        item_id=item.id,
+        commit=False
     )
     
-    # 🔔 Send notification about points earned
-    await notification_service.notify_points_earned(
+    # 🔔 Notify about points earned (committed with the item)
+    add_outbox_event(db, PointsAwarded(
         user_id=current_user.id,
         points=listing_points,
         reason=f"Listed new item: {item.title}"
-    )
+    ))
     
-    # 🔔 Send approval notification (if auto-approved)
-    await notification_service.notify_item_approved(
+    # 🔔 Approval notification (if auto-approved)
+    add_outbox_event(db, ItemApproved(
         user_id=current_user.id,
-        item_data={
-            "item_id": item.id,
-            "title": item.title
-        }
-    )
+        item_id=item.id,
+        title=item.title
+    ))
+    
+    db.commit()
+    db.refresh(item)
+    outbox_relay.wake()
     
     return item
 
@@ -419,6 +423,10 @@ def delete_item(
             detail="Cannot delete item that is involved in active swaps"
         )
     
+    # Release its images; the upload GC deletes unused ones after its grace period
+    if holds_images(item):
+        image_store.detach(db, item.image_urls or [])
+    
     # Soft delete by deactivating
     item.is_active = False
     item.status = ItemStatus.WITHDRAWN.value
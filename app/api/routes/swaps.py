@@ -6,7 +6,8 @@ from sqlalchemy.orm import Session
 
 from app.api.deps import get_current_user, get_db
 from app.core.utils import deduct_points, award_points
-from app.core.websockets import notification_service
+from app.core.events import PointsAwarded, SwapCompleted, SwapCreated, SwapResponded
+from app.services.outbox import add_outbox_event, outbox_relay
 from app.models import User, Item, Swap, SwapType, SwapStatus, ItemStatus
 from app.schemas import SwapCreate, SwapUpdate, SwapResponse
 
@@ -115,22 +116,23 @@ async def create_swap_request(
     )
     
     db.add(swap)
-    db.commit()
-    db.refresh(swap)
+    db.flush()  # Assigns swap.id for the event
     
-    # 🔔 Send real-time notification to item owner
-    await notification_service.notify_swap_request(
+    # 🔔 Notify the item owner once the swap commits
+    add_outbox_event(db, SwapCreated(
+        swap_id=swap.id,
         requester_id=current_user.id,
         owner_id=item.owner_id,
-        swap_data={
-            "swap_id": swap.id,
-            "item_id": item.id,
-            "item_title": item.title,
-            "swap_type": swap.swap_type,
-            "points_offered": swap.points_offered,
-            "requester_username": current_user.username
-        }
-    )
+        item_id=item.id,
+        item_title=item.title,
+        swap_type=swap.swap_type,
+        points_offered=swap.points_offered,
+        requester_username=current_user.username
+    ))
+    
+    db.commit()
+    db.refresh(swap)
+    outbox_relay.wake()
     
     return SwapResponse.model_validate(swap)
 
@@ -179,21 +181,20 @@ async def accept_swap(
     if swap.swap_type == SwapType.DIRECT_SWAP.value and swap.offered_item:
         swap.offered_item.status = ItemStatus.PENDING_SWAP.value
     
-    db.commit()
-    db.refresh(swap)
-    
-    # 🔔 Send real-time notification to requester
-    await notification_service.notify_swap_response(
+    # 🔔 Notify the requester once the change commits
+    add_outbox_event(db, SwapResponded(
+        swap_id=swap.id,
         requester_id=swap.requester_id,
         owner_id=current_user.id,
-        swap_data={
-            "swap_id": swap.id,
-            "item_id": item.id,
-            "item_title": item.title,
-            "owner_response": owner_response
-        },
+        item_id=item.id,
+        item_title=item.title,
+        owner_response=owner_response,
         accepted=True
-    )
+    ))
+    
+    db.commit()
+    db.refresh(swap)
+    outbox_relay.wake()
     
     return SwapResponse.model_validate(swap)
 
@@ -225,21 +226,20 @@ async def reject_swap(
     swap.owner_response = owner_response
     swap.responded_at = datetime.now(timezone.utc)
     
-    db.commit()
-    db.refresh(swap)
-    
-    # 🔔 Send real-time notification to requester
-    await notification_service.notify_swap_response(
+    # 🔔 Notify the requester once the change commits
+    add_outbox_event(db, SwapResponded(
+        swap_id=swap.id,
         requester_id=swap.requester_id,
         owner_id=current_user.id,
-        swap_data={
-            "swap_id": swap.id,
-            "item_id": swap.item.id,
-            "item_title": swap.item.title,
-            "owner_response": owner_response
-        },
+        item_id=swap.item.id,
+        item_title=swap.item.title,
+        owner_response=owner_response,
         accepted=False
-    )
+    ))
+    
+    db.commit()
+    db.refresh(swap)
+    outbox_relay.wake()
     
     return SwapResponse.model_validate(swap)
 
@@ -290,7 +290,8 @@ async def complete_swap(
             description=f"Points earned from swapping for '{item.title}'",
             db=db,
             swap_id=swap.id,
-            item_id=item.id
+            item_id=item.id,
+            commit=False
         )
         
         award_points(
@@ -300,7 +301,8 @@ async def complete_swap(
             description=f"Points earned from swapping '{swap.offered_item.title}'",
             db=db,
             swap_id=swap.id,
-            item_id=swap.offered_item.id
+            item_id=swap.offered_item.id,
+            commit=False
         )
         
         points_earned = {
@@ -317,7 +319,8 @@ async def complete_swap(
             description=f"Points spent on '{item.title}'",
             db=db,
             swap_id=swap.id,
-            item_id=item.id
+            item_id=item.id,
+            commit=False
         )
         
         award_points(
@@ -327,41 +330,41 @@ async def complete_swap(
             description=f"Points received for '{item.title}'",
             db=db,
             swap_id=swap.id,
-            item_id=item.id
+            item_id=item.id,
+            commit=False
         )
         
         points_earned = {
             "owner_points": swap.points_offered
         }
     
-    db.commit()
-    db.refresh(swap)
-    
-    # 🔔 Send real-time notifications to both parties
-    await notification_service.notify_swap_completed(
+    # 🔔 Notify both parties once the swap, points and events commit together
+    add_outbox_event(db, SwapCompleted(
+        swap_id=swap.id,
         user_ids=[swap.requester_id, current_user.id],
-        swap_data={
-            "swap_id": swap.id,
-            "item_id": item.id,
-            "item_title": item.title,
-            "points_earned": points_earned.get("requester_points", points_earned.get("owner_points", 0))
-        }
-    )
+        item_id=item.id,
+        item_title=item.title,
+        points_earned=points_earned.get("requester_points", points_earned.get("owner_points", 0))
+    ))
     
-    # Send individual points notifications if applicable
+    # Individual points notifications if applicable
     if "requester_points" in points_earned:
-        await notification_service.notify_points_earned(
+        add_outbox_event(db, PointsAwarded(
             user_id=swap.requester_id,
             points=points_earned["requester_points"],
             reason=f"Completed swap for '{item.title}'"
-        )
+        ))
     
     if "owner_points" in points_earned:
-        await notification_service.notify_points_earned(
+        add_outbox_event(db, PointsAwarded(
             user_id=current_user.id,
             points=points_earned["owner_points"],
             reason=f"Completed swap of '{item.title}'"
-        )
+        ))
+    
+    db.commit()
+    db.refresh(swap)
+    outbox_relay.wake()
     
     return SwapResponse.model_validate(swap)
 
@@ -451,20 +454,19 @@ async def cancel_swap(
     # Cancel the swap
     swap.status = SwapStatus.CANCELLED.value
     
-    db.commit()
-    db.refresh(swap)
-    
     # 🔔 Optional: Notify item owner of cancellation
-    await notification_service.notify_swap_response(
+    add_outbox_event(db, SwapResponded(
+        swap_id=swap.id,
         requester_id=current_user.id,
         owner_id=swap.item_owner_id,
-        swap_data={
-            "swap_id": swap.id,
-            "item_id": swap.item.id,
-            "item_title": swap.item.title
-        },
+        item_id=swap.item.id,
+        item_title=swap.item.title,
         accepted=False  # Cancellation is treated as a negative response
-    )
+    ))
+    
+    db.commit()
+    db.refresh(swap)
+    outbox_relay.wake()
     
     return SwapResponse.model_validate(swap)
 
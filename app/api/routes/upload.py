@@ -1,187 +1,401 @@
 import os
 import uuid
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import FileResponse
+import asyncio
+import base64
+import hashlib
+from email.utils import formatdate
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
 from sqlalchemy.orm import Session
-from PIL import Image
-import shutil
 
 from app.api.deps import get_current_user, get_db
 from app.models import User, Item
 from app.config import settings
+from app.services.image_cache import image_cache, snap_width
+from app.services.image_processing import (
+    ImageProcessingError, ImageQueueFull, VARIANT_ENCODINGS, VARIANT_FORMATS
+)
+from app.services.image_storage import UPLOADS_URL_PREFIX, holds_images, image_store, relative_upload_path
+from app.services.resumable_uploads import UploadConflict, UploadSession, UploadTooLarge, resumable_uploads
 
 router = APIRouter()
 
 # Allowed image extensions and max file size
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 MAX_FILE_SIZE = settings.MAX_FILE_SIZE  # 5MB
-MAX_IMAGE_DIMENSION = 2048  # Max width/height in pixels
+UPLOAD_CHUNK_SIZE = 64 * 1024
+IMAGE_SNIFF_BYTES = 12  # Enough for every signature below (WebP needs 12)
+MAX_FORM_FIELD_SIZE = 1024  # Plain fields of an image upload (set_primary)
+# Upload filenames are never reused, so neither are image URLs
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+TUS_RESUMABLE = "1.0.0"
 
+# Leading bytes of the allowed image formats (WebP is checked separately: RIFF....WEBP)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
 
-def validate_image(file: UploadFile) -> None:
-    """Validate uploaded image file"""
-    
-    # Check file extension
-    file_extension = os.path.splitext(file.filename)[1].lower()
+
+def validate_image_extension(filename: str) -> str:
+    """Check the file extension is an allowed image type; returns it"""
+    file_extension = os.path.splitext(filename)[1].lower()
     if file_extension not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
-    
-    # Check file size
-    if file.size and file.size > MAX_FILE_SIZE:
+    return file_extension
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Image format from a file's first bytes, or None if it isn't an allowed image"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, image_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_type
+    return None
+
+
+class ReceivedImage:
+    """
+    A file part of a streamed image upload. Its type is sniffed from the
+    first bytes before anything is written and its size is checked while it
+    streams to UPLOAD_INCOMING_DIR; a part that fails keeps the reason in
+    error and the rest of its bytes are dropped.
+    """
+    __slots__ = ("filename", "path", "size", "error", "_head", "_file", "_digest")
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.path: Optional[str] = None
+        self.size = 0
+        self.error: Optional[str] = None
+        self._head = b""
+        self._file = None
+        self._digest = hashlib.sha256()
+        try:
+            file_extension = validate_image_extension(filename)
+        except HTTPException as e:
+            self.error = e.detail
+            return
+        self.path = os.path.join(settings.UPLOAD_INCOMING_DIR, f"{uuid.uuid4()}{file_extension}")
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def write(self, data: bytes):
+        """Blocking, run in the threadpool"""
+        if self.error is not None:
+            return
+        if self._file is None:
+            self._head += data
+            if len(self._head) < IMAGE_SNIFF_BYTES:
+                return
+            data, self._head = self._head, b""
+            if sniff_image_type(data) is None:
+                self.error = "File content is not a supported image"
+                return
+            self._file = open(self.path, "wb")
+        self.size += len(data)
+        if self.size > MAX_FILE_SIZE:
+            self.error = f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+            self.discard()
+            return
+        self._digest.update(data)
+        self._file.write(data)
+
+    def finish(self):
+        """End of the part (blocking)"""
+        if self.error is None and self._file is None:
+            # Shorter than any image header
+            self.error = "File content is not a supported image"
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Remove what was written (blocking)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def receive_image_form(request: Request, max_files: int) -> Tuple[Dict[str, str], List[ReceivedImage]]:
+    """
+    Parse a multipart/form-data image upload straight off the request stream
+    with python-multipart's push parser. Starlette's form parsing would
+    spool the whole body to a temp file before the route could look at it;
+    here each file part is checked as it arrives (see ReceivedImage) and
+    written once. Returns the plain fields and the file parts; if the
+    request fails midway (bad body, disconnect, 413) nothing is left on disk.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+            detail="Expected a multipart/form-data upload"
         )
+    
+    fields: Dict[str, str] = {}
+    images: List[ReceivedImage] = []
+    # Parser callbacks are synchronous: file writes are queued and done in the threadpool
+    pending: List[Tuple[ReceivedImage, Optional[bytes]]] = []
+    header_name = bytearray()
+    header_value = bytearray()
+    disposition = b""
+    part: Optional[ReceivedImage] = None
+    field_name: Optional[str] = None
+    field_value = bytearray()
+    in_part = False
+    
+    def bad_request(detail: str) -> HTTPException:
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    
+    def on_header_field(data: bytes, start: int, end: int):
+        header_name.extend(data[start:end])
+    
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+    
+    def on_header_end():
+        nonlocal disposition
+        if bytes(header_name).lower() == b"content-disposition":
+            disposition = bytes(header_value)
+        header_name.clear()
+        header_value.clear()
+    
+    def on_headers_finished():
+        nonlocal disposition, part, field_name, in_part
+        in_part = True
+        _, options = parse_options_header(disposition)
+        disposition = b""
+        if b"name" not in options:
+            raise bad_request("Malformed multipart body: part without a name")
+        if b"filename" in options:
+            if len(images) >= max_files:
+                raise bad_request(f"Maximum {max_files} image{'s' if max_files > 1 else ''} allowed per upload")
+            part = ReceivedImage(options[b"filename"].decode("utf-8", "replace"))
+            images.append(part)
+        else:
+            part = None
+            field_name = options[b"name"].decode("utf-8", "replace")
+            field_value.clear()
+    
+    def on_part_data(data: bytes, start: int, end: int):
+        if part is not None:
+            pending.append((part, data[start:end]))
+        else:
+            field_value.extend(data[start:end])
+            if len(field_value) > MAX_FORM_FIELD_SIZE:
+                raise bad_request(f"Form field {field_name} too long")
+    
+    def on_part_end():
+        nonlocal in_part
+        in_part = False
+        if part is not None:
+            pending.append((part, None))
+        else:
+            fields[field_name] = field_value.decode("utf-8", "replace")
+    
+    def write_pending(batch: List[Tuple[ReceivedImage, Optional[bytes]]]):
+        for image, data in batch:
+            if data is None:
+                image.finish()
+            else:
+                image.write(data)
+    
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise bad_request("Malformed multipart body")
+            if pending:
+                batch = pending[:]
+                pending.clear()
+                await run_in_threadpool(write_pending, batch)
+        parser.finalize()
+        if in_part:
+            raise bad_request("Malformed multipart body: upload cut short")
+    except BaseException:
+        for image in images:
+            image.discard()
+        raise
+    return fields, images
+
+
+def hash_image_file(file_path: str) -> str:
+    """Check a file on disk is an allowed image and return its SHA-256 (blocking, run in the threadpool)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        chunk = f.read(UPLOAD_CHUNK_SIZE)
+        if sniff_image_type(chunk) is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="File content is not a supported image"
+            )
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+    return digest.hexdigest()
 
 
-def process_image(file_path: str) -> str:
-    """Process and optimize uploaded image"""
+async def store_image(file_path: str, content_hash: str) -> str:
+    """Process and store an uploaded image (deduplicated by content); returns its URL"""
     try:
-        # Open and process image
-        with Image.open(file_path) as img:
-            # Convert RGBA to RGB if needed
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = rgb_img
-            
-            # Resize if image is too large
-            if img.width > MAX_IMAGE_DIMENSION or img.height > MAX_IMAGE_DIMENSION:
-                img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
-            
-            # Save optimized image
-            img.save(file_path, "JPEG", quality=85, optimize=True)
-            
-        return file_path
-    except Exception as e:
-        # Remove file if processing failed
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        return await image_store.ingest(file_path, content_hash)
+    except ImageQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing is busy, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    except ImageProcessingError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Error processing image: {str(e)}"
         )
 
 
-@router.post("/images")
-def upload_image(
-    file: UploadFile = File(...),
+def multipart_request_body(properties: dict, required: List[str]) -> dict:
+    """OpenAPI request body for routes that parse their multipart body themselves"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {"type": "object", "properties": properties, "required": required}
+                }
+            }
+        }
+    }
+
+
+IMAGE_FILE_SCHEMA = {"type": "string", "format": "binary"}
+IMAGE_FILES_SCHEMA = {"type": "array", "items": IMAGE_FILE_SCHEMA}
+
+
+async def store_received_images(images: List[ReceivedImage]) -> dict:
+    """Process and store streamed images in parallel; failures are reported per file"""
+    async def store(image: ReceivedImage) -> dict:
+        if image.error is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=image.error)
+        
+        # Process, optimize and store image (once per distinct content)
+        image_url = await store_image(image.path, image.sha256)
+        
+        return {
+            "image_url": image_url,
+            "filename": image_url[len(UPLOADS_URL_PREFIX):],
+            "original_filename": image.filename,
+            "sha256": image.sha256
+        }
+    
+    results = await asyncio.gather(*(store(image) for image in images), return_exceptions=True)
+    
+    uploaded_images = []
+    failed_uploads = []
+    
+    for image, result in zip(images, results):
+        if isinstance(result, Exception):
+            failed_uploads.append({
+                "filename": image.filename,
+                "error": result.detail if isinstance(result, HTTPException) else str(result)
+            })
+        else:
+            uploaded_images.append(result)
+    
+    return {
+        "message": f"Uploaded {len(uploaded_images)} images successfully",
+        "uploaded_images": uploaded_images,
+        "failed_uploads": failed_uploads,
+        "total_uploaded": len(uploaded_images),
+        "total_failed": len(failed_uploads)
+    }
+
+
+@router.post("/images", openapi_extra=multipart_request_body({"file": IMAGE_FILE_SCHEMA}, ["file"]))
+async def upload_image(
+    request: Request,
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
-    Upload a single image
+    Upload a single image (multipart field "file")
     """
-    validate_image(file)
-    
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
+    _, images = await receive_image_form(request, max_files=1)
+    if not images:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No image file in the upload"
+        )
+    image = images[0]
+    if image.error is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=image.error)
     
     try:
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Process and optimize image
-        processed_path = process_image(file_path)
-        
-        # Return image URL
-        image_url = f"/uploads/{unique_filename}"
+        # Process, optimize and store image (once per distinct content)
+        image_url = await store_image(image.path, image.sha256)
         
         return {
             "message": "Image uploaded successfully",
             "image_url": image_url,
-            "filename": unique_filename,
-            "original_filename": file.filename
+            "filename": image_url[len(UPLOADS_URL_PREFIX):],
+            "original_filename": image.filename,
+            "sha256": image.sha256
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up file if upload failed
-        if os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error uploading image: {str(e)}"
         )
-    finally:
-        file.file.close()
 
 
-@router.post("/images/multiple")
-def upload_multiple_images(
-    files: List[UploadFile] = File(...),
+@router.post("/images/multiple", openapi_extra=multipart_request_body({"files": IMAGE_FILES_SCHEMA}, ["files"]))
+async def upload_multiple_images(
+    request: Request,
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
-    Upload multiple images at once (max 5 images)
+    Upload multiple images at once (max 5 images, multipart field "files"), processed in parallel
     """
-    if len(files) > 5:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum 5 images allowed per upload"
-        )
-    
-    uploaded_images = []
-    failed_uploads = []
-    
-    for file in files:
-        try:
-            validate_image(file)
-            
-            # Generate unique filename
-            file_extension = os.path.splitext(file.filename)[1].lower()
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-            
-            # Save uploaded file
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            # Process and optimize image
-            process_image(file_path)
-            
-            # Add to successful uploads
-            image_url = f"/uploads/{unique_filename}"
-            uploaded_images.append({
-                "image_url": image_url,
-                "filename": unique_filename,
-                "original_filename": file.filename
-            })
-            
-        except Exception as e:
-            failed_uploads.append({
-                "filename": file.filename,
-                "error": str(e)
-            })
-        finally:
-            file.file.close()
-    
-    return {
-        "message": f"Uploaded {len(uploaded_images)} images successfully",
-        "uploaded_images": uploaded_images,
-        "failed_uploads": failed_uploads,
-        "total_uploaded": len(uploaded_images),
-        "total_failed": len(failed_uploads)
-    }
+    _, images = await receive_image_form(request, max_files=5)
+    return await store_received_images(images)
 
 
-@router.post("/items/{item_id}/images")
-def upload_item_images(
+@router.post("/items/{item_id}/images", openapi_extra=multipart_request_body({
+    "files": IMAGE_FILES_SCHEMA,
+    "set_primary": {"type": "integer", "default": 0, "description": "Index of image to set as primary (0-based)"}
+}, ["files"]))
+async def upload_item_images(
     item_id: int,
-    files: List[UploadFile] = File(...),
-    set_primary: int = Form(0, description="Index of image to set as primary (0-based)"),
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ) -> Any:
     """
-    Upload images for a specific item
+    Upload images for a specific item (multipart fields "files" and "set_primary")
     """
     # Verify item ownership
     item = db.query(Item).filter(
@@ -196,14 +410,18 @@ def upload_item_images(
             detail="Item not found or you don't have permission to edit it"
         )
     
-    if len(files) > 5:
+    # Upload images (the item is checked first, so nothing is received for a wrong one)
+    fields, images = await receive_image_form(request, max_files=5)
+    try:
+        set_primary = int(fields.get("set_primary", 0))
+    except ValueError:
+        for image in images:
+            image.discard()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum 5 images allowed per item"
+            detail="set_primary must be an integer"
         )
-    
-    # Upload images
-    upload_result = upload_multiple_images(files, current_user)
+    upload_result = await store_received_images(images)
     uploaded_images = upload_result["uploaded_images"]
     
     if not uploaded_images:
@@ -215,11 +433,11 @@ def upload_item_images(
     # Update item with image URLs
     image_urls = [img["image_url"] for img in uploaded_images]
     
-    # Add to existing images or replace
-    if item.image_urls:
-        item.image_urls.extend(image_urls)
-    else:
-        item.image_urls = image_urls
+    # Add to existing images (a new list: in-place changes to an ARRAY column aren't saved)
+    item.image_urls = (item.image_urls or []) + image_urls
+    if holds_images(item):
+        # Counted in this transaction, so the count never disagrees with the item
+        image_store.attach(db, image_urls)
     
     # Set primary image
     if 0 <= set_primary < len(image_urls):
@@ -227,6 +445,8 @@ def upload_item_images(
     elif not item.primary_image_url and image_urls:
         # Set first image as primary if no primary is set
         item.primary_image_url = image_urls[0]
+    # Stored with the item so listings never look the variants up per row
+    item.primary_image_variants = image_store.responsive_variants(db, item.primary_image_url)
     
     db.commit()
     db.refresh(item)
@@ -269,26 +489,29 @@ def remove_item_image(
             detail="Image not found for this item"
         )
     
-    # Remove image URL from list
-    item.image_urls.remove(image_url)
+    # Remove image URL from list (a new list: in-place changes to an ARRAY column aren't saved)
+    remaining = list(item.image_urls)
+    remaining.remove(image_url)
+    item.image_urls = remaining
     
     # Update primary image if needed
     if item.primary_image_url == image_url:
         item.primary_image_url = item.image_urls[0] if item.image_urls else None
+        item.primary_image_variants = image_store.responsive_variants(db, item.primary_image_url)
     
-    # Delete physical file
-    try:
-        filename = image_url.split("/")[-1]
-        file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception as e:
-        # Log error but don't fail the request
-        print(f"Warning: Could not delete file {image_url}: {e}")
+    # Release the stored image with the item change; a rejected item released it already
+    released = image_store.detach(db, [image_url]) if holds_images(item) else []
     
     db.commit()
     db.refresh(item)
     
+    # Files go only once the change is committed, with the last listing using them
+    try:
+        image_store.delete_released(released)
+    except Exception as e:
+        # Log error but don't fail the request (the upload GC removes it later)
+        print(f"Warning: Could not delete file {image_url}: {e}")
+    
     return {
         "message": "Image removed successfully",
         "item_id": item.id,
@@ -297,17 +520,262 @@ def remove_item_image(
     }
 
 
-@router.get("/images/{filename}")
-def get_image(filename: str):
+@router.get("/images/{filename:path}")
+async def get_image(
+    filename: str,
+    w: Optional[int] = Query(None, ge=1, description="Resize to this width (rounded up to a supported width)"),
+    fmt: Optional[str] = Query(None, description="Convert to jpg, webp or avif")
+):
     """
-    Serve uploaded images
+    Serve uploaded images, optionally resized and/or converted
+    (e.g. ?w=320&fmt=webp). Resized copies are rendered on first request
+    and cached on disk.
     """
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
+    relative_path = relative_upload_path(filename)
+    file_path = os.path.join(settings.UPLOAD_DIR, relative_path) if relative_path else None
     
-    if not os.path.exists(file_path):
+    if file_path is None or not os.path.isfile(file_path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Image not found"
         )
     
-    return FileResponse(file_path)
\ No newline at end of file
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if w is None and fmt is None:
+        return FileResponse(file_path, headers=headers)
+    
+    fmt = "jpg" if fmt in (None, "jpeg") else fmt.lower()
+    if fmt not in VARIANT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Format must be one of: {', '.join(VARIANT_FORMATS)}"
+        )
+    
+    try:
+        cached_path = await image_cache.get(file_path, snap_width(w) if w else None, fmt)
+    except ImageQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing is busy, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    except ImageProcessingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error processing image: {str(e)}"
+        )
+    
+    media_type = VARIANT_ENCODINGS[fmt][1]
+    if settings.IMAGE_ACCEL_REDIRECT_PREFIX:
+        # nginx serves the file itself (internal location aliased to IMAGE_CACHE_DIR)
+        headers["X-Accel-Redirect"] = f"{settings.IMAGE_ACCEL_REDIRECT_PREFIX}/{os.path.basename(cached_path)}"
+        return Response(media_type=media_type, headers=headers)
+    return FileResponse(cached_path, media_type=media_type, headers=headers)
+
+
+# Resumable uploads (tus-style): create a session, PATCH the bytes in as
+# many requests as the connection allows, then complete it
+
+def parse_upload_metadata(header: Optional[str]) -> dict:
+    """Decode a tus Upload-Metadata header: comma-separated "key base64(value)" pairs"""
+    metadata = {}
+    for pair in (header or "").split(","):
+        key, _, value = pair.strip().partition(" ")
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode() if value else ""
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid Upload-Metadata value for {key}"
+            )
+    return metadata
+
+
+def get_upload_session(upload_id: str, current_user: User) -> UploadSession:
+    """The current user's resumable upload, or 404"""
+    session = resumable_uploads.get(upload_id)
+    if session is None or session.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    return session
+
+
+def tus_headers(session: UploadSession, offset: int) -> dict:
+    return {
+        "Tus-Resumable": TUS_RESUMABLE,
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(session.length),
+        "Upload-Expires": formatdate(resumable_uploads.expires_at(session.id), usegmt=True),
+        "Cache-Control": "no-store"
+    }
+
+
+class NotAnImageError(Exception):
+    """A resumable upload's first bytes aren't an allowed image"""
+
+
+async def require_image_head(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Pass a body through, raising NotAnImageError as soon as its first bytes show it isn't an allowed image"""
+    head = b""
+    async for chunk in chunks:
+        if head is not None:
+            head += chunk
+            if len(head) < IMAGE_SNIFF_BYTES:
+                continue
+            if sniff_image_type(head) is None:
+                raise NotAnImageError("File content is not a supported image")
+            chunk, head = head, None
+        yield chunk
+    # A very short first PATCH is checked again on completion
+    if head:
+        yield head
+
+
+@router.post("/resumable", status_code=status.HTTP_201_CREATED)
+def create_resumable_upload(
+    request: Request,
+    response: Response,
+    upload_length: int = Header(..., ge=1, description="Total file size in bytes"),
+    upload_metadata: Optional[str] = Header(None, description="tus metadata, e.g. 'filename <base64 name>'"),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Start a resumable upload. PATCH the file to upload_url (HEAD it to
+    find where to resume after a dropped connection), then POST to
+    upload_url/complete.
+    """
+    filename = parse_upload_metadata(upload_metadata).get("filename") or "upload.jpg"
+    validate_image_extension(filename)
+    
+    if upload_length > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size: {settings.RESUMABLE_UPLOAD_MAX_SIZE // (1024*1024)}MB"
+        )
+    
+    session = resumable_uploads.create(current_user.id, upload_length, filename)
+    upload_url = str(request.url_for("get_resumable_upload_offset", upload_id=session.id))
+    response.headers.update(tus_headers(session, 0))
+    response.headers["Location"] = upload_url
+    
+    return {
+        "upload_id": session.id,
+        "upload_url": upload_url,
+        "offset": 0,
+        "length": session.length
+    }
+
+
+@router.head("/resumable/{upload_id}")
+def get_resumable_upload_offset(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+) -> Response:
+    """
+    Bytes received so far, in the Upload-Offset header
+    """
+    session = get_upload_session(upload_id, current_user)
+    return Response(headers=tus_headers(session, resumable_uploads.offset(session.id)))
+
+
+@router.patch("/resumable/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., ge=0, description="Offset this chunk starts at (the last Upload-Offset returned)"),
+    content_type: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+) -> Response:
+    """
+    Append the request body (Content-Type: application/offset+octet-stream)
+    at Upload-Offset. The body is streamed to disk, so it can be any size
+    up to the remaining length; whatever arrives before a dropped
+    connection is kept.
+    """
+    session = get_upload_session(upload_id, current_user)
+    
+    if content_type != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Content-Type must be application/offset+octet-stream"
+        )
+    
+    chunks = request.stream()
+    if upload_offset == 0:
+        chunks = require_image_head(chunks)
+    
+    try:
+        offset = await resumable_uploads.append(session, upload_offset, chunks)
+    except UploadConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except NotAnImageError as e:
+        # Nothing worth resuming; anything else (413, a dropped connection) keeps the session
+        resumable_uploads.delete(session.id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=tus_headers(session, offset))
+
+
+@router.post("/resumable/{upload_id}/complete")
+async def complete_resumable_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Process and store a fully sent resumable upload, like /images
+    """
+    session = get_upload_session(upload_id, current_user)
+    
+    offset = resumable_uploads.offset(session.id)
+    if offset != session.length:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload incomplete: {offset} of {session.length} bytes received"
+        )
+    
+    file_extension = os.path.splitext(session.filename)[1].lower()
+    file_path = os.path.join(settings.UPLOAD_INCOMING_DIR, f"{uuid.uuid4()}{file_extension}")
+    try:
+        resumable_uploads.take(session, file_path)
+    except FileNotFoundError:
+        # Completed by a concurrent request
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    
+    try:
+        content_hash = await run_in_threadpool(hash_image_file, file_path)
+    except HTTPException:
+        os.remove(file_path)
+        raise
+    
+    # Process, optimize and store image (once per distinct content)
+    image_url = await store_image(file_path, content_hash)
+    
+    return {
+        "message": "Image uploaded successfully",
+        "image_url": image_url,
+        "filename": image_url[len(UPLOADS_URL_PREFIX):],
+        "original_filename": session.filename,
+        "sha256": content_hash
+    }
+
+
+@router.delete("/resumable/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_resumable_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+) -> Response:
+    """
+    Abandon a resumable upload and delete what was sent
+    """
+    session = get_upload_session(upload_id, current_user)
+    resumable_uploads.delete(session.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={"Tus-Resumable": TUS_RESUMABLE})
@@ -1,19 +1,43 @@
 # app/api/routes/websockets.py
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, Header, Query
+from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import AsyncIterator, List, Optional
+import asyncio
+import time
 import json
 
 from app.core.websockets import manager, notification_service
+from app.core.events import event_bus
+from app.core.metrics import metrics
+from app.core.encoding import CODECS, COMPACT_KEYS, SUBPROTOCOL_JSON
 from app.core.security import verify_token
+from app.api.deps import get_current_user
+from app.core.typing_relay import typing_relay
+from app.services.outbox import outbox_relay
+from app.services.presence import presence_service
+from app.services.email import email_service
+from app.services.announcements import announcement_mailer
+from app.services.email_digest import email_digest
+from app.services.email_queue import email_queue
+from app.services.user_contacts import user_contacts
 from app.config import settings
-from app.database import get_db
+from app.database import SessionLocal
 from app.models import User
-from app.config import settings
 
 router = APIRouter()
 
+# Header-based auth for the SSE stream (keeps tokens out of URLs and access logs)
+stream_security = HTTPBearer()
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Disable response buffering in nginx so events are flushed immediately
+    "X-Accel-Buffering": "no"
+}
+
 
 async def get_user_from_token(token: str, db: Session) -> Optional[User]:
     """Extract user from JWT token for WebSocket authentication"""
@@ -30,35 +54,71 @@ async def get_user_from_token(token: str, db: Session) -> Optional[User]:
         return None
 
 
+async def authenticate_token(token: str) -> Optional[User]:
+    """
+    Authenticate a long-lived connection with a short-lived DB session.
+    A request-scoped session would pin a pooled DB connection for as long
+    as the socket or stream stays open.
+    """
+    db = SessionLocal()
+    try:
+        return await get_user_from_token(token, db)
+    finally:
+        db.close()
+
+
 @router.websocket("/notifications/{token}")
-async def websocket_notifications(websocket: WebSocket, token: str, db: Session = Depends(get_db)):
+async def websocket_notifications(websocket: WebSocket, token: str):
     """
     WebSocket endpoint for real-time notifications
     URL: /ws/notifications/{jwt_token}
     """
     
     # Authenticate user
-    user = await get_user_from_token(token, db)
+    user = await authenticate_token(token)
     if not user:
         await websocket.close(code=4001, reason="Invalid authentication token")
         return
     
-    # Connect user
-    await manager.connect(websocket, user.id)
+    # Connect user (refused while the server drains for a restart)
+    if await manager.connect(websocket, user.id) is None:
+        return
     
     try:
         while True:
             # Listen for client messages (heartbeat, preferences, etc.)
-            data = await websocket.receive_text()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            manager.touch(websocket)
+            
+            # Drop floods before spending any time decoding them
+            if not manager.allow_inbound(websocket):
+                violations = manager.inbound_violations(websocket)
+                if violations >= settings.WS_INBOUND_MAX_VIOLATIONS:
+                    await websocket.close(code=1008, reason="Rate limit exceeded")
+                    manager.disconnect(websocket)
+                    return
+                if violations == 1:
+                    await manager.send_personal_message({
+                        "type": "error",
+                        "message": "Rate limit exceeded, messages are being dropped"
+                    }, websocket)
+                continue
             
+            data = frame.get("text") if frame.get("text") is not None else frame.get("bytes")
             try:
-                message = json.loads(data)
-                await handle_client_message(websocket, user.id, message, db)
-            except json.JSONDecodeError:
+                message = manager.decode_message(websocket, data)
+                if not isinstance(message, dict):
+                    raise ValueError("Message must be an object")
+            except (ValueError, TypeError):
                 await manager.send_personal_message({
                     "type": "error",
-                    "message": "Invalid JSON format"
+                    "message": "Invalid message format"
                 }, websocket)
+                continue
+            
+            await handle_client_message(websocket, user.id, message)
                 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -67,7 +127,7 @@ async def websocket_notifications(websocket: WebSocket, token: str, db: Session
         manager.disconnect(websocket)
 
 
-async def handle_client_message(websocket: WebSocket, user_id: int, message: dict, db: Session):
+async def handle_client_message(websocket: WebSocket, user_id: int, message: dict):
     """Handle messages sent from client to server"""
     
     message_type = message.get("type")
@@ -79,6 +139,10 @@ async def handle_client_message(websocket: WebSocket, user_id: int, message: dic
             "timestamp": message.get("timestamp")
         }, websocket)
     
+    elif message_type == "pong":
+        # Reply to a server ping; liveness was already recorded on receive
+        manager.record_pong(websocket)
+    
     elif message_type == "mark_notification_read":
         # Mark specific notification as read
         notification_id = message.get("notification_id")
@@ -89,22 +153,163 @@ async def handle_client_message(websocket: WebSocket, user_id: int, message: dic
         }, websocket)
     
     elif message_type == "get_online_users":
-        # Send list of online users (for chat features later)
-        online_users = manager.get_connected_users()
+        # Answer only for the users the client asks about (e.g. chat partners)
+        user_ids = parse_presence_query(message.get("user_ids"))
+        if user_ids is None:
+            await manager.send_personal_message({
+                "type": "error",
+                "message": f"user_ids must be a list of at most {settings.PRESENCE_QUERY_LIMIT} user ids"
+            }, websocket)
+            return
+        
+        online_users = await presence_service.online_among(user_ids)
         await manager.send_personal_message({
             "type": "online_users",
-            "users": online_users
+            "users": [user_id for user_id in user_ids if user_id in online_users]
         }, websocket)
     
     elif message_type == "typing_indicator":
-        # Handle typing indicators for chat (future feature)
-        target_user_id = message.get("target_user_id")
-        if target_user_id:
-            await manager.send_to_user({
-                "type": "user_typing",
-                "user_id": user_id,
-                "typing": message.get("typing", False)
-            }, target_user_id)
+        # Coalesced per sender/target pair and expired automatically by the relay
+        try:
+            target_user_id = int(message.get("target_user_id"))
+        except (ValueError, TypeError):
+            return
+        if target_user_id != user_id:
+            typing_relay.update(user_id, target_user_id, bool(message.get("typing", False)))
+
+
+def format_sse_event(payload: str, event_id: Optional[int] = None) -> str:
+    """Format a JSON payload as a Server-Sent Event frame"""
+    if event_id is None:
+        return f"data: {payload}\n\n"
+    return f"id: {event_id}\ndata: {payload}\n\n"
+
+
+async def stream_notifications(user_id: int, last_event_id: Optional[int]) -> AsyncIterator[str]:
+    """Yield SSE frames for a user until the client goes away"""
+    # Register inside the generator so cleanup always runs with the stream
+    connection = manager.open_stream(user_id)
+    try:
+        yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+        
+        replayed_up_to = 0
+        if last_event_id is not None:
+            # Resume: resend what was missed while the client was away
+            for event_id, payload in manager.replay_events(user_id, last_event_id):
+                if connection not in manager.connections:
+                    # Dropped while replaying (live queue overflowed, or draining)
+                    break
+                yield format_sse_event(payload, event_id)
+                replayed_up_to = event_id
+        else:
+            yield format_sse_event(json.dumps({
+                "type": "connection_established",
+                "message": "Connected to ReWear notifications",
+                "timestamp": asyncio.get_event_loop().time()
+            }))
+        
+        while connection in manager.connections and not manager.draining:
+            frame = await connection.queue.get()
+            if frame is None:
+                # Shared ticker wake-up: a comment line keeps proxies from timing out
+                yield ": keep-alive\n\n"
+                continue
+            
+            if connection not in manager.connections:
+                # Dropped for falling behind: end now rather than send the
+                # backlog; the client reconnects and resumes via Last-Event-ID
+                break
+            
+            event_id, payload = frame
+            if event_id is not None and event_id <= replayed_up_to:
+                continue
+            yield format_sse_event(payload, event_id)
+        
+        if manager.draining:
+            # Jittered retry so clients don't all reconnect at the same moment
+            hint = manager.reconnect_hint()
+            yield f"retry: {hint['retry_after_ms']}\n\n"
+            yield format_sse_event(json.dumps(hint))
+    finally:
+        manager.close_stream(connection)
+
+
+@router.get("/notifications/stream")
+async def sse_notifications(
+    credentials: HTTPAuthorizationCredentials = Depends(stream_security),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-Sent Events stream of notifications (receive-only alternative to the WebSocket)
+    Auth: Authorization: Bearer <jwt_token>
+    Resume: Last-Event-ID header replays recent events the client missed
+    """
+    if manager.draining:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server restarting",
+            headers={"Retry-After": str(max(1, settings.WS_RECONNECT_MAX_MS // 1000))},
+        )
+    
+    user = await authenticate_token(credentials.credentials)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    resume_from = None
+    if last_event_id:
+        try:
+            resume_from = int(last_event_id)
+        except ValueError:
+            resume_from = None
+    
+    return StreamingResponse(
+        stream_notifications(user.id, resume_from),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+def parse_presence_query(user_ids) -> Optional[List[int]]:
+    """Validate a presence query: a bounded list of integer user ids"""
+    if not isinstance(user_ids, list) or len(user_ids) > settings.PRESENCE_QUERY_LIMIT:
+        return None
+    try:
+        return list(dict.fromkeys(int(user_id) for user_id in user_ids))
+    except (ValueError, TypeError):
+        return None
+
+
+@router.get("/presence")
+async def get_presence(
+    user_ids: str = Query(..., description="Comma-separated user ids"),
+    current_user: User = Depends(get_current_user)
+):
+    """Which of the given users are online on any worker"""
+    parsed = parse_presence_query([user_id.strip() for user_id in user_ids.split(",") if user_id.strip()])
+    if parsed is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Provide at most {settings.PRESENCE_QUERY_LIMIT} numeric user ids"
+        )
+    
+    online_users = await presence_service.online_among(parsed)
+    return {
+        "online": [user_id for user_id in parsed if user_id in online_users]
+    }
+
+
+@router.get("/encodings")
+async def get_supported_encodings():
+    """Subprotocols accepted by the notification socket and the compact key map"""
+    return {
+        "subprotocols": list(CODECS.keys()),
+        "default": SUBPROTOCOL_JSON,
+        "compact_keys": COMPACT_KEYS
+    }
 
 
 @router.get("/test-notifications")
@@ -193,7 +398,14 @@ async def test_notification_page():
                 ws.onmessage = function(event) {
                     try {
                         const data = JSON.parse(event.data);
-                        addMessage(data, 'info');
+                        // Batched notifications arrive as an array frame
+                        const frames = Array.isArray(data) ? data : [data];
+                        frames.forEach(function(frame) {
+                            if (frame.type === 'ping') {
+                                ws.send(JSON.stringify({type: 'pong', timestamp: frame.timestamp}));
+                            }
+                            addMessage(frame, 'info');
+                        });
                     } catch (e) {
                         addMessage({raw: event.data}, 'error');
                     }
@@ -230,8 +442,10 @@ async def test_notification_page():
 
             function getOnlineUsers() {
                 if (ws && isConnected) {
+                    const ids = prompt('User ids (comma-separated)', '1,2,3') || '';
                     ws.send(JSON.stringify({
-                        type: 'get_online_users'
+                        type: 'get_online_users',
+                        user_ids: ids.split(',').map(Number).filter(Boolean)
                     }));
                 } else {
                     alert('Not connected');
@@ -272,18 +486,49 @@ async def send_test_notification(
     }
 
 
+@router.post("/admin/broadcast-test-notification")
+async def broadcast_test_notification(message: str):
+    """Send a system announcement to every connected user (admin only, used by benchmarks.ws_load)"""
+    if not settings.DEBUG:
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    started = time.perf_counter()
+    await notification_service.notify_system_announcement(message)
+    
+    return {
+        "message": "Announcement broadcast",
+        "active_connections": len(manager.connections),
+        "fanout_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+
 @router.get("/admin/websocket-stats")
 async def get_websocket_stats():
     """Get WebSocket connection statistics (admin only)"""
     if not settings.DEBUG:
         raise HTTPException(status_code=404, detail="Not found")
     
+    stats = manager.get_stats()
+    
     return {
-        "total_connections": len(manager.user_sessions),
-        "unique_users": len(manager.active_connections),
+        "total_connections": stats["active_connections"],
+        "unique_users": stats["unique_users"],
+        "sse_streams": stats["sse_streams"],
+        "reaper": stats["reaper"],
+        "batching": stats["batching"],
+        "presence": presence_service.get_stats(),
+        "typing_relay": typing_relay.get_stats(),
+        "events": event_bus.get_stats(),
+        "outbox": outbox_relay.get_stats(),
+        "user_contacts": user_contacts.get_stats(),
+        "smtp_pool": email_service.smtp_pool.get_stats(),
+        "email_queue": {**email_queue.get_stats(), **await email_queue.depths()},
+        "email_digest": {**email_digest.get_stats(), "open_windows": await email_digest.pending()},
+        "announcements": announcement_mailer.get_stats(),
+        "latency": metrics.summary("notification_latency_seconds"),
         "connected_users": manager.get_connected_users(),
         "connections_per_user": {
             user_id: len(connections) 
-            for user_id, connections in manager.active_connections.items()
+            for user_id, connections in manager.user_connections.items()
         }
     }
\ No newline at end of file
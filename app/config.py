@@ -18,8 +18,19 @@ class Settings(BaseSettings):
     
     # File Upload
     UPLOAD_DIR: str = "uploads"
+    UPLOAD_INCOMING_DIR: str = "uploads-incoming"  # Uploads being validated and processed (same filesystem as UPLOAD_DIR)
     MAX_FILE_SIZE: int = 5242880  # 5MB
+    MAX_UPLOAD_REQUEST_SIZE: int = 27262976  # 26MB: five MAX_FILE_SIZE images plus form overhead
+    RESUMABLE_UPLOAD_MAX_SIZE: int = 26214400  # 25MB: resumable uploads are meant for large camera photos
+    RESUMABLE_UPLOAD_EXPIRY_SECONDS: int = 86400  # Resumable uploads not written to for this long are deleted
     ALLOWED_EXTENSIONS: list = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
+    IMAGE_PROCESS_WORKERS: int = 0  # Image processing processes (0 = one per CPU core)
+    IMAGE_QUEUE_DEPTH: int = 32  # Images processing or waiting before uploads get 503
+    IMAGE_VARIANT_WIDTHS: list = [160, 480, 1080]  # Responsive variants generated per upload, pixels wide
+    IMAGE_RESIZE_WIDTHS: list = [160, 320, 480, 640, 800, 1080, 1440, 2048]  # Widths the resize proxy renders (?w= rounds up)
+    IMAGE_CACHE_DIR: str = "cache/images"  # Resize proxy's disk cache
+    IMAGE_CACHE_MAX_BYTES: int = 536870912  # 512MB, least recently used copies are evicted beyond this
+    IMAGE_ACCEL_REDIRECT_PREFIX: Optional[str] = None  # e.g. "/_image_cache": let nginx sendfile cached copies (X-Accel-Redirect)
     
     # Email
     SMTP_SERVER: Optional[str] = None
@@ -27,8 +38,48 @@ class Settings(BaseSettings):
     EMAIL_USERNAME: Optional[str] = None
     EMAIL_PASSWORD: Optional[str] = None
     EMAIL_FROM: Optional[str] = None
+    SMTP_USE_TLS: bool = True  # STARTTLS after connecting
+    SMTP_TIMEOUT: float = 30.0  # Socket timeout per SMTP command, seconds
+    SMTP_POOL_SIZE: int = 3  # Max open SMTP sessions (also the email worker threads)
+    SMTP_POOL_IDLE_TIMEOUT: float = 60.0  # Close sessions idle longer than this, seconds
+    SMTP_POOL_HEALTHCHECK_AFTER: float = 10.0  # NOOP sessions idle longer than this before reuse
+    SMTP_POOL_MAX_MESSAGES: int = 100  # Reconnect after this many messages on one session
 
     FRONTEND_URL: Optional[str] = None
+
+    # Email queue (Redis stream; sends directly when Redis is unavailable)
+    EMAIL_QUEUE_ENABLED: bool = True
+    EMAIL_QUEUE_WORKERS: int = 3  # Concurrent sender tasks per app worker
+    EMAIL_MAX_ATTEMPTS: int = 8  # Then the email is dead-lettered
+    EMAIL_RETRY_BASE_SECONDS: float = 30.0  # Retry backoff: base * 2^(attempt - 1)
+    EMAIL_RETRY_MAX_SECONDS: float = 3600.0  # Cap on a single retry delay
+    EMAIL_DOMAIN_RATE_PER_MINUTE: int = 300  # Sends per recipient domain per minute, all workers (0 = unlimited)
+    EMAIL_DOMAIN_RATE_OVERRIDES: dict = {}  # Per-domain limits replacing the above, e.g. {"gmail.com": 1200}
+    EMAIL_QUEUE_CLAIM_IDLE_SECONDS: int = 300  # Unacknowledged jobs are re-claimed after this (crash recovery)
+    EMAIL_DEAD_LETTER_MAXLEN: int = 10000  # Dead-lettered jobs kept (approximate)
+
+    # Email digests (Redis; without it every email is sent immediately)
+    EMAIL_DIGEST_ENABLED: bool = True
+    EMAIL_DIGEST_WINDOW_SECONDS: int = 3600  # First event opens the window, one summary is sent when it closes
+    EMAIL_DIGEST_EVENT_TYPES: list = ["swap_request"]  # Other types (acceptance, completion, welcome) send immediately
+    EMAIL_DIGEST_FLUSH_INTERVAL: float = 30.0  # Seconds between checks for closed windows
+    EMAIL_DIGEST_MAX_ITEMS: int = 20  # Entries listed in one digest, the rest are counted
+
+    # Bulk announcement emails
+    ANNOUNCEMENT_BATCH_SIZE: int = 500  # Users fetched and checkpointed per batch
+    ANNOUNCEMENT_SMTP_CONNECTIONS: int = 2  # Separate from SMTP_POOL_SIZE so transactional email keeps flowing
+    ANNOUNCEMENT_RCPTS_PER_MESSAGE: int = 50  # Envelope recipients per message when not personalized
+    ANNOUNCEMENT_SEND_RATE: float = 100.0  # Recipients per second (0 = unthrottled)
+    ANNOUNCEMENT_LEASE_SECONDS: int = 300  # Another worker resumes a run whose lease wasn't renewed
+    ANNOUNCEMENT_POLL_INTERVAL: float = 30.0  # Seconds between checks for new or abandoned announcements
+
+    # Orphaned upload garbage collection
+    UPLOAD_GC_ENABLED: bool = True
+    UPLOAD_GC_DRY_RUN: bool = False  # Only log what would be deleted
+    UPLOAD_GC_INTERVAL_SECONDS: int = 21600  # One sweep per interval across all workers
+    UPLOAD_GC_GRACE_SECONDS: int = 604800  # Unreferenced images younger than this are kept (7 days)
+    UPLOAD_GC_BATCH_SIZE: int = 200  # Images deleted between pauses
+    UPLOAD_GC_BATCH_PAUSE: float = 1.0  # Seconds to pause between delete batches
     
     # Environment
     ENVIRONMENT: str = "development"
@@ -45,6 +96,59 @@ class Settings(BaseSettings):
     DEFAULT_ITEM_POINTS: int = 10
     SIGNUP_BONUS_POINTS: int = 50
     
+    # WebSockets
+    WS_HEARTBEAT_INTERVAL: int = 30  # Ping a socket after this many idle seconds
+    WS_IDLE_TIMEOUT: int = 90  # Evict a socket after this many idle seconds
+    WS_SWEEP_TICK: float = 1.0  # Seconds per idle-reaper timer wheel slot
+    NOTIFICATION_BATCH_WINDOW_MS: int = 25  # Coalesce per-user notifications (0 = send immediately)
+    WS_INBOUND_RATE: float = 10.0  # Client messages per second allowed per socket
+    WS_INBOUND_BURST: int = 20  # Short bursts allowed above the steady rate
+    WS_INBOUND_MAX_VIOLATIONS: int = 100  # Consecutive rejected messages before the socket is closed
+    TYPING_RELAY_INTERVAL: float = 0.5  # At most one typing frame per sender/target pair per interval
+    TYPING_INDICATOR_TTL: float = 5.0  # Typing state expires without a refresh from the sender
+    WS_DRAIN_TIMEOUT: float = 5.0  # Deadline for closing all sockets on shutdown
+    WS_RECONNECT_MIN_MS: int = 500  # Reconnect hint sent on drain: clients wait a random
+    WS_RECONNECT_MAX_MS: int = 10000  # delay in this range so they don't all return at once
+    
+    # permessage-deflate (zlib state costs memory per socket, so keep windows small)
+    WS_PER_MESSAGE_DEFLATE: bool = True
+    WS_DEFLATE_SERVER_NO_CONTEXT_TAKEOVER: bool = False  # Reuse context: repeated keys compress well
+    WS_DEFLATE_CLIENT_NO_CONTEXT_TAKEOVER: bool = True  # Inbound frames are tiny, skip the decoder window
+    WS_DEFLATE_MAX_WINDOW_BITS: int = 12  # 4KB window instead of 32KB
+    WS_DEFLATE_MEM_LEVEL: int = 5  # zlib memLevel (1-9)
+    
+    # Presence (Redis-backed, shared by all workers)
+    PRESENCE_TTL: int = 60  # Seconds a worker's presence claim lives without refresh
+    PRESENCE_REFRESH_INTERVAL: int = 20  # Seconds between claim refreshes for local users
+    PRESENCE_FLUSH_INTERVAL: float = 0.5  # Seconds between batched online/offline writes
+    PRESENCE_QUERY_LIMIT: int = 100  # Max user ids per presence query
+    
+    # Server-Sent Events
+    SSE_KEEPALIVE_INTERVAL: int = 15  # Seconds between keep-alive comments
+    SSE_RETRY_MS: int = 5000  # Client reconnect delay advertised in the stream
+    SSE_QUEUE_SIZE: int = 100  # Max undelivered events before a stream is dropped
+    NOTIFICATION_REPLAY_BUFFER: int = 20  # Recent events kept per user for Last-Event-ID
+    NOTIFICATION_REPLAY_USERS: int = 10000  # Users with a replay buffer (LRU)
+    
+    # Notification user lookups
+    USER_CONTACT_CACHE_TTL: float = 30.0  # Seconds a cached email/name stays valid
+    USER_CONTACT_CACHE_SIZE: int = 10000  # Max cached users (LRU)
+    
+    # Domain events
+    EVENT_BUS_WORKERS: int = 8  # Concurrent event handlers (bounds notification/email work)
+    EVENT_BUS_QUEUE_SIZE: int = 10000  # Events waiting for a worker before new ones are dropped
+    
+    # Transactional outbox
+    OUTBOX_BATCH_SIZE: int = 100  # Rows claimed per relay round
+    OUTBOX_POLL_INTERVAL: float = 1.0  # Seconds between polls when nothing wakes the relay
+    OUTBOX_LEASE_SECONDS: int = 60  # Claimed rows become claimable again after this (crash recovery)
+    OUTBOX_MAX_ATTEMPTS: int = 10  # Then the row is marked failed and kept for inspection
+    OUTBOX_RETRY_BASE_SECONDS: float = 2.0  # Retry backoff: base * 2^(attempt - 1)
+    OUTBOX_RETENTION_HOURS: int = 24  # Dispatched rows are purged after this
+    
+    # Metrics
+    METRICS_ENABLED: bool = True  # Expose Prometheus text metrics at /metrics
+    
     @validator('MAX_FILE_SIZE', pre=True)
     def parse_max_file_size(cls, v):
         """Remove comments from MAX_FILE_SIZE"""
@@ -0,0 +1,60 @@
+# app/core/body_limit.py - Reject oversized request bodies while they stream in
+from typing import Iterable
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+
+class BodySizeLimitMiddleware:
+    """
+    Caps request bodies under the given path prefixes at max_body_size.
+
+    Image upload routes check each file part as it streams (see
+    receive_image_form); this caps the request as a whole, including routes
+    whose form Starlette spools. A declared Content-Length over the limit
+    is refused before reading anything; a body without one (chunked) is
+    counted as it arrives and parsing aborts as soon as it goes over.
+    """
+
+    def __init__(self, app, max_body_size: int, path_prefixes: Iterable[str]):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_prefixes = tuple(path_prefixes)
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Request body too large. Maximum size: {self.max_body_size // (1024*1024)}MB"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > self.max_body_size:
+                    error = self._too_large()
+                    response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Raised inside body parsing; FastAPI passes HTTPExceptions through
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
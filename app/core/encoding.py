@@ -0,0 +1,131 @@
+# app/core/encoding.py - Wire encodings for notification sockets
+"""
+Clients pick an encoding through the WebSocket subprotocol header:
+
+    rewear.json.v1      plain JSON text frames (default, same as no subprotocol)
+    rewear.compact.v1   JSON text frames with short schema keys (see COMPACT_KEYS)
+    rewear.msgpack.v1   MessagePack binary frames with short schema keys
+
+Clients list them in preference order; the first one the server supports wins.
+"""
+import json
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+SUBPROTOCOL_JSON = "rewear.json.v1"
+SUBPROTOCOL_COMPACT = "rewear.compact.v1"
+SUBPROTOCOL_MSGPACK = "rewear.msgpack.v1"
+
+# Long notification keys -> short wire keys (applied at every nesting level)
+COMPACT_KEYS = {
+    "type": "t",
+    "title": "h",
+    "message": "m",
+    "data": "d",
+    "timestamp": "ts",
+    "action_required": "a",
+    "swap_id": "s",
+    "item_id": "i",
+    "requester_id": "r",
+    "owner_id": "o",
+    "swap_type": "st",
+    "status": "x",
+    "points": "p",
+    "points_earned": "pe",
+    "reason": "rs",
+    "reasons": "rr",
+    "user_id": "u",
+    "user_ids": "us",
+    "users": "ul",
+    "typing": "ty",
+    "target_user_id": "tu",
+    "notification_id": "n",
+    "signup_bonus": "sb",
+    "next_steps": "ns",
+}
+EXPANDED_KEYS = {short: long for long, short in COMPACT_KEYS.items()}
+
+
+def _rename_keys(value: Any, mapping: Dict[str, str]) -> Any:
+    """Recursively rename dict keys found in mapping"""
+    if isinstance(value, dict):
+        return {mapping.get(key, key): _rename_keys(item, mapping) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rename_keys(item, mapping) for item in value]
+    return value
+
+
+def compact(message: Any) -> Any:
+    """Shorten known keys for the wire"""
+    return _rename_keys(message, COMPACT_KEYS)
+
+
+def expand(message: Any) -> Any:
+    """Restore full keys from the wire form"""
+    return _rename_keys(message, EXPANDED_KEYS)
+
+
+class MessageCodec:
+    """Encodes outbound and decodes inbound frames for one subprotocol"""
+
+    def __init__(self, subprotocol: str, binary: bool = False):
+        self.subprotocol = subprotocol
+        self.binary = binary
+
+    def encode(self, message: Any) -> Union[str, bytes]:
+        return json.dumps(message)
+
+    def decode(self, frame: Union[str, bytes]) -> Any:
+        return json.loads(frame)
+
+    def __repr__(self):
+        return f"<MessageCodec({self.subprotocol})>"
+
+
+class CompactJSONCodec(MessageCodec):
+    """JSON with short keys and no whitespace"""
+
+    def encode(self, message: Any) -> str:
+        return json.dumps(compact(message), separators=(",", ":"))
+
+    def decode(self, frame: Union[str, bytes]) -> Any:
+        return expand(json.loads(frame))
+
+
+class MsgpackCodec(MessageCodec):
+    """MessagePack with short keys (binary frames)"""
+
+    def encode(self, message: Any) -> bytes:
+        return msgpack.packb(compact(message), use_bin_type=True)
+
+    def decode(self, frame: Union[str, bytes]) -> Any:
+        if isinstance(frame, str):
+            # Text frames are still accepted as compact JSON
+            return expand(json.loads(frame))
+        return expand(msgpack.unpackb(frame, raw=False))
+
+
+JSON_CODEC = MessageCodec(SUBPROTOCOL_JSON)
+COMPACT_CODEC = CompactJSONCodec(SUBPROTOCOL_COMPACT)
+MSGPACK_CODEC = MsgpackCodec(SUBPROTOCOL_MSGPACK, binary=True)
+
+CODECS = {
+    SUBPROTOCOL_JSON: JSON_CODEC,
+    SUBPROTOCOL_COMPACT: COMPACT_CODEC,
+}
+if msgpack is not None:
+    CODECS[SUBPROTOCOL_MSGPACK] = MSGPACK_CODEC
+
+
+def negotiate_codec(requested: Optional[List[str]]) -> MessageCodec:
+    """Pick the first supported subprotocol from the client's list (JSON if none)"""
+    for subprotocol in requested or []:
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec
+    return JSON_CODEC
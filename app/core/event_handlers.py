@@ -0,0 +1,81 @@
+# app/core/event_handlers.py - Subscribers for domain events
+from app.core.events import (
+    EventBus, ItemApproved, PointsAwarded, SwapCompleted, SwapCreated, SwapResponded, UserRegistered
+)
+from app.core.websockets import notification_service
+
+
+async def on_user_registered(event: UserRegistered):
+    await notification_service.send_welcome_notification(event.user_id)
+
+
+async def on_item_approved(event: ItemApproved):
+    await notification_service.notify_item_approved(
+        user_id=event.user_id,
+        item_data={
+            "item_id": event.item_id,
+            "title": event.title
+        }
+    )
+
+
+async def on_points_awarded(event: PointsAwarded):
+    await notification_service.notify_points_earned(
+        user_id=event.user_id,
+        points=event.points,
+        reason=event.reason
+    )
+
+
+async def on_swap_created(event: SwapCreated):
+    await notification_service.notify_swap_request(
+        requester_id=event.requester_id,
+        owner_id=event.owner_id,
+        swap_data={
+            "swap_id": event.swap_id,
+            "item_id": event.item_id,
+            "item_title": event.item_title,
+            "swap_type": event.swap_type,
+            "points_offered": event.points_offered,
+            "requester_username": event.requester_username
+        }
+    )
+
+
+async def on_swap_responded(event: SwapResponded):
+    swap_data = {
+        "swap_id": event.swap_id,
+        "item_id": event.item_id,
+        "item_title": event.item_title
+    }
+    if event.owner_response is not None:
+        swap_data["owner_response"] = event.owner_response
+
+    await notification_service.notify_swap_response(
+        requester_id=event.requester_id,
+        owner_id=event.owner_id,
+        swap_data=swap_data,
+        accepted=event.accepted
+    )
+
+
+async def on_swap_completed(event: SwapCompleted):
+    await notification_service.notify_swap_completed(
+        user_ids=event.user_ids,
+        swap_data={
+            "swap_id": event.swap_id,
+            "item_id": event.item_id,
+            "item_title": event.item_title,
+            "points_earned": event.points_earned
+        }
+    )
+
+
+def register_handlers(bus: EventBus):
+    """Wire notification subscribers"""
+    bus.subscribe(UserRegistered, on_user_registered)
+    bus.subscribe(ItemApproved, on_item_approved)
+    bus.subscribe(PointsAwarded, on_points_awarded)
+    bus.subscribe(SwapCreated, on_swap_created)
+    bus.subscribe(SwapResponded, on_swap_responded)
+    bus.subscribe(SwapCompleted, on_swap_completed)
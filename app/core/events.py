@@ -0,0 +1,186 @@
+# app/core/events.py - In-process domain event bus
+"""
+Routes record domain events in the transactional outbox
+(app/services/outbox.py), whose relay hands them to event_bus.dispatch.
+Fire-and-forget events that don't need durability can be published directly:
+
+    event_bus.publish(SwapCreated(swap_id=swap.id, ...))
+
+Subscribers (WebSocket/email notifications, and any future search-index or
+cache updates) run on a fixed pool of worker tasks, so a burst of events
+can't spawn unbounded concurrent work. Handlers are registered with
+event_bus.subscribe(EventType, handler); see app/core/event_handlers.py.
+"""
+import asyncio
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Type
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DomainEvent:
+    """Base class; occurred_at is wall-clock time of publication"""
+    occurred_at: float = field(default_factory=time.time, kw_only=True)
+
+
+@dataclass(frozen=True)
+class UserRegistered(DomainEvent):
+    user_id: int
+
+
+@dataclass(frozen=True)
+class ItemApproved(DomainEvent):
+    user_id: int
+    item_id: int
+    title: str
+
+
+@dataclass(frozen=True)
+class PointsAwarded(DomainEvent):
+    user_id: int
+    points: int
+    reason: str
+
+
+@dataclass(frozen=True)
+class SwapCreated(DomainEvent):
+    swap_id: int
+    requester_id: int
+    owner_id: int
+    item_id: int
+    item_title: str
+    swap_type: str
+    points_offered: Optional[int] = None
+    requester_username: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class SwapResponded(DomainEvent):
+    """Accepted, rejected or cancelled (cancellation counts as not accepted)"""
+    swap_id: int
+    requester_id: int
+    owner_id: int
+    item_id: int
+    item_title: str
+    accepted: bool
+    owner_response: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class SwapCompleted(DomainEvent):
+    swap_id: int
+    user_ids: List[int]
+    item_id: int
+    item_title: str
+    points_earned: int = 0
+
+
+# Event classes by name, for rebuilding events stored in the outbox
+EVENT_TYPES: Dict[str, Type[DomainEvent]] = {
+    cls.__name__: cls
+    for cls in (UserRegistered, ItemApproved, PointsAwarded, SwapCreated, SwapResponded, SwapCompleted)
+}
+
+
+def event_to_payload(event: DomainEvent) -> dict:
+    return asdict(event)
+
+
+def event_from_payload(event_type: str, payload: dict) -> DomainEvent:
+    return EVENT_TYPES[event_type](**payload)
+
+
+Handler = Callable[[DomainEvent], Awaitable[None]]
+
+
+class EventBus:
+    """Bounded queue of events drained by a fixed number of worker tasks"""
+
+    def __init__(self, workers: Optional[int] = None, queue_size: Optional[int] = None):
+        self.worker_count = workers or settings.EVENT_BUS_WORKERS
+        self.queue_size = queue_size or settings.EVENT_BUS_QUEUE_SIZE
+        self.handlers: Dict[Type[DomainEvent], List[Handler]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.metrics = {
+            "published": 0,
+            "dropped": 0,
+            "handled": 0,
+            "handler_errors": 0
+        }
+
+    def subscribe(self, event_type: Type[DomainEvent], handler: Handler):
+        self.handlers.setdefault(event_type, []).append(handler)
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self, timeout: float = 5.0):
+        """Let queued events finish (up to timeout), then stop the workers"""
+        if self._queue is not None and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Event bus stopped with {self._queue.qsize()} events unhandled")
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+    def publish(self, event: DomainEvent):
+        """Queue an event for the subscribers; never blocks the caller"""
+        if not self._workers:
+            self.start()
+        try:
+            self._queue.put_nowait(event)
+            self.metrics["published"] += 1
+        except asyncio.QueueFull:
+            self.metrics["dropped"] += 1
+            logger.error(f"Event bus full, dropping {type(event).__name__}")
+
+    async def dispatch(self, event: DomainEvent) -> bool:
+        """
+        Run every handler for an event concurrently. Errors are logged, not
+        raised; returns False if any handler failed (the outbox relay retries).
+        """
+        handlers = self.handlers.get(type(event), [])
+        results = await asyncio.gather(*(handler(event) for handler in handlers), return_exceptions=True)
+        succeeded = True
+        for handler, result in zip(handlers, results):
+            if isinstance(result, Exception):
+                succeeded = False
+                self.metrics["handler_errors"] += 1
+                logger.error(f"{getattr(handler, '__name__', handler)} failed for {type(event).__name__}: {result}")
+        self.metrics["handled"] += 1
+        return succeeded
+
+    async def _worker(self):
+        while True:
+            event = await self._queue.get()
+            try:
+                await self.dispatch(event)
+            finally:
+                self._queue.task_done()
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            **self.metrics
+        }
+
+
+# Global event bus instance
+event_bus = EventBus()
@@ -0,0 +1,134 @@
+# app/core/metrics.py - In-process latency histograms and counters
+"""
+Minimal Prometheus-compatible metrics without an extra dependency.
+
+    metrics.observe("notification_latency_seconds", 0.004, type="swap_request", channel="ws", stage="send")
+    metrics.inc("notification_deliveries_total", type="swap_request", channel="ws", outcome="failed")
+    metrics.render()  # text exposition format, served at /metrics
+
+Values can be recorded from worker threads (email executor), so updates take
+a lock; it's uncontended in practice and far cheaper than the work measured.
+"""
+import bisect
+import threading
+from typing import Dict, Optional, Tuple
+
+# Seconds: sub-millisecond socket writes up to slow SMTP round trips
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+HELP = {
+    "notification_latency_seconds": "Notification delivery latency by event type, channel and stage",
+    "notification_deliveries_total": "Notification deliveries by event type, channel and outcome",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed-bucket histogram (bucket counts are not cumulative until rendered)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+
+    @staticmethod
+    def _key(labels: dict) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not amount:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    @staticmethod
+    def _format_labels(key: LabelKey, extra: str = "") -> str:
+        parts = [f'{name}="{value}"' for name, value in key]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        labels = self._format_labels(key, 'le="%s"' % bound)
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = self._format_labels(key, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{labels} {histogram.count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {histogram.count}")
+
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self._format_labels(key)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name: str) -> dict:
+        """Approximate p50/p95/p99 per label set, for JSON stats endpoints"""
+        with self._lock:
+            series = dict(self.histograms.get(name, {}))
+        return {
+            ",".join(f"{label}={value}" for label, value in key): {
+                "count": histogram.count,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99),
+            }
+            for key, histogram in series.items()
+        }
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
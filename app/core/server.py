@@ -0,0 +1,48 @@
+# app/core/server.py - uvicorn server that drains notification connections first
+from typing import List, Optional
+import logging
+import socket
+
+import uvicorn
+from uvicorn.supervisors import ChangeReload, Multiprocess
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    On SIGTERM/SIGINT uvicorn closes its listeners, shuts down every
+    connection (WebSockets get a bare 1012) and waits for them all to end
+    before the app's shutdown hook runs. A drain started from that hook
+    finds no socket left to send a reconnect hint to, and SSE streams,
+    which never end on their own, hold shutdown until the graceful timeout.
+
+    This server drains first: as soon as the exit signal is handled, sockets
+    get their jittered reconnect hint and close, SSE streams end, and only
+    then does uvicorn shut down what's left.
+    """
+
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        from app.core.websockets import manager
+        try:
+            report = await manager.drain()
+            logger.info(
+                f"Drained {report['websockets']} WebSockets and {report['sse_streams']} SSE streams "
+                f"in {report['duration_ms']:.0f} ms ({report['timed_out']} timed out)"
+            )
+        except Exception as e:
+            logger.error(f"Connection drain failed: {e}")
+        await super().shutdown(sockets=sockets)
+
+
+def serve(config: uvicorn.Config):
+    """uvicorn.run() with DrainingServer (reload and multi-worker included)"""
+    server = DrainingServer(config=config)
+    if config.should_reload:
+        sock = config.bind_socket()
+        ChangeReload(config, target=server.run, sockets=[sock]).run()
+    elif config.workers > 1:
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
@@ -0,0 +1,115 @@
+# app/core/typing_relay.py - Coalesced, self-expiring typing indicators
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+import logging
+
+from app.config import settings
+from app.core.websockets import manager
+
+logger = logging.getLogger(__name__)
+
+
+class TypingRelay:
+    """
+    Relays typing indicators between users without echoing every keystroke.
+
+    Updates for a (sender, target) pair are collected between ticks and at
+    most one frame per pair goes out per interval, and only when the visible
+    state changes. A typing state the sender stops refreshing is cleared
+    after TYPING_INDICATOR_TTL, so a dropped client never leaves a stuck
+    "is typing..." on the other side. The ticker only runs while there is
+    something to relay.
+    """
+
+    def __init__(self, interval: Optional[float] = None, ttl: Optional[float] = None):
+        self.interval = interval if interval is not None else settings.TYPING_RELAY_INTERVAL
+        self.ttl = ttl if ttl is not None else settings.TYPING_INDICATOR_TTL
+        # Latest state reported per pair since the last tick
+        self._pending: Dict[Tuple[int, int], bool] = {}
+        # Pairs currently shown as typing -> expiry (monotonic)
+        self._active: Dict[Tuple[int, int], float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "updates": 0,
+            "frames_sent": 0,
+            "expired": 0
+        }
+        manager.presence_listeners.append(self)
+
+    def update(self, sender_id: int, target_id: int, typing: bool):
+        """Record the sender's typing state; delivered on the next tick"""
+        self._pending[(sender_id, target_id)] = typing
+        self.metrics["updates"] += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self._pending or self._active:
+                await asyncio.sleep(self.interval)
+                await self.tick()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Typing relay stopped: {e}")
+
+    async def tick(self):
+        """Send one frame per pair whose visible typing state changed"""
+        now = time.monotonic()
+        pending, self._pending = self._pending, {}
+
+        # Typing states nobody refreshed are switched off
+        for pair, expires_at in self._active.items():
+            if pair not in pending and expires_at <= now:
+                pending[pair] = False
+                self.metrics["expired"] += 1
+
+        for pair, typing in pending.items():
+            was_typing = pair in self._active
+            if typing:
+                self._active[pair] = now + self.ttl
+                if was_typing:
+                    continue
+            else:
+                if not was_typing:
+                    continue
+                del self._active[pair]
+
+            sender_id, target_id = pair
+            await manager.send_ephemeral({
+                "type": "user_typing",
+                "user_id": sender_id,
+                "typing": typing
+            }, target_id)
+            self.metrics["frames_sent"] += 1
+
+    # Connection manager callbacks: a sender's last disconnect clears their typing state
+    def user_online(self, user_id: int):
+        pass
+
+    def user_offline(self, user_id: int):
+        for pair in self._active:
+            if pair[0] == user_id:
+                self._pending[pair] = False
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "ttl": self.ttl,
+            "active_pairs": len(self._active),
+            **self.metrics
+        }
+
+
+# Global typing relay instance
+typing_relay = TypingRelay()
@@ -79,9 +79,10 @@ def award_points(
     description: str,
     db: Session,
     item_id: Optional[int] = None,
-    swap_id: Optional[int] = None
+    swap_id: Optional[int] = None,
+    commit: bool = True
 ) -> PointTransaction:
-    """Award points to a user and create transaction record"""
+    """Award points to a user and create transaction record (commit=False leaves it to the caller)"""
     
     # Update user points
     user.points_balance += amount
@@ -98,8 +99,9 @@ def award_points(
     )
     
     db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    if commit:
+        db.commit()
+        db.refresh(transaction)
     
     return transaction
 
@@ -111,9 +113,10 @@ def deduct_points(
     description: str,
     db: Session,
     item_id: Optional[int] = None,
-    swap_id: Optional[int] = None
+    swap_id: Optional[int] = None,
+    commit: bool = True
 ) -> Optional[PointTransaction]:
-    """Deduct points from user if they have enough"""
+    """Deduct points from user if they have enough (commit=False leaves it to the caller)"""
     
     if user.points_balance < amount:
         return None  # Insufficient points
@@ -133,8 +136,9 @@ def deduct_points(
     )
     
     db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    if commit:
+        db.commit()
+        db.refresh(transaction)
     
     return transaction
 
@@ -1,32 +1,295 @@
 # app/core/websockets.py - Fixed database connection handling
 import json
+import math
+import itertools
+import random
+import time
 import asyncio
-from typing import Dict, List, Optional
-from fastapi import WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from app.models import User
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket
+from app.config import settings
+from app.core.encoding import JSON_CODEC, MessageCodec, negotiate_codec
+from app.core.metrics import metrics
+from app.services.user_contacts import user_contacts
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class TimerWheel:
+    """Hashed timer wheel: O(1) scheduling, each tick only inspects one slot"""
+    
+    def __init__(self, slots: int, tick: float):
+        self.tick = tick
+        self.slots: List[Set] = [set() for _ in range(max(2, slots))]
+        self.position = 0
+    
+    def schedule(self, entry, delay: float) -> int:
+        """Place entry in the slot due after `delay` seconds, return the slot index"""
+        ticks = max(1, math.ceil(delay / self.tick))
+        # Delays longer than one revolution are capped; the entry is simply re-checked
+        ticks = min(ticks, len(self.slots) - 1)
+        index = (self.position + ticks) % len(self.slots)
+        self.slots[index].add(entry)
+        return index
+    
+    def discard(self, entry, index: int):
+        """Remove entry from the slot it was scheduled in"""
+        self.slots[index].discard(entry)
+    
+    def advance(self) -> Set:
+        """Move to the next slot and return the entries that are now due"""
+        self.position = (self.position + 1) % len(self.slots)
+        due = self.slots[self.position]
+        self.slots[self.position] = set()
+        return due
+
+
+class Connection:
+    """Registry record for one live notification socket.
+    
+    Uses __slots__ so an idle connection costs a single small object plus its
+    set/dict entries, which keeps 100k+ sockets per worker affordable.
+    """
+    
+    __slots__ = (
+        "id", "user_id", "websocket", "codec", "last_seen", "queue", "wheel_slot",
+        "tokens", "tokens_at", "violations", "answers_pings"
+    )
+    
+    def __init__(
+        self,
+        connection_id: int,
+        user_id: int,
+        websocket: Optional[WebSocket],
+        codec: MessageCodec = JSON_CODEC
+    ):
+        self.id = connection_id
+        self.user_id = user_id
+        # None for Server-Sent Event streams
+        self.websocket = websocket
+        # Wire encoding negotiated through the WebSocket subprotocol (shared instance)
+        self.codec = codec
+        # Monotonic timestamp of the last inbound frame
+        self.last_seen = time.monotonic()
+        # Outbound (event_id, payload) frames for pull-based transports (SSE);
+        # WebSockets write directly, so idle sockets don't pay for a queue
+        self.queue: Optional[asyncio.Queue] = None
+        # Timer wheel slot the reaper has this connection scheduled in
+        self.wheel_slot: Optional[int] = None
+        # Inbound token bucket
+        self.tokens = float(settings.WS_INBOUND_BURST)
+        self.tokens_at = self.last_seen
+        self.violations = 0
+        # Set on the first "pong"; only such clients are evicted for going quiet
+        self.answers_pings = False
+    
+    @property
+    def key(self):
+        """Registry key: the socket for WebSockets, the record itself for streams"""
+        return self.websocket if self.websocket is not None else self
+    
+    def __repr__(self):
+        return f"<Connection(id={self.id}, user_id={self.user_id})>"
+
+
+def _merge_points_earned(first: dict, second: dict) -> dict:
+    """Fold two points_earned notifications into one"""
+    first_data = first.get("data") or {}
+    second_data = second.get("data") or {}
+    points = first_data.get("points", 0) + second_data.get("points", 0)
+    reasons = first_data.get("reasons") or [first_data.get("reason")]
+    reasons = [reason for reason in reasons + [second_data.get("reason")] if reason]
+    
+    merged = dict(first)
+    merged["message"] = f"You earned {points} points: {'; '.join(reasons)}"
+    merged["data"] = {"points": points, "reason": "; ".join(reasons), "reasons": reasons}
+    merged["timestamp"] = second.get("timestamp", first.get("timestamp"))
+    return merged
+
+
+# Notification types whose events in the same batch are merged into one
+MESSAGE_MERGERS = {
+    "points_earned": _merge_points_earned
+}
+
+
+def coalesce_messages(messages: List[dict]) -> List[dict]:
+    """Drop duplicate notifications and merge mergeable types, keeping order"""
+    if len(messages) < 2:
+        return messages
+    
+    result: List[dict] = []
+    seen = set()
+    merged_at: Dict[str, int] = {}
+    
+    for message in messages:
+        message_type = message.get("type")
+        merger = MESSAGE_MERGERS.get(message_type)
+        
+        if merger is not None:
+            if message_type in merged_at:
+                index = merged_at[message_type]
+                result[index] = merger(result[index], message)
+            else:
+                merged_at[message_type] = len(result)
+                result.append(message)
+            continue
+        
+        # Same event twice in one window (e.g. a repeated announcement): send once
+        key = (
+            message_type,
+            message.get("message"),
+            json.dumps(message.get("data"), sort_keys=True, default=str)
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(message)
+    
+    return result
+
+
 class ConnectionManager:
     """Manages WebSocket connections for real-time notifications"""
     
     def __init__(self):
-        # Store active connections by user_id
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-        # Store user info for connections
-        self.user_sessions: Dict[WebSocket, int] = {}
+        # Connection records by socket (O(1) lookup on receive/disconnect)
+        self.connections: Dict[WebSocket, Connection] = {}
+        # Per-user membership (O(1) removal, no list scans)
+        self.user_connections: Dict[int, Set[Connection]] = {}
+        # Server-Sent Event streams (subset of connections, skipped by the reaper)
+        self.streams: Set[Connection] = set()
+        self._connection_ids = itertools.count(1)
+        # Notified when a user's first connection opens / last one closes
+        self.presence_listeners: List = []
+        # Set by drain(): new connections are refused while shutting down
+        self.draining = False
+        self.drain_report: Optional[dict] = None
+        
+        # Recent events per user so SSE clients can resume with Last-Event-ID.
+        # Ids are seeded from the clock so they keep increasing across restarts.
+        self._event_ids = itertools.count(time.time_ns() // 1000)
+        self._replay_log: "OrderedDict[int, deque]" = OrderedDict()
+        self._stream_ticker_task: Optional[asyncio.Task] = None
+        
+        # Per-user batching: notifications queued within one window go out as one frame
+        self.batch_window = settings.NOTIFICATION_BATCH_WINDOW_MS / 1000
+        # Queued (message, enqueued_at) per user
+        self._pending: Dict[int, List[Tuple[dict, float]]] = {}
+        self._batch_opened_at = 0.0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.batch_metrics = {
+            "messages_queued": 0,
+            "messages_coalesced": 0,
+            "frames_sent": 0,
+            "flushes": 0,
+            "max_batch_size": 0,
+            "last_batch_wait_ms": 0.0,
+            "last_flush_ms": 0.0
+        }
+        
+        self.heartbeat_interval = settings.WS_HEARTBEAT_INTERVAL
+        self.idle_timeout = settings.WS_IDLE_TIMEOUT
+        self._wheel = TimerWheel(
+            slots=math.ceil(self.idle_timeout / settings.WS_SWEEP_TICK) + 1,
+            tick=settings.WS_SWEEP_TICK
+        )
+        self._reaper_task: Optional[asyncio.Task] = None
+        
+        # Reaper metrics
+        self.metrics = {
+            "pings_sent": 0,
+            "reaped_connections": 0,
+            "rate_limited_messages": 0,
+            "sweeps": 0,
+            "last_sweep_checked": 0,
+            "last_sweep_ms": 0.0
+        }
     
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Accept new WebSocket connection"""
-        await websocket.accept()
+    def register(self, websocket: WebSocket, user_id: int, codec: MessageCodec = JSON_CODEC) -> Connection:
+        """Add an accepted socket to the registry"""
+        connection = Connection(next(self._connection_ids), user_id, websocket, codec)
         
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
+        self.connections[websocket] = connection
+        self._add_to_user(connection)
+        connection.wheel_slot = self._wheel.schedule(connection, self.heartbeat_interval)
         
-        self.active_connections[user_id].append(websocket)
-        self.user_sessions[websocket] = user_id
+        return connection
+    
+    def _add_to_user(self, connection: Connection):
+        """Add to per-user membership, announcing the user's first connection"""
+        user_connections = self.user_connections.get(connection.user_id)
+        if user_connections is None:
+            user_connections = self.user_connections[connection.user_id] = set()
+            for listener in self.presence_listeners:
+                listener.user_online(connection.user_id)
+        user_connections.add(connection)
+    
+    def open_stream(self, user_id: int) -> Connection:
+        """Register a Server-Sent Event stream for a user"""
+        connection = Connection(next(self._connection_ids), user_id, None)
+        connection.queue = asyncio.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+        
+        self.connections[connection] = connection
+        self._add_to_user(connection)
+        self.streams.add(connection)
+        
+        # One shared ticker keeps every idle stream alive
+        if self._stream_ticker_task is None or self._stream_ticker_task.done():
+            self._stream_ticker_task = asyncio.create_task(self._stream_ticker())
+        
+        logger.info(f"User {user_id} connected via SSE")
+        return connection
+    
+    def close_stream(self, connection: Connection):
+        """Remove a Server-Sent Event stream"""
+        self.disconnect(connection)
+    
+    async def _stream_ticker(self):
+        """Wake every idle stream so it can emit a keep-alive comment"""
+        while self.streams:
+            await asyncio.sleep(settings.SSE_KEEPALIVE_INTERVAL)
+            for connection in list(self.streams):
+                if connection.queue.empty():
+                    connection.queue.put_nowait(None)
+    
+    def _record_event(self, user_id: int, payload: str) -> int:
+        """Assign an event id and keep the payload for Last-Event-ID replay"""
+        event_id = next(self._event_ids)
+        
+        log = self._replay_log.get(user_id)
+        if log is None:
+            log = self._replay_log[user_id] = deque(maxlen=settings.NOTIFICATION_REPLAY_BUFFER)
+            if len(self._replay_log) > settings.NOTIFICATION_REPLAY_USERS:
+                self._replay_log.popitem(last=False)
+        else:
+            self._replay_log.move_to_end(user_id)
+        
+        log.append((event_id, payload))
+        return event_id
+    
+    def replay_events(self, user_id: int, last_event_id: int) -> List[tuple]:
+        """Events recorded for a user after `last_event_id`, oldest first"""
+        log = self._replay_log.get(user_id)
+        if not log:
+            return []
+        return [(event_id, payload) for event_id, payload in log if event_id > last_event_id]
+    
+    async def connect(self, websocket: WebSocket, user_id: int) -> Optional[Connection]:
+        """Accept new WebSocket connection (refused with 1013 while draining)"""
+        if self.draining:
+            await websocket.close(code=1013, reason="Server restarting")
+            return None
+        
+        requested = websocket.scope.get("subprotocols") or []
+        codec = negotiate_codec(requested)
+        # Only echo a subprotocol the client actually offered
+        await websocket.accept(subprotocol=codec.subprotocol if codec.subprotocol in requested else None)
+        
+        connection = self.register(websocket, user_id, codec)
         
         logger.info(f"User {user_id} connected via WebSocket")
         
@@ -36,58 +299,396 @@ class ConnectionManager:
             "message": "Connected to ReWear notifications",
             "timestamp": asyncio.get_event_loop().time()
         }, websocket)
+        
+        return connection
     
     def disconnect(self, websocket: WebSocket):
-        """Remove WebSocket connection"""
-        if websocket in self.user_sessions:
-            user_id = self.user_sessions[websocket]
-            
-            if user_id in self.active_connections:
-                self.active_connections[user_id].remove(websocket)
-                
-                # Clean up empty connection lists
-                if not self.active_connections[user_id]:
-                    del self.active_connections[user_id]
+        """Remove WebSocket connection (or SSE stream, keyed by its record)"""
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        
+        user_id = connection.user_id
+        user_connections = self.user_connections.get(user_id)
+        if user_connections is not None:
+            user_connections.discard(connection)
             
-            del self.user_sessions[websocket]
-            logger.info(f"User {user_id} disconnected from WebSocket")
+            # Clean up empty connection sets
+            if not user_connections:
+                del self.user_connections[user_id]
+                for listener in self.presence_listeners:
+                    listener.user_offline(user_id)
+        
+        if connection.wheel_slot is not None:
+            self._wheel.discard(connection, connection.wheel_slot)
+            connection.wheel_slot = None
+        
+        if connection.queue is not None:
+            self.streams.discard(connection)
+            logger.info(f"User {user_id} disconnected from SSE")
+            return
+        
+        logger.info(f"User {user_id} disconnected from WebSocket")
+    
+    def touch(self, websocket: WebSocket):
+        """Record inbound activity on a connection (cheap: no rescheduling)"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+    
+    def record_pong(self, websocket: WebSocket):
+        """Mark a client as answering app-level pings, which makes it evictable when idle"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.answers_pings = True
+    
+    def allow_inbound(self, websocket: WebSocket) -> bool:
+        """Token bucket check for one client message; refills at WS_INBOUND_RATE"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return False
+        
+        now = time.monotonic()
+        connection.tokens = min(
+            float(settings.WS_INBOUND_BURST),
+            connection.tokens + (now - connection.tokens_at) * settings.WS_INBOUND_RATE
+        )
+        connection.tokens_at = now
+        
+        if connection.tokens >= 1:
+            connection.tokens -= 1
+            connection.violations = 0
+            return True
+        
+        connection.violations += 1
+        self.metrics["rate_limited_messages"] += 1
+        return False
+    
+    def inbound_violations(self, websocket: WebSocket) -> int:
+        """Consecutive messages rejected by the rate limiter"""
+        connection = self.connections.get(websocket)
+        return connection.violations if connection is not None else 0
+    
+    def decode_message(self, websocket: WebSocket, frame):
+        """Decode an inbound text/binary frame with the connection's codec"""
+        connection = self.connections.get(websocket)
+        codec = connection.codec if connection is not None else JSON_CODEC
+        return codec.decode(frame)
+    
+    @staticmethod
+    async def _write_frame(websocket: WebSocket, frame):
+        """Write an encoded frame as text or binary"""
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send message to specific WebSocket connection"""
+        connection = self.connections.get(websocket)
+        codec = connection.codec if connection is not None else JSON_CODEC
         try:
-            await websocket.send_text(json.dumps(message))
+            await self._write_frame(websocket, codec.encode(message))
         except Exception as e:
             logger.error(f"Error sending message to WebSocket: {e}")
             self.disconnect(websocket)
     
     async def send_to_user(self, message: dict, user_id: int):
         """Send message to all connections of a specific user"""
-        if user_id in self.active_connections:
-            disconnected_sockets = []
-            
-            for websocket in self.active_connections[user_id]:
-                try:
-                    await websocket.send_text(json.dumps(message))
-                except Exception as e:
-                    logger.error(f"Error sending to user {user_id}: {e}")
-                    disconnected_sockets.append(websocket)
-            
-            # Clean up disconnected sockets
-            for socket in disconnected_sockets:
-                self.disconnect(socket)
+        enqueued_at = time.perf_counter()
+        if self.batch_window <= 0 or self.draining or user_id not in self.user_connections:
+            # Offline users only need the replay log, no point in waiting
+            await self._deliver(user_id, [message], originals=[(message, enqueued_at)])
+            return
+        
+        pending = self._pending.get(user_id)
+        if pending is None:
+            if not self._pending:
+                self._batch_opened_at = enqueued_at
+            pending = self._pending[user_id] = []
+        pending.append((message, enqueued_at))
+        self.batch_metrics["messages_queued"] += 1
+        
+        # One timer per window for all users, not one per message
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.batch_window, self._start_flush
+            )
+    
+    def _start_flush(self):
+        """Timer callback: flush the current batch window in a task"""
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self.flush_pending())
+    
+    async def flush_pending(self):
+        """Send every queued notification, one frame per user"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        
+        started = time.perf_counter()
+        pending, self._pending = self._pending, {}
+        
+        for user_id, entries in pending.items():
+            messages = [message for message, _ in entries]
+            batch = coalesce_messages(messages)
+            self.batch_metrics["messages_coalesced"] += len(messages) - len(batch)
+            self.batch_metrics["max_batch_size"] = max(self.batch_metrics["max_batch_size"], len(batch))
+            # Latency is tracked for every original message, merged or not
+            await self._deliver(user_id, batch, originals=entries)
+        
+        self.batch_metrics["flushes"] += 1
+        self.batch_metrics["last_batch_wait_ms"] = round((started - self._batch_opened_at) * 1000, 3)
+        self.batch_metrics["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    
+    async def send_ephemeral(self, message: dict, user_id: int):
+        """Send a transient message (typing state etc.) now, without replay or batching"""
+        if user_id in self.user_connections:
+            await self._deliver(user_id, [message], record=False)
+    
+    async def _deliver(
+        self,
+        user_id: int,
+        messages: List[dict],
+        record: bool = True,
+        originals: Optional[List[Tuple[dict, float]]] = None
+    ):
+        """
+        Write one frame (an object, or an array for batches) to a user's connections.
+        
+        Latency per original message is recorded in stages: queue (enqueue ->
+        serialize), serialize, send (first write -> last write) and total.
+        """
+        serialize_started = time.perf_counter()
+        if originals is None:
+            originals = [(message, serialize_started) for message in messages]
+        
+        body = messages[0] if len(messages) == 1 else messages
+        # Canonical JSON feeds the replay log and SSE streams
+        payload = json.dumps(body)
+        event_id = self._record_event(user_id, payload) if record else None
+        
+        user_connections = self.user_connections.get(user_id)
+        if not user_connections:
+            for message, _ in originals:
+                metrics.inc("notification_deliveries_total", type=message.get("type"), channel="ws", outcome="offline")
+            return
+        
+        self.batch_metrics["frames_sent"] += 1
+        # Serialize once per codec, not once per connection
+        frames = {JSON_CODEC: payload}
+        targets = list(user_connections)
+        for connection in targets:
+            if connection.queue is None and connection.codec not in frames:
+                frames[connection.codec] = connection.codec.encode(body)
+        send_started = time.perf_counter()
+        
+        delivered = dropped = failed = 0
+        disconnected_sockets = []
+        for connection in targets:
+            try:
+                if connection.queue is not None:
+                    connection.queue.put_nowait((event_id, payload))
+                else:
+                    await self._write_frame(connection.websocket, frames[connection.codec])
+                delivered += 1
+            except asyncio.QueueFull:
+                dropped += 1
+                logger.error(f"Dropping SSE stream for user {user_id}: queue full")
+                disconnected_sockets.append(connection.key)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error sending to user {user_id}: {e}")
+                disconnected_sockets.append(connection.key)
+        send_completed = time.perf_counter()
+        
+        # Clean up disconnected sockets (a full SSE queue means a stalled reader)
+        for socket in disconnected_sockets:
+            self.disconnect(socket)
+        
+        for message, enqueued_at in originals:
+            event_type = message.get("type")
+            metrics.observe("notification_latency_seconds", serialize_started - enqueued_at, type=event_type, channel="ws", stage="queue")
+            metrics.observe("notification_latency_seconds", send_started - serialize_started, type=event_type, channel="ws", stage="serialize")
+            metrics.observe("notification_latency_seconds", send_completed - send_started, type=event_type, channel="ws", stage="send")
+            metrics.observe("notification_latency_seconds", send_completed - enqueued_at, type=event_type, channel="ws", stage="total")
+            metrics.inc("notification_deliveries_total", delivered, type=event_type, channel="ws", outcome="delivered")
+            metrics.inc("notification_deliveries_total", dropped, type=event_type, channel="ws", outcome="dropped")
+            metrics.inc("notification_deliveries_total", failed, type=event_type, channel="ws", outcome="failed")
     
     async def broadcast_to_all(self, message: dict):
         """Send message to all connected users"""
-        for user_id in list(self.active_connections.keys()):
+        for user_id in list(self.user_connections.keys()):
             await self.send_to_user(message, user_id)
     
     def get_connected_users(self) -> List[int]:
         """Get list of currently connected user IDs"""
-        return list(self.active_connections.keys())
+        return list(self.user_connections.keys())
     
     def is_user_online(self, user_id: int) -> bool:
-        """Check if user is currently connected"""
-        return user_id in self.active_connections and len(self.active_connections[user_id]) > 0
+        """Check if user is connected to this worker (see presence_service for all workers)"""
+        return bool(self.user_connections.get(user_id))
+    
+    def start_reaper(self):
+        """Start the idle-connection sweeper (one task for all connections)"""
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reaper_loop())
+    
+    async def stop_reaper(self):
+        """Stop the idle-connection sweeper"""
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+    
+    async def _reaper_loop(self):
+        """Advance the timer wheel once per tick and sweep the due slot"""
+        while True:
+            await asyncio.sleep(self._wheel.tick)
+            try:
+                await self._sweep(self._wheel.advance())
+            except Exception as e:
+                logger.error(f"WebSocket reaper sweep failed: {e}")
+    
+    async def _sweep(self, due: Set[Connection]):
+        """Ping idle sockets, evict dead ones and reschedule the rest"""
+        started = time.perf_counter()
+        now = time.monotonic()
+        pings = []
+        evictions = []
+        
+        for connection in due:
+            if connection.wheel_slot is None:
+                # Disconnected since it was scheduled
+                continue
+            
+            idle = now - connection.last_seen
+            if idle >= self.idle_timeout and connection.answers_pings:
+                connection.wheel_slot = None
+                evictions.append(connection)
+            elif idle >= self.heartbeat_interval:
+                pings.append(connection)
+                if connection.answers_pings:
+                    # Ping once, then re-check when the idle timeout would expire
+                    delay = self.idle_timeout - idle
+                else:
+                    # Receive-only clients never reply: keep pinging and let a
+                    # failed send (or uvicorn's protocol pings) drop dead ones
+                    delay = self.heartbeat_interval
+                connection.wheel_slot = self._wheel.schedule(connection, delay)
+            else:
+                connection.wheel_slot = self._wheel.schedule(connection, self.heartbeat_interval - idle)
+        
+        if pings or evictions:
+            await asyncio.gather(
+                *(self._ping(connection) for connection in pings),
+                *(self._evict(connection) for connection in evictions)
+            )
+        
+        self.metrics["sweeps"] += 1
+        self.metrics["last_sweep_checked"] = len(due)
+        self.metrics["last_sweep_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    
+    async def _ping(self, connection: Connection):
+        """Ask an idle client to prove it is still there"""
+        self.metrics["pings_sent"] += 1
+        await self.send_personal_message({
+            "type": "ping",
+            "timestamp": time.time()
+        }, connection.websocket)
+    
+    async def _evict(self, connection: Connection):
+        """Close and forget a connection that stopped responding"""
+        self.metrics["reaped_connections"] += 1
+        self.disconnect(connection.websocket)
+        try:
+            await connection.websocket.close(code=1001, reason="Idle timeout")
+        except Exception:
+            pass
+        logger.info(f"Reaped idle WebSocket for user {connection.user_id}")
+    
+    def reconnect_hint(self) -> dict:
+        """Reconnect instruction with a jittered delay"""
+        return {
+            "type": "reconnect",
+            "message": "Server restarting, please reconnect",
+            "retry_after_ms": random.randint(settings.WS_RECONNECT_MIN_MS, settings.WS_RECONNECT_MAX_MS)
+        }
+    
+    async def drain(self, timeout: Optional[float] = None) -> dict:
+        """
+        Close every connection for a restart, concurrently and within a deadline.
+        
+        New connections are refused from here on and queued notifications are
+        flushed first. Each socket then gets a reconnect hint and a 1012 close;
+        SSE streams are ended and send their hint from the stream generator.
+        """
+        timeout = settings.WS_DRAIN_TIMEOUT if timeout is None else timeout
+        started = time.perf_counter()
+        deadline = started + timeout
+        self.draining = True
+        
+        await self.flush_pending()
+        
+        sockets = []
+        streams = 0
+        for connection in list(self.connections.values()):
+            if connection.websocket is None:
+                streams += 1
+                self.disconnect(connection)
+                try:
+                    # Wake the generator so it notices the stream is gone
+                    connection.queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    pass
+            else:
+                sockets.append(connection)
+        
+        timed_out = 0
+        if sockets:
+            tasks = [asyncio.create_task(self._close_for_restart(connection)) for connection in sockets]
+            _, unfinished = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.perf_counter()))
+            for task in unfinished:
+                task.cancel()
+            timed_out = len(unfinished)
+        
+        self.drain_report = {
+            "websockets": len(sockets),
+            "sse_streams": streams,
+            "timed_out": timed_out,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+        return self.drain_report
+    
+    async def _close_for_restart(self, connection: Connection):
+        self.disconnect(connection.websocket)
+        try:
+            await self._write_frame(connection.websocket, connection.codec.encode(self.reconnect_hint()))
+            await connection.websocket.close(code=1012, reason="Server restarting")
+        except Exception:
+            pass
+    
+    def get_stats(self) -> dict:
+        """Connection counts, reaper and batching metrics"""
+        return {
+            "active_connections": len(self.connections),
+            "unique_users": len(self.user_connections),
+            "sse_streams": len(self.streams),
+            "reaper": {
+                "heartbeat_interval": self.heartbeat_interval,
+                "idle_timeout": self.idle_timeout,
+                **self.metrics
+            },
+            "batching": {
+                "window_ms": self.batch_window * 1000,
+                **self.batch_metrics
+            }
+        }
 
 
 # Global connection manager instance
@@ -108,25 +709,6 @@ class NotificationService:
             self.email_service = None
             self.email_enabled = False
     
-    def _get_fresh_db_session(self):
-        """Get a fresh database session to avoid connection issues"""
-        from app.database import SessionLocal
-        return SessionLocal()
-    
-    async def _get_user_safely(self, user_id: int) -> Optional[User]:
-        """Get user with proper error handling"""
-        db = None
-        try:
-            db = self._get_fresh_db_session()
-            user = db.query(User).filter(User.id == user_id).first()
-            return user
-        except Exception as e:
-            logger.error(f"Error fetching user {user_id}: {e}")
-            return None
-        finally:
-            if db:
-                db.close()
-    
     async def notify_swap_request(self, requester_id: int, owner_id: int, swap_data: dict):
         """Notify item owner of new swap request (WebSocket + Email)"""
         
@@ -150,24 +732,39 @@ class NotificationService:
         # Email notification (for offline users or always if configured)
         if self.email_enabled:
             try:
-                # Get users with fresh DB session
-                owner = await self._get_user_safely(owner_id)
-                requester = await self._get_user_safely(requester_id)
+                # One batched, cached lookup for both parties
+                contacts = await user_contacts.get_many([owner_id, requester_id])
+                owner = contacts.get(owner_id)
+                requester = contacts.get(requester_id)
                 
-                if owner and requester and owner.email:
-                    # Only send email if user is offline (or always if configured)
+                if owner and requester and owner.wants_email:
+                    from app.services.presence import presence_service
+                    
+                    # Only send email if user is offline on every worker (or always if configured)
                     should_send_email = (
-                        not manager.is_user_online(owner_id) or 
+                        not await presence_service.is_online(owner_id) or 
                         not getattr(self, 'email_for_offline_only', True)
                     )
                     
                     if should_send_email:
-                        await self.email_service.send_swap_request_email(
-                            owner=owner,
-                            requester=requester,
-                            swap_data=swap_data
-                        )
-                        logger.info(f"Swap request email sent to {owner.email}")
+                        from app.services.email_digest import email_digest
+                        
+                        # Collected into the owner's digest unless digests are off
+                        if await email_digest.add(owner_id, "swap_request", {
+                            "swap_id": swap_data.get("swap_id"),
+                            "item_title": swap_data.get("item_title"),
+                            "swap_type": swap_data.get("swap_type"),
+                            "points_offered": swap_data.get("points_offered"),
+                            "requester_name": requester.first_name or requester.username
+                        }):
+                            logger.info(f"Swap request added to digest for {owner.email}")
+                        else:
+                            await self.email_service.send_swap_request_email(
+                                owner=owner,
+                                requester=requester,
+                                swap_data=swap_data
+                            )
+                            logger.info(f"Swap request email sent to {owner.email}")
                 
             except Exception as e:
                 logger.error(f"Failed to send swap request email: {e}")
@@ -196,10 +793,11 @@ class NotificationService:
         # Email notification for acceptance (important event)
         if self.email_enabled and accepted:
             try:
-                owner = await self._get_user_safely(owner_id)
-                requester = await self._get_user_safely(requester_id)
+                contacts = await user_contacts.get_many([owner_id, requester_id])
+                owner = contacts.get(owner_id)
+                requester = contacts.get(requester_id)
                 
-                if owner and requester and requester.email:
+                if owner and requester and requester.wants_email:
                     await self.email_service.send_swap_accepted_email(
                         requester=requester,
                         owner=owner,
@@ -233,9 +831,10 @@ class NotificationService:
         # Email notifications (important milestone)
         if self.email_enabled:
             try:
+                contacts = await user_contacts.get_many(user_ids)
                 for user_id in user_ids:
-                    user = await self._get_user_safely(user_id)
-                    if user and user.email:
+                    user = contacts.get(user_id)
+                    if user and user.wants_email:
                         await self.email_service.send_swap_completed_email(
                             user=user,
                             swap_data=swap_data
@@ -311,9 +910,9 @@ class NotificationService:
                     await self.email_service.send_welcome_email(temp_user)
                     logger.info(f"Welcome email sent to {user_email}")
                 else:
-                    # Fallback: get user from DB
-                    user = await self._get_user_safely(user_id)
-                    if user and user.email:
+                    # Fallback: look the user up (cached, off the event loop)
+                    user = await user_contacts.get(user_id)
+                    if user and user.wants_email:
                         await self.email_service.send_welcome_email(user)
                         logger.info(f"Welcome email sent to {user.email}")
                 
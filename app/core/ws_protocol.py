@@ -0,0 +1,28 @@
+# app/core/ws_protocol.py - uvicorn WebSocket protocol with tuned permessage-deflate
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+from app.config import settings
+
+
+class TunedDeflateWebSocketProtocol(WebSocketProtocol):
+    """
+    uvicorn's default protocol negotiates permessage-deflate with zlib defaults
+    (32KB window, memLevel 8, context takeover both ways), which costs a few
+    hundred KB per socket. This variant applies the WS_DEFLATE_* settings.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        if settings.WS_PER_MESSAGE_DEFLATE:
+            self.available_extensions = [
+                ServerPerMessageDeflateFactory(
+                    server_no_context_takeover=settings.WS_DEFLATE_SERVER_NO_CONTEXT_TAKEOVER,
+                    client_no_context_takeover=settings.WS_DEFLATE_CLIENT_NO_CONTEXT_TAKEOVER,
+                    server_max_window_bits=settings.WS_DEFLATE_MAX_WINDOW_BITS,
+                    compress_settings={"memLevel": settings.WS_DEFLATE_MEM_LEVEL}
+                )
+            ]
+        else:
+            self.available_extensions = []
@@ -2,8 +2,9 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.config import settings
+from app.core.body_limit import BodySizeLimitMiddleware
 from app.database import test_db_connection, test_redis_connection
 import os
 
@@ -16,6 +17,14 @@ app = FastAPI(
     redoc_url="/redoc" if settings.DEBUG else None
 )
 
+# Refuse oversized uploads before they're spooled to disk (inside CORS, so
+# browsers can read the 413)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=settings.MAX_UPLOAD_REQUEST_SIZE,
+    path_prefixes=["/api/v1/upload"]
+)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -48,6 +57,36 @@ async def startup_event():
         print("📝 Note: This is okay for development, we'll add caching later")
     
     print("✅ Database connected successfully")
+    
+    # Start the idle-connection reaper
+    from app.core.websockets import manager
+    from app.services.presence import presence_service
+    manager.start_reaper()
+    await presence_service.start()
+    from app.services.email_queue import email_queue
+    from app.services.email_digest import email_digest
+    await email_queue.start()
+    await email_digest.start()
+    from app.services.announcements import announcement_mailer
+    announcement_mailer.start()
+    # Image workers take a moment to spawn, so do it before the first upload
+    from app.services.image_processing import image_processor
+    from app.services.image_cache import image_cache
+    from app.services.resumable_uploads import resumable_uploads
+    os.makedirs(settings.UPLOAD_INCOMING_DIR, exist_ok=True)
+    image_processor.start()
+    await image_cache.start()
+    resumable_uploads.start()
+    from app.services.upload_gc import upload_gc
+    await upload_gc.start()
+    
+    # Notifications run as event subscribers, fed by the outbox relay
+    from app.core.events import event_bus
+    from app.core.event_handlers import register_handlers
+    register_handlers(event_bus)
+    event_bus.start()
+    from app.services.outbox import outbox_relay
+    outbox_relay.start()
     print("🔌 WebSocket manager initialized")
     print("🔍 Enhanced search service ready")
     print("📱 Real-time notifications enabled")
@@ -60,12 +99,48 @@ async def shutdown_event():
     
     # Close WebSocket connections gracefully
     from app.core.websockets import manager
-    for user_id in list(manager.active_connections.keys()):
-        for websocket in manager.active_connections[user_id]:
-            try:
-                await websocket.close(code=1001, reason="Server shutdown")
-            except Exception:
-                pass
+    from app.core.events import event_bus
+    from app.core.typing_relay import typing_relay
+    from app.services.presence import presence_service
+    await manager.stop_reaper()
+    await typing_relay.stop()
+    # Deliver already-published events before closing sockets; undispatched
+    # outbox rows stay pending and are picked up after restart
+    from app.services.outbox import outbox_relay
+    await outbox_relay.stop()
+    await event_bus.stop()
+    # Served by DrainingServer (python -m app.main) the drain already ran on
+    # SIGTERM, before uvicorn closed the connections; otherwise (or if that
+    # drain failed part way) do it here
+    try:
+        report = manager.drain_report or await manager.drain()
+        print(
+            f"🔌 Drained {report['websockets']} WebSockets and {report['sse_streams']} SSE streams "
+            f"in {report['duration_ms']:.0f} ms ({report['timed_out']} timed out)"
+        )
+    except Exception as e:
+        print(f"⚠️  Connection drain failed: {e}")
+    await presence_service.stop()
+    
+    # Announcements resume from their checkpoint, open digests and queued emails stay
+    # in Redis for the next start; then say QUIT on pooled SMTP sessions
+    from app.services.email_queue import email_queue
+    from app.services.email_digest import email_digest
+    from app.services.email import email_service
+    from app.services.announcements import announcement_mailer
+    await announcement_mailer.stop()
+    await email_digest.stop()
+    await email_queue.stop()
+    email_service.smtp_pool.close_all()
+    
+    from app.services.image_processing import image_processor
+    from app.services.image_cache import image_cache
+    from app.services.resumable_uploads import resumable_uploads
+    from app.services.upload_gc import upload_gc
+    await upload_gc.stop()
+    await resumable_uploads.stop()
+    await image_cache.stop()
+    image_processor.shutdown()
     
     print("✅ Graceful shutdown completed")
 
@@ -113,10 +188,15 @@ async def health_check():
         
         # Check WebSocket manager
         from app.core.websockets import manager
+        ws_stats = manager.get_stats()
         health_status["websockets"] = {
-            "active_connections": len(manager.user_sessions),
-            "unique_users": len(manager.active_connections)
+            "active_connections": ws_stats["active_connections"],
+            "unique_users": ws_stats["unique_users"],
+            "reaped_connections": ws_stats["reaper"]["reaped_connections"]
         }
+        if manager.draining:
+            # Tell load balancers to stop routing here during shutdown
+            health_status["status"] = "draining"
             
     except Exception as e:
         health_status["status"] = "unhealthy"
@@ -126,6 +206,16 @@ async def health_check():
     return JSONResponse(content=health_status, status_code=status_code)
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Notification latency histograms and delivery counters (Prometheus text format)"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    from app.core.metrics import metrics
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # Import and include API routes
 from app.api.routes import auth, users, items, swaps, admin, upload
 
@@ -182,12 +272,16 @@ async def global_exception_handler(request, exc):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(
+    from app.core.server import serve
+    from app.core.ws_protocol import TunedDeflateWebSocketProtocol
+    serve(uvicorn.Config(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
         log_level="info",
+        ws=TunedDeflateWebSocketProtocol,
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
         ws_ping_interval=20,
         ws_ping_timeout=20
-    )
\ No newline at end of file
+    ))
\ No newline at end of file
@@ -2,6 +2,9 @@ from .user import User
 from .category import Category
 from .item import Item, ItemCondition, ItemStatus, ItemSize
 from .swap import Swap, SwapType, SwapStatus, PointTransaction
+from .outbox import OutboxEvent, OutboxStatus
+from .announcement import Announcement, AnnouncementStatus
+from .image import StoredImage
 
 __all__ = [
     "User",
@@ -13,5 +16,10 @@ __all__ = [
     "Swap",
     "SwapType",
     "SwapStatus",
-    "PointTransaction"
+    "PointTransaction",
+    "OutboxEvent",
+    "OutboxStatus",
+    "Announcement",
+    "AnnouncementStatus",
+    "StoredImage"
 ]
\ No newline at end of file
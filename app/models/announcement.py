@@ -0,0 +1,48 @@
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+import enum
+
+
+class AnnouncementStatus(enum.Enum):
+    """Bulk announcement email lifecycle"""
+    PENDING = "pending"              # Created, waiting for a worker
+    SENDING = "sending"              # Claimed by a worker (lease in locked_until)
+    COMPLETED = "completed"          # Every active user processed
+    CANCELLED = "cancelled"          # Stopped by an admin
+
+
+class Announcement(Base):
+    """Announcement emailed to every active user, with a resumable checkpoint"""
+    __tablename__ = "announcements"
+
+    # Primary Key
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Content
+    subject = Column(String(200), nullable=False)
+    message = Column(Text, nullable=False)
+    # Personalized emails greet each user by name (one message per user);
+    # otherwise one message goes to several recipients at once
+    personalized = Column(Boolean, default=True, nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    # Progress
+    status = Column(String(20), default="pending", nullable=False)
+    # Checkpoint: every user with a lower or equal id has been processed
+    last_user_id = Column(Integer, default=0, nullable=False)
+    sent_count = Column(Integer, default=0, nullable=False)
+    failed_count = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    # Worker lease, so only one worker sends and a crashed worker's run is resumed
+    locked_by = Column(String(100), nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<Announcement(id={self.id}, subject='{self.subject}', status='{self.status}')>"
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class StoredImage(Base):
+    """Processed upload stored once per distinct content, shared by every listing that uses it"""
+    __tablename__ = "stored_images"
+
+    # Primary Key
+    id = Column(Integer, primary_key=True, index=True)
+
+    # SHA-256 of the uploaded bytes (before processing), so re-uploads match
+    content_hash = Column(String(64), unique=True, nullable=False, index=True)
+    # Relative to UPLOAD_DIR, sharded by hash: ab/cd/abcd....jpg
+    path = Column(String(200), unique=True, nullable=False)
+    size = Column(Integer, nullable=False)
+    # Responsive variants written when it was processed: {"widths": [...], "formats": [...]}
+    variants = Column(JSON, nullable=True)
+
+    # Listings using this content (one per attachment); unused images are deleted
+    ref_count = Column(Integer, default=0, nullable=False)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_referenced_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<StoredImage(id={self.id}, path='{self.path}', ref_count={self.ref_count})>"
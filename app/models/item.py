@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, ARRAY
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, ARRAY, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -70,6 +70,8 @@ class Item(Base):
     # Images (array of image URLs/paths)
     image_urls = Column(ARRAY(String), nullable=True)
     primary_image_url = Column(String(500), nullable=True)
+    # srcset description of the primary image's variants, stored when it is set
+    primary_image_variants = Column(JSON, nullable=True)
     
     # Points & Pricing
     points_value = Column(Integer, nullable=False, index=True)
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Text, DateTime, JSON, Index
+from sqlalchemy.sql import func
+from app.database import Base
+import enum
+
+
+class OutboxStatus(enum.Enum):
+    """Outbox row lifecycle"""
+    PENDING = "pending"              # Waiting for (or leased by) the relay
+    DONE = "done"                    # Dispatched to every subscriber
+    FAILED = "failed"                # Gave up after OUTBOX_MAX_ATTEMPTS
+
+
+class OutboxEvent(Base):
+    """Domain event committed in the same transaction as the change it describes"""
+    __tablename__ = "outbox"
+
+    # Primary Key (also the dispatch order)
+    id = Column(BigInteger, primary_key=True)
+
+    # Event
+    event_type = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False)
+
+    # Delivery state
+    status = Column(String(20), default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Not claimable before this: set on insert, pushed forward by leases and retries
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Only pending rows are scanned by the relay, so keep the index small
+        Index(
+            "ix_outbox_pending", "available_at", "id",
+            postgresql_where=(status == OutboxStatus.PENDING.value)
+        ),
+        Index("ix_outbox_processed_at", "processed_at"),
+    )
+
+    def __repr__(self):
+        return f"<OutboxEvent(id={self.id}, event_type='{self.event_type}', status='{self.status}')>"
@@ -4,13 +4,15 @@ from .user import (
 )
 from .item import (
     ItemBase, ItemCreate, ItemUpdate, ItemResponse, ItemPublic, ItemSummary,
-    CategoryResponse, CategoryCreate, CategoryUpdate, UserPublic as ItemUserPublic
+    CategoryResponse, CategoryCreate, CategoryUpdate, ImageSource, ResponsiveImage,
+    UserPublic as ItemUserPublic
 )
 from .swap import (
     SwapBase, SwapCreate, SwapUpdate, SwapResponse, SwapSummary,
     PointTransactionResponse, PointTransactionSummary,
     UserPublic as SwapUserPublic, ItemSummary as SwapItemSummary
 )
+from .announcement import AnnouncementCreate, AnnouncementResponse
 
 __all__ = [
     # User schemas
@@ -19,9 +21,12 @@ __all__ = [
     
     # Item schemas
     "ItemBase", "ItemCreate", "ItemUpdate", "ItemResponse", "ItemPublic", "ItemSummary",
-    "CategoryResponse", "CategoryCreate", "CategoryUpdate",
+    "CategoryResponse", "CategoryCreate", "CategoryUpdate", "ImageSource", "ResponsiveImage",
     
     # Swap schemas
     "SwapBase", "SwapCreate", "SwapUpdate", "SwapResponse", "SwapSummary",
-    "PointTransactionResponse", "PointTransactionSummary"
+    "PointTransactionResponse", "PointTransactionSummary",
+    
+    # Announcement schemas
+    "AnnouncementCreate", "AnnouncementResponse"
 ]
\ No newline at end of file
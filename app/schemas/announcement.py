@@ -0,0 +1,44 @@
+from typing import Optional
+from pydantic import BaseModel, validator
+from datetime import datetime
+
+
+class AnnouncementCreate(BaseModel):
+    """Schema for creating a bulk announcement"""
+    subject: str
+    message: str
+    personalized: bool = True
+    notify_online: bool = True  # Also push it to connected users over WebSocket
+
+    @validator('subject')
+    def validate_subject(cls, v):
+        if len(v.strip()) < 3:
+            raise ValueError('Subject must be at least 3 characters long')
+        if len(v) > 200:
+            raise ValueError('Subject must be less than 200 characters')
+        return v.strip()
+
+    @validator('message')
+    def validate_message(cls, v):
+        if not v.strip():
+            raise ValueError('Message cannot be empty')
+        return v
+
+
+class AnnouncementResponse(BaseModel):
+    """Schema for announcement progress"""
+    id: int
+    subject: str
+    message: str
+    personalized: bool
+    status: str
+    last_user_id: int
+    sent_count: int
+    failed_count: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -115,6 +115,18 @@ class UserPublic(BaseModel):
         from_attributes = True
 
 
+class ImageSource(BaseModel):
+    """One format of a responsive image (a <picture> <source>)"""
+    type: str  # MIME type, e.g. image/webp
+    srcset: str  # "url 160w, url 480w, ..."
+
+
+class ResponsiveImage(BaseModel):
+    """Downscaled WebP/AVIF/JPEG variants of an image, best-compressed format first"""
+    src: str  # Full-size image, for <img src> fallback
+    sources: List[ImageSource]
+
+
 class ItemResponse(ItemBase):
     """Schema for item responses"""
     id: int
@@ -150,6 +162,7 @@ class ItemPublic(BaseModel):
     tags: Optional[List[str]] = None
     points_value: int
     primary_image_url: Optional[str] = None
+    primary_image_variants: Optional[ResponsiveImage] = None
     image_urls: Optional[List[str]] = None
     shipping_available: bool
     created_at: datetime
@@ -171,6 +184,7 @@ class ItemSummary(BaseModel):
     condition: str
     points_value: int
     primary_image_url: Optional[str] = None
+    primary_image_variants: Optional[ResponsiveImage] = None
     created_at: datetime
     
     class Config:
@@ -0,0 +1,309 @@
+# app/services/announcements.py - Bulk announcement emails to every active user
+"""
+An admin creates an Announcement row; AnnouncementMailer (running on every
+app worker) claims it with a lease, so exactly one worker sends it, and then:
+
+  * streams recipients with keyset pagination (id > last_user_id ORDER BY id
+    LIMIT n), which stays an index range scan at any offset
+  * renders the template once; per recipient only the name is substituted
+  * sends on its own SMTP pool, so transactional email isn't starved, with
+    many RCPTs per message when the announcement isn't personalized
+  * checkpoints last_user_id after every batch
+
+If the worker dies, its lease lapses and another worker resumes from the
+checkpoint; at most one batch can be emailed twice.
+"""
+import asyncio
+import html
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import List, Optional, Tuple
+import logging
+
+from sqlalchemy import or_
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Announcement, AnnouncementStatus, User
+from app.services.email import email_service
+from app.services.smtp_pool import SMTPConnectionPool, is_connection_error
+
+logger = logging.getLogger(__name__)
+
+# Stands in for the recipient's name in the once-rendered template
+NAME_PLACEHOLDER = "%%user_name%%"
+
+# (id, email, username, first_name)
+Recipient = Tuple[int, str, str, Optional[str]]
+
+
+class PreparedAnnouncement:
+    """Announcement rendered once, reused for every recipient"""
+    __slots__ = ("id", "subject", "html", "text", "personalized")
+
+    def __init__(self, id: int, subject: str, html_content: str, text_content: str, personalized: bool):
+        self.id = id
+        self.subject = subject
+        self.html = html_content
+        self.text = text_content
+        self.personalized = personalized
+
+
+class AnnouncementMailer:
+    """Background task sending claimed announcements batch by batch"""
+
+    def __init__(self):
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.smtp_pool = SMTPConnectionPool(
+            host=email_service.smtp_server,
+            port=email_service.smtp_port,
+            username=email_service.email_username,
+            password=email_service.email_password,
+            use_tls=settings.SMTP_USE_TLS,
+            max_size=settings.ANNOUNCEMENT_SMTP_CONNECTIONS,
+            idle_timeout=settings.SMTP_POOL_IDLE_TIMEOUT,
+            healthcheck_after=settings.SMTP_POOL_HEALTHCHECK_AFTER,
+            max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+            timeout=settings.SMTP_TIMEOUT
+        )
+        self.executor = ThreadPoolExecutor(max_workers=settings.ANNOUNCEMENT_SMTP_CONNECTIONS)
+        self._wakeup = asyncio.Event()
+        self._stopping = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "announcements_completed": 0,
+            "batches": 0,
+            "sent": 0,
+            "failed": 0,
+            "last_batch_ms": 0.0
+        }
+
+    def wake(self):
+        """An announcement was just created: skip the poll wait"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish the batch in hand (up to timeout); the rest resumes from the checkpoint"""
+        self._stopping.set()
+        if self._task is not None:
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Announcement batch still sending at shutdown, it will be resent on resume")
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.smtp_pool.close_all()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                announcement_id = await asyncio.to_thread(self._claim)
+                if announcement_id is not None:
+                    await self._send_announcement(announcement_id)
+                    continue
+            except Exception as e:
+                logger.error(f"Announcement mailer error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.ANNOUNCEMENT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _claim(self) -> Optional[int]:
+        """Lease the oldest pending announcement, or one whose sender stopped renewing"""
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            announcement = (
+                db.query(Announcement)
+                .filter(or_(
+                    Announcement.status == AnnouncementStatus.PENDING.value,
+                    (Announcement.status == AnnouncementStatus.SENDING.value) & (Announcement.locked_until < now)
+                ))
+                .order_by(Announcement.id)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if announcement is None:
+                return None
+            if announcement.status == AnnouncementStatus.SENDING.value:
+                logger.info(f"Resuming announcement {announcement.id} after user {announcement.last_user_id}")
+            announcement.status = AnnouncementStatus.SENDING.value
+            announcement.locked_by = self.node_id
+            announcement.locked_until = now + timedelta(seconds=settings.ANNOUNCEMENT_LEASE_SECONDS)
+            announcement.started_at = announcement.started_at or now
+            db.commit()
+            return announcement.id
+        finally:
+            db.close()
+
+    def _prepare(self, announcement_id: int) -> Tuple[PreparedAnnouncement, int]:
+        db = SessionLocal()
+        try:
+            announcement = db.query(Announcement).filter(Announcement.id == announcement_id).one()
+            base_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
+            paragraphs = [p.strip() for p in announcement.message.split("\n\n") if p.strip()]
+            html_content, text_content = email_service.templates.render(
+                "announcement",
+                subject=announcement.subject,
+                # Shared messages can't greet anyone by name
+                user_name=NAME_PLACEHOLDER if announcement.personalized else "there",
+                paragraphs=paragraphs,
+                dashboard_url=f"{base_url}/dashboard"
+            )
+            prepared = PreparedAnnouncement(
+                announcement.id, f"📣 {announcement.subject} - ReWear",
+                html_content, text_content, announcement.personalized
+            )
+            return prepared, announcement.last_user_id
+        finally:
+            db.close()
+
+    async def _send_announcement(self, announcement_id: int):
+        prepared, last_user_id = await asyncio.to_thread(self._prepare, announcement_id)
+        rate = settings.ANNOUNCEMENT_SEND_RATE
+
+        while not self._stopping.is_set():
+            recipients = await asyncio.to_thread(self._next_batch, last_user_id)
+            if not recipients:
+                await asyncio.to_thread(self._complete, announcement_id)
+                self.metrics["announcements_completed"] += 1
+                logger.info(f"Announcement {announcement_id} completed")
+                return
+
+            started = time.perf_counter()
+            sent, failed, last_error = await asyncio.to_thread(self._send_batch, prepared, recipients)
+            last_user_id = recipients[-1][0]
+            if not await asyncio.to_thread(self._checkpoint, announcement_id, last_user_id, sent, failed, last_error):
+                logger.info(f"Announcement {announcement_id} cancelled or taken over, stopping")
+                return
+
+            elapsed = time.perf_counter() - started
+            self.metrics["batches"] += 1
+            self.metrics["sent"] += sent
+            self.metrics["failed"] += failed
+            self.metrics["last_batch_ms"] = round(elapsed * 1000, 3)
+
+            # Stay under the provider's sending rate
+            if rate:
+                await asyncio.sleep(max(0.0, len(recipients) / rate - elapsed))
+
+    def _next_batch(self, after_user_id: int) -> List[Recipient]:
+        db = SessionLocal()
+        try:
+            return [
+                tuple(row) for row in
+                db.query(User.id, User.email, User.username, User.first_name)
+                .filter(User.id > after_user_id, User.is_active == True)
+                .order_by(User.id)
+                .limit(settings.ANNOUNCEMENT_BATCH_SIZE)
+                .all()
+            ]
+        finally:
+            db.close()
+
+    def _send_batch(self, prepared: PreparedAnnouncement, recipients: List[Recipient]) -> Tuple[int, int, Optional[str]]:
+        """Send one batch over the pool; returns (sent, failed, last error)"""
+        if prepared.personalized:
+            messages = [
+                ([email], email_service.build_message(
+                    email, prepared.subject,
+                    prepared.html.replace(NAME_PLACEHOLDER, html.escape(first_name or username)),
+                    prepared.text.replace(NAME_PLACEHOLDER, first_name or username)
+                ))
+                for _, email, username, first_name in recipients
+            ]
+        else:
+            # One body for everyone; recipients only appear in the envelope.
+            # Grouping by domain lets the relay hand each message to one MX
+            raw = email_service.build_message("undisclosed-recipients:;", prepared.subject, prepared.html, prepared.text)
+            by_domain = sorted((email for _, email, _, _ in recipients), key=lambda e: e.rsplit("@", 1)[-1].lower())
+            chunk = settings.ANNOUNCEMENT_RCPTS_PER_MESSAGE
+            messages = []
+            for _, group in groupby(by_domain, key=lambda e: e.rsplit("@", 1)[-1].lower()):
+                group = list(group)
+                messages.extend((group[i:i + chunk], raw) for i in range(0, len(group), chunk))
+
+        def send(message) -> Tuple[int, int, Optional[BaseException]]:
+            rcpts, raw_message = message
+            try:
+                refused = self.smtp_pool.send(email_service.email_from, rcpts, raw_message)
+                return len(rcpts) - len(refused), len(refused), None
+            except Exception as e:
+                return 0, len(rcpts), e
+
+        sent = failed = 0
+        errors = []
+        for ok, bad, error in self.executor.map(send, messages):
+            sent += ok
+            failed += bad
+            if error is not None:
+                errors.append(error)
+
+        if not sent and errors and all(is_connection_error(e) for e in errors):
+            # The server is down, not the recipients bad: don't checkpoint past them.
+            # The lease lapses and the batch is retried
+            raise RuntimeError(f"SMTP unavailable: {errors[-1]}")
+        return sent, failed, str(errors[-1]) if errors else None
+
+    def _checkpoint(self, announcement_id: int, last_user_id: int, sent: int, failed: int, last_error: Optional[str]) -> bool:
+        """Record progress and renew the lease; False if cancelled or no longer ours"""
+        db = SessionLocal()
+        try:
+            values = {
+                "last_user_id": last_user_id,
+                "sent_count": Announcement.sent_count + sent,
+                "failed_count": Announcement.failed_count + failed,
+                "locked_until": datetime.now(timezone.utc) + timedelta(seconds=settings.ANNOUNCEMENT_LEASE_SECONDS)
+            }
+            if last_error:
+                values["last_error"] = last_error
+            updated = db.query(Announcement).filter(
+                Announcement.id == announcement_id,
+                Announcement.status == AnnouncementStatus.SENDING.value,
+                Announcement.locked_by == self.node_id
+            ).update(values, synchronize_session=False)
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
+
+    def _complete(self, announcement_id: int):
+        db = SessionLocal()
+        try:
+            db.query(Announcement).filter(
+                Announcement.id == announcement_id,
+                Announcement.status == AnnouncementStatus.SENDING.value
+            ).update({
+                "status": AnnouncementStatus.COMPLETED.value,
+                "completed_at": datetime.now(timezone.utc),
+                "locked_by": None,
+                "locked_until": None
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "smtp_pool": self.smtp_pool.get_stats(),
+            **self.metrics
+        }
+
+
+# Global announcement mailer instance
+announcement_mailer = AnnouncementMailer()
@@ -1,16 +1,18 @@
 # app/services/email.py
-import smtplib
-import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Optional
-from jinja2 import Template
+from typing import List, Optional, Tuple
 import asyncio
+import time
 from concurrent.futures import ThreadPoolExecutor
 import logging
 
 from app.config import settings
+from app.core.metrics import metrics
 from app.models import User
+from app.services.email_queue import email_queue
+from app.services.email_templates import EmailTemplates
+from app.services.smtp_pool import SMTPConnectionPool
 
 logger = logging.getLogger(__name__)
 
@@ -23,54 +25,103 @@ class EmailService:
         self.email_username = getattr(settings, 'EMAIL_USERNAME', '')
         self.email_password = getattr(settings, 'EMAIL_PASSWORD', '')
         self.email_from = getattr(settings, 'EMAIL_FROM', 'noreply@rewear.com')
-        self.executor = ThreadPoolExecutor(max_workers=3)
+        # One worker thread per pooled session, so a send never waits on the pool
+        self.smtp_pool = SMTPConnectionPool(
+            host=self.smtp_server,
+            port=self.smtp_port,
+            username=self.email_username,
+            password=self.email_password,
+            use_tls=settings.SMTP_USE_TLS,
+            max_size=settings.SMTP_POOL_SIZE,
+            idle_timeout=settings.SMTP_POOL_IDLE_TIMEOUT,
+            healthcheck_after=settings.SMTP_POOL_HEALTHCHECK_AFTER,
+            max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+            timeout=settings.SMTP_TIMEOUT
+        )
+        self.executor = ThreadPoolExecutor(max_workers=settings.SMTP_POOL_SIZE)
+        # Compiled once here instead of on every send
+        self.templates = EmailTemplates({
+            "swap_request": self.SWAP_REQUEST_TEMPLATE,
+            "swap_accepted": self.SWAP_ACCEPTED_TEMPLATE,
+            "swap_completed": self.SWAP_COMPLETED_TEMPLATE,
+            "welcome": self.WELCOME_TEMPLATE,
+            "digest": self.DIGEST_TEMPLATE,
+            "announcement": self.ANNOUNCEMENT_TEMPLATE
+        })
     
     def _send_email_sync(
         self, 
         to_email: str, 
         subject: str, 
         html_content: str, 
-        text_content: Optional[str] = None
+        text_content: Optional[str] = None,
+        event_type: str = "email",
+        enqueued_at: Optional[float] = None,
+        raise_errors: bool = False
     ) -> bool:
-        """Send email synchronously"""
+        """Send email synchronously (raise_errors lets the queue decide whether to retry)"""
+        serialize_started = time.perf_counter()
+        if enqueued_at is None:
+            enqueued_at = serialize_started
         try:
-            # Create message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = self.email_from
-            message["To"] = to_email
-            
-            # Add text and HTML parts
-            if text_content:
-                text_part = MIMEText(text_content, "plain")
-                message.attach(text_part)
+            raw_message = self.build_message(to_email, subject, html_content, text_content)
+            send_started = time.perf_counter()
             
-            html_part = MIMEText(html_content, "html")
-            message.attach(html_part)
-            
-            # Create secure connection and send email
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                if self.email_username and self.email_password:
-                    server.login(self.email_username, self.email_password)
-                server.sendmail(self.email_from, to_email, message.as_string())
+            # Reuses an authenticated session when one is idle
+            self.smtp_pool.send(self.email_from, to_email, raw_message)
             
+            send_completed = time.perf_counter()
+            self._record_latency(event_type, enqueued_at, serialize_started, send_started, send_completed)
+            metrics.inc("notification_deliveries_total", type=event_type, channel="email", outcome="delivered")
             logger.info(f"Email sent successfully to {to_email}")
             return True
             
         except Exception as e:
+            if raise_errors:
+                raise
+            metrics.inc("notification_deliveries_total", type=event_type, channel="email", outcome="failed")
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
             return False
     
+    def build_message(self, to_header: str, subject: str, html_content: str, text_content: Optional[str] = None) -> str:
+        """Serialized multipart/alternative message, ready for sendmail"""
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = self.email_from
+        message["To"] = to_header
+        
+        # Add text and HTML parts
+        if text_content:
+            text_part = MIMEText(text_content, "plain")
+            message.attach(text_part)
+        
+        html_part = MIMEText(html_content, "html")
+        message.attach(html_part)
+        
+        return message.as_string()
+    
+    @staticmethod
+    def _record_latency(event_type: str, enqueued_at: float, serialize_started: float, send_started: float, send_completed: float):
+        """Queue = waiting for a worker thread, serialize = MIME build, send = SMTP session"""
+        labels = {"type": event_type, "channel": "email"}
+        metrics.observe("notification_latency_seconds", serialize_started - enqueued_at, stage="queue", **labels)
+        metrics.observe("notification_latency_seconds", send_started - serialize_started, stage="serialize", **labels)
+        metrics.observe("notification_latency_seconds", send_completed - send_started, stage="send", **labels)
+        metrics.observe("notification_latency_seconds", send_completed - enqueued_at, stage="total", **labels)
+    
     async def send_email_async(
         self, 
         to_email: str, 
         subject: str, 
         html_content: str, 
-        text_content: Optional[str] = None
+        text_content: Optional[str] = None,
+        event_type: str = "email"
     ) -> bool:
-        """Send email asynchronously"""
+        """Queue an email (Redis), or send it in the thread pool if the queue is unavailable"""
+        if email_queue.available and await email_queue.enqueue(
+            to_email, subject, html_content, text_content, event_type
+        ):
+            return True
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(
             self.executor, 
@@ -78,13 +129,14 @@ class EmailService:
             to_email, 
             subject, 
             html_content, 
-            text_content
+            text_content,
+            event_type,
+            time.perf_counter()
         )
     
-    def _render_template(self, template_str: str, **kwargs) -> str:
-        """Render email template"""
-        template = Template(template_str)
-        return template.render(**kwargs)
+    def _render_template(self, template_name: str, **kwargs) -> Tuple[str, str]:
+        """Render email template; returns (html, plain-text alternative)"""
+        return self.templates.render(template_name, **kwargs)
     
     # Email Templates
     SWAP_REQUEST_TEMPLATE = """
@@ -238,6 +290,127 @@ class EmailService:
     </body>
     </html>
     """
+
+    WELCOME_TEMPLATE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <style>
+            body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+            .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+            .header { background: #2ecc71; color: white; padding: 20px; text-align: center; }
+            .content { padding: 20px; background: #f9f9f9; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>🌱 Welcome to ReWear!</h1>
+            </div>
+            <div class="content">
+                <h2>Hi {{ user_name }}!</h2>
+                
+                <p>Welcome to ReWear - the sustainable fashion community! 🎉</p>
+                
+                <p>You've earned <strong>{{ signup_points }} welcome points</strong> to get you started!</p>
+                
+                <h3>Get Started:</h3>
+                <ul>
+                    <li>📷 Upload photos of clothing items you want to swap</li>
+                    <li>🔍 Browse items from other community members</li>
+                    <li>🔄 Create swap requests using points or direct exchanges</li>
+                    <li>🌍 Join the sustainable fashion movement!</li>
+                </ul>
+                
+                <p style="text-align: center;">
+                    <a href="{{ dashboard_url }}" style="display: inline-block; background: #2ecc71; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px;">Start Swapping</a>
+                </p>
+                
+                <p>Happy swapping! 🌟</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    
+    DIGEST_TEMPLATE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <style>
+            body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+            .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+            .header { background: #2ecc71; color: white; padding: 20px; text-align: center; }
+            .content { padding: 20px; background: #f9f9f9; }
+            .item-card { background: white; padding: 15px; margin: 10px 0; border-left: 4px solid #2ecc71; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>🔄 Your Swap Requests - ReWear</h1>
+            </div>
+            <div class="content">
+                <h2>Hi {{ user_name }}!</h2>
+                
+                <p>You have <strong>{{ total }} new swap request{{ 's' if total != 1 else '' }}</strong> waiting for you:</p>
+                
+                {% for entry in entries %}
+                <div class="item-card">
+                    <h3>{{ entry.item_title }}</h3>
+                    <p><strong>{{ entry.requester_name }}</strong>
+                    {% if entry.swap_type == 'points_redemption' %}offered {{ entry.points_offered }} points{% else %}offered a direct swap{% endif %}</p>
+                    <p><a href="{{ entry.view_url }}">View request</a></p>
+                </div>
+                {% endfor %}
+                
+                {% if more_count %}
+                <p>...and {{ more_count }} more.</p>
+                {% endif %}
+                
+                <p style="text-align: center;">
+                    <a href="{{ swaps_url }}" style="display: inline-block; background: #2ecc71; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px;">Review All Requests</a>
+                </p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    
+    ANNOUNCEMENT_TEMPLATE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <style>
+            body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+            .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+            .header { background: #2ecc71; color: white; padding: 20px; text-align: center; }
+            .content { padding: 20px; background: #f9f9f9; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>📣 {{ subject }}</h1>
+            </div>
+            <div class="content">
+                <h2>Hi {{ user_name }}!</h2>
+                
+                {% for paragraph in paragraphs %}
+                <p>{{ paragraph }}</p>
+                {% endfor %}
+                
+                <p style="text-align: center;">
+                    <a href="{{ dashboard_url }}" style="display: inline-block; background: #2ecc71; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px;">Open ReWear</a>
+                </p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
     
     # Email sending methods
     async def send_swap_request_email(
@@ -249,6 +422,7 @@ class EmailService:
         """Send email notification for new swap request"""
         
         if not owner.email:
+            metrics.inc("notification_deliveries_total", type="swap_request", channel="email", outcome="dropped")
             return False
         
         # Build URLs (you'd use your actual frontend URLs)
@@ -257,8 +431,8 @@ class EmailService:
         reject_url = f"{base_url}/swaps/{swap_data['swap_id']}/reject" 
         view_url = f"{base_url}/swaps/{swap_data['swap_id']}"
         
-        html_content = self._render_template(
-            self.SWAP_REQUEST_TEMPLATE,
+        html_content, text_content = self._render_template(
+            "swap_request",
             owner_name=owner.first_name or owner.username,
             requester_name=requester.first_name or requester.username,
             item_title=swap_data.get('item_title', 'Unknown Item'),
@@ -279,7 +453,9 @@ class EmailService:
         return await self.send_email_async(
             to_email=owner.email,
             subject=subject,
-            html_content=html_content
+            html_content=html_content,
+            text_content=text_content,
+            event_type="swap_request"
         )
     
     async def send_swap_accepted_email(
@@ -291,13 +467,14 @@ class EmailService:
         """Send email notification when swap is accepted"""
         
         if not requester.email:
+            metrics.inc("notification_deliveries_total", type="swap_accepted", channel="email", outcome="dropped")
             return False
         
         base_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
         view_url = f"{base_url}/swaps/{swap_data['swap_id']}"
         
-        html_content = self._render_template(
-            self.SWAP_ACCEPTED_TEMPLATE,
+        html_content, text_content = self._render_template(
+            "swap_accepted",
             requester_name=requester.first_name or requester.username,
             owner_name=owner.first_name or owner.username,
             item_title=swap_data.get('item_title', 'Unknown Item'),
@@ -310,7 +487,9 @@ class EmailService:
         return await self.send_email_async(
             to_email=requester.email,
             subject=subject,
-            html_content=html_content
+            html_content=html_content,
+            text_content=text_content,
+            event_type="swap_accepted"
         )
     
     async def send_swap_completed_email(
@@ -321,13 +500,14 @@ class EmailService:
         """Send email notification when swap is completed"""
         
         if not user.email:
+            metrics.inc("notification_deliveries_total", type="swap_completed", channel="email", outcome="dropped")
             return False
         
         base_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
         dashboard_url = f"{base_url}/dashboard"
         
-        html_content = self._render_template(
-            self.SWAP_COMPLETED_TEMPLATE,
+        html_content, text_content = self._render_template(
+            "swap_completed",
             user_name=user.first_name or user.username,
             item_title=swap_data.get('item_title', 'Unknown Item'),
             points_earned=swap_data.get('points_earned', 0),
@@ -339,63 +519,23 @@ class EmailService:
         return await self.send_email_async(
             to_email=user.email,
             subject=subject,
-            html_content=html_content
+            html_content=html_content,
+            text_content=text_content,
+            event_type="swap_completed"
         )
     
     async def send_welcome_email(self, user: User) -> bool:
         """Send welcome email to new users"""
         
         if not user.email:
+            metrics.inc("notification_deliveries_total", type="welcome", channel="email", outcome="dropped")
             return False
         
-        welcome_template = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: #2ecc71; color: white; padding: 20px; text-align: center; }
-                .content { padding: 20px; background: #f9f9f9; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🌱 Welcome to ReWear!</h1>
-                </div>
-                <div class="content">
-                    <h2>Hi {{ user_name }}!</h2>
-                    
-                    <p>Welcome to ReWear - the sustainable fashion community! 🎉</p>
-                    
-                    <p>You've earned <strong>{{ signup_points }} welcome points</strong> to get you started!</p>
-                    
-                    <h3>Get Started:</h3>
-                    <ul>
-                        <li>📷 Upload photos of clothing items you want to swap</li>
-                        <li>🔍 Browse items from other community members</li>
-                        <li>🔄 Create swap requests using points or direct exchanges</li>
-                        <li>🌍 Join the sustainable fashion movement!</li>
-                    </ul>
-                    
-                    <p style="text-align: center;">
-                        <a href="{{ dashboard_url }}" style="display: inline-block; background: #2ecc71; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px;">Start Swapping</a>
-                    </p>
-                    
-                    <p>Happy swapping! 🌟</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
         base_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
         dashboard_url = f"{base_url}/dashboard"
         
-        html_content = self._render_template(
-            welcome_template,
+        html_content, text_content = self._render_template(
+            "welcome",
             user_name=user.first_name or user.username,
             signup_points=getattr(settings, 'SIGNUP_BONUS_POINTS', 100),
             dashboard_url=dashboard_url
@@ -406,7 +546,47 @@ class EmailService:
         return await self.send_email_async(
             to_email=user.email,
             subject=subject,
-            html_content=html_content
+            html_content=html_content,
+            text_content=text_content,
+            event_type="welcome"
+        )
+
+    async def send_digest_email(self, user: User, entries: List[dict]) -> bool:
+        """Send one summary of the swap requests collected in a digest window"""
+        
+        if not user.email:
+            metrics.inc("notification_deliveries_total", type="digest", channel="email", outcome="dropped")
+            return False
+        
+        base_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
+        shown = entries[:settings.EMAIL_DIGEST_MAX_ITEMS]
+        
+        html_content, text_content = self._render_template(
+            "digest",
+            user_name=user.first_name or user.username,
+            total=len(entries),
+            entries=[
+                {
+                    "item_title": entry.get('item_title', 'Unknown Item'),
+                    "requester_name": entry.get('requester_name') or 'Someone',
+                    "swap_type": entry.get('swap_type'),
+                    "points_offered": entry.get('points_offered') or 0,
+                    "view_url": f"{base_url}/swaps/{entry.get('swap_id')}"
+                }
+                for entry in shown
+            ],
+            more_count=len(entries) - len(shown),
+            swaps_url=f"{base_url}/swaps"
+        )
+        
+        subject = f"🔄 You have {len(entries)} new swap request{'s' if len(entries) != 1 else ''} - ReWear"
+        
+        return await self.send_email_async(
+            to_email=user.email,
+            subject=subject,
+            html_content=html_content,
+            text_content=text_content,
+            event_type="digest"
         )
 
 
@@ -0,0 +1,203 @@
+# app/services/email_digest.py - Per-user notification email digests
+"""
+Low-priority notification emails (EMAIL_DIGEST_EVENT_TYPES, by default swap
+requests) are not sent one by one. Each is appended to the user's digest in
+Redis, and the first one opens a window of EMAIL_DIGEST_WINDOW_SECONDS; when
+the window closes the user gets one summary email for everything collected:
+
+    email:digest:u:{user_id}   list of JSON entries
+    email:digest:due           sorted set of user ids scored by window close
+
+Every other event type (acceptances, completions, welcome) is sent
+immediately. Any worker may flush a due digest; a Lua script takes and
+clears it atomically so it's sent once. If the contact lookup or the send
+fails, the taken entries are pushed back and retried after
+EMAIL_RETRY_BASE_SECONDS. Without Redis, emails are sent immediately as
+before.
+"""
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+import logging
+
+import redis.asyncio as aioredis
+
+from app.config import settings
+from app.services.email import email_service
+from app.services.user_contacts import user_contacts
+
+logger = logging.getLogger(__name__)
+
+# Pop up to ARGV[2] users whose window closed before ARGV[1], with their entries
+TAKE_DUE_SCRIPT = """
+local users = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local result = {}
+for _, user in ipairs(users) do
+    redis.call('ZREM', KEYS[1], user)
+    local key = ARGV[3] .. user
+    table.insert(result, user)
+    table.insert(result, redis.call('LRANGE', key, 0, -1))
+    redis.call('DEL', key)
+end
+return result
+"""
+
+
+class EmailDigestService:
+    """Collects digestible notification emails per user and sends one summary per window"""
+
+    DUE_KEY = "email:digest:due"
+    ENTRIES_PREFIX = "email:digest:u:"
+
+    def __init__(self):
+        self.redis: Optional[aioredis.Redis] = None
+        self._take_due = None
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "collected": 0,
+            "digests_sent": 0,
+            "digests_restored": 0,
+            "redis_errors": 0
+        }
+
+    def is_digestible(self, event_type: str) -> bool:
+        return self.redis is not None and event_type in settings.EMAIL_DIGEST_EVENT_TYPES
+
+    async def start(self):
+        if not (settings.EMAIL_DIGEST_ENABLED and settings.REDIS_URL):
+            return
+        try:
+            self.redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+            await self.redis.ping()
+        except Exception as e:
+            logger.warning(f"Email digests disabled, sending immediately: {e}")
+            self.redis = None
+            return
+        self._take_due = self.redis.register_script(TAKE_DUE_SCRIPT)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop flushing; open digests stay in Redis for whichever worker runs next"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+    async def add(self, user_id: int, event_type: str, entry: dict) -> bool:
+        """
+        Add an event to the user's digest. Returns False if it should be
+        emailed right away instead (high priority, or digests unavailable).
+        """
+        if not self.is_digestible(event_type):
+            return False
+
+        key = f"{self.ENTRIES_PREFIX}{user_id}"
+        window = settings.EMAIL_DIGEST_WINDOW_SECONDS
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, json.dumps({"type": event_type, "at": time.time(), **entry}))
+                # Outlives the window, in case no worker flushes for a while
+                pipe.expire(key, window * 2 + 3600)
+                # Only the first event of a window sets its closing time
+                pipe.zadd(self.DUE_KEY, {str(user_id): time.time() + window}, nx=True)
+                await pipe.execute()
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.error(f"Failed to add {event_type} to digest for user {user_id}: {e}")
+            return False
+
+        self.metrics["collected"] += 1
+        return True
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.EMAIL_DIGEST_FLUSH_INTERVAL)
+            try:
+                await self.flush_due()
+            except Exception as e:
+                self.metrics["redis_errors"] += 1
+                logger.error(f"Digest flush failed: {e}")
+
+    async def flush_due(self, limit: int = 100) -> int:
+        """Send digests whose window has closed; returns how many were sent"""
+        sent = 0
+        while True:
+            taken = await self._take_due(
+                keys=[self.DUE_KEY], args=[time.time(), limit, self.ENTRIES_PREFIX]
+            )
+            if not taken:
+                return sent
+
+            raw = {int(user_id): entries for user_id, entries in zip(taken[::2], taken[1::2]) if entries}
+            try:
+                contacts = await user_contacts.get_many(raw)
+            except Exception as e:
+                # Taken out of Redis already: put everything back for a later flush
+                logger.error(f"Digest contact lookup failed, retrying later: {e}")
+                await self._restore(raw)
+                return sent
+
+            failed = {}
+            for user_id, entries in raw.items():
+                user = contacts.get(user_id)
+                if user is None or not user.is_active:
+                    # Account deleted or deactivated since
+                    continue
+                try:
+                    delivered = await email_service.send_digest_email(user, [json.loads(entry) for entry in entries])
+                except Exception as e:
+                    logger.error(f"Digest for user {user_id} failed: {e}")
+                    delivered = False
+                if delivered:
+                    sent += 1
+                    self.metrics["digests_sent"] += 1
+                elif user.email:
+                    failed[user_id] = entries
+            if failed:
+                await self._restore(failed)
+
+            if len(taken) // 2 < limit:
+                return sent
+
+    async def _restore(self, digests: Dict[int, List[str]]):
+        """Put taken digest entries back, due again after EMAIL_RETRY_BASE_SECONDS"""
+        retry_at = time.time() + settings.EMAIL_RETRY_BASE_SECONDS
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for user_id, entries in digests.items():
+                    key = f"{self.ENTRIES_PREFIX}{user_id}"
+                    # Ahead of anything added since, so the digest stays in order
+                    pipe.lpush(key, *reversed(entries))
+                    pipe.expire(key, settings.EMAIL_DIGEST_WINDOW_SECONDS * 2 + 3600)
+                    # Keeps an earlier closing time if a new window opened meanwhile
+                    pipe.zadd(self.DUE_KEY, {str(user_id): retry_at}, lt=True)
+                await pipe.execute()
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.error(f"Failed to restore {len(digests)} digests, their entries are lost: {e}")
+            return
+        self.metrics["digests_restored"] += len(digests)
+
+    async def pending(self) -> int:
+        """Users with an open digest window"""
+        if self.redis is None:
+            return 0
+        return await self.redis.zcard(self.DUE_KEY)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.redis is not None,
+            "window_seconds": settings.EMAIL_DIGEST_WINDOW_SECONDS,
+            **self.metrics
+        }
+
+
+# Global email digest instance
+email_digest = EmailDigestService()
@@ -0,0 +1,345 @@
+# app/services/email_queue.py - Durable email queue in Redis
+"""
+Emails are rendered by the caller and appended to a Redis stream; that XADD
+is all a request/event handler waits for. Worker tasks read the stream
+through a consumer group and send via EmailService's SMTP pool:
+
+    email:queue    stream of ready jobs (consumer group "email-workers")
+    email:retry    sorted set of jobs waiting for their retry time (score)
+    email:dead     stream of jobs that failed permanently, kept for inspection
+
+A job is acknowledged in the same MULTI as its retry/dead-letter write, so it
+is never lost between the two. Jobs a crashed worker had read but not
+acknowledged are re-claimed after EMAIL_QUEUE_CLAIM_IDLE_SECONDS, which
+makes delivery at-least-once. Sends per recipient domain are capped with a
+per-minute counter shared by all workers; jobs over the cap are deferred to
+the next window without using up an attempt.
+
+Without Redis, EmailService sends directly in its thread pool as before.
+"""
+import asyncio
+import json
+import os
+import random
+import smtplib
+import socket
+import time
+import uuid
+from functools import partial
+from typing import List, Optional
+import logging
+
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from app.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Atomically move due retries back onto the stream
+PROMOTE_DUE_SCRIPT = """
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(jobs) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('XADD', KEYS[2], '*', 'job', job)
+end
+return #jobs
+"""
+
+# Count a send against a domain's per-minute window, unless the window is full
+TAKE_SEND_SLOT_SCRIPT = """
+local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+if count >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], 120)
+return 1
+"""
+
+# Keys every queued job carries (see enqueue)
+REQUIRED_JOB_FIELDS = {"to", "subject", "html", "text", "event_type", "attempts", "enqueued_at"}
+
+
+def is_permanent_failure(error: BaseException) -> bool:
+    """5xx replies won't succeed on retry; everything else (4xx, timeouts, drops) might"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+class EmailQueue:
+    """Redis stream backed email queue with a pool of sender tasks"""
+
+    STREAM = "email:queue"
+    GROUP = "email-workers"
+    RETRY_KEY = "email:retry"
+    DEAD_LETTER = "email:dead"
+    RATE_PREFIX = "email:rate:"
+
+    def __init__(self):
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self.redis: Optional[aioredis.Redis] = None
+        self._promote_due = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+        self.metrics = {
+            "enqueued": 0,
+            "sent": 0,
+            "retried": 0,
+            "rate_limited": 0,
+            "dead_lettered": 0,
+            "reclaimed": 0,
+            "redis_errors": 0
+        }
+
+    @property
+    def available(self) -> bool:
+        return self.redis is not None and self._running
+
+    async def start(self):
+        """Connect to Redis, create the consumer group and start the workers"""
+        if not (settings.EMAIL_QUEUE_ENABLED and settings.REDIS_URL):
+            return
+        try:
+            self.redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+            try:
+                await self.redis.xgroup_create(self.STREAM, self.GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        except Exception as e:
+            logger.warning(f"Email queue disabled, sending directly: {e}")
+            self.redis = None
+            return
+
+        self._promote_due = self.redis.register_script(PROMOTE_DUE_SCRIPT)
+        self._take_send_slot = self.redis.register_script(TAKE_SEND_SLOT_SCRIPT)
+        self._running = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(settings.EMAIL_QUEUE_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._scheduler()))
+
+    async def stop(self, timeout: float = 10.0):
+        """Let workers finish the email in hand (up to timeout), then disconnect"""
+        self._running = False
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            self._tasks = []
+
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+    async def enqueue(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None,
+        event_type: str = "email"
+    ) -> bool:
+        """Queue a rendered email; False if Redis is unavailable (caller should send directly)"""
+        if self.redis is None:
+            return False
+        job = {
+            "id": uuid.uuid4().hex,
+            "to": to_email,
+            "subject": subject,
+            "html": html_content,
+            "text": text_content,
+            "event_type": event_type,
+            "attempts": 0,
+            "enqueued_at": time.time()
+        }
+        try:
+            await self.redis.xadd(self.STREAM, {"job": json.dumps(job)})
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.error(f"Failed to queue email to {to_email}: {e}")
+            return False
+        self.metrics["enqueued"] += 1
+        return True
+
+    async def _worker(self):
+        while self._running:
+            try:
+                response = await self.redis.xreadgroup(
+                    self.GROUP, self.consumer, {self.STREAM: ">"}, count=1, block=1000
+                )
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        await self._process(entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics["redis_errors"] += 1
+                logger.error(f"Email worker error: {e}")
+                await asyncio.sleep(1)
+
+    async def _scheduler(self):
+        """Promote due retries every second; re-claim abandoned jobs every 30 seconds"""
+        last_reclaim = 0.0
+        while self._running:
+            try:
+                await self._promote_due(keys=[self.RETRY_KEY, self.STREAM], args=[time.time(), 100])
+                if time.monotonic() - last_reclaim > 30:
+                    last_reclaim = time.monotonic()
+                    await self._reclaim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics["redis_errors"] += 1
+                logger.error(f"Email scheduler error: {e}")
+            await asyncio.sleep(1)
+
+    async def _reclaim(self):
+        """Take over jobs read by a worker that never acknowledged them (crash, kill -9)"""
+        _, entries, *_ = await self.redis.xautoclaim(
+            self.STREAM, self.GROUP, self.consumer,
+            min_idle_time=settings.EMAIL_QUEUE_CLAIM_IDLE_SECONDS * 1000,
+            start_id="0-0", count=100
+        )
+        for entry_id, fields in entries:
+            if fields is None:
+                continue
+            self.metrics["reclaimed"] += 1
+            await self._process(entry_id, fields)
+
+    async def _process(self, entry_id: str, fields: dict):
+        try:
+            job = json.loads(fields["job"])
+            missing = REQUIRED_JOB_FIELDS - job.keys()
+            if missing:
+                raise ValueError(f"missing {', '.join(sorted(missing))}")
+            domain = job["to"].rsplit("@", 1)[-1].lower()
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            # Can never be sent; left unacknowledged it would be re-claimed forever
+            await self._dead_letter_malformed(entry_id, fields, e)
+            return
+
+        delay = await self._rate_limit_delay(domain)
+        if delay:
+            self.metrics["rate_limited"] += 1
+            await self._reschedule(entry_id, job, delay)
+            return
+
+        from app.services.email import email_service
+        # Queue time spans processes, so translate the wall-clock enqueue time
+        enqueued_at = time.perf_counter() - max(0.0, time.time() - job["enqueued_at"])
+        send = partial(
+            email_service._send_email_sync,
+            job["to"], job["subject"], job["html"], job["text"],
+            event_type=job["event_type"], enqueued_at=enqueued_at, raise_errors=True
+        )
+        try:
+            await asyncio.get_running_loop().run_in_executor(email_service.executor, send)
+        except Exception as e:
+            job["attempts"] += 1
+            job["last_error"] = str(e)
+            if is_permanent_failure(e) or job["attempts"] >= settings.EMAIL_MAX_ATTEMPTS:
+                await self._dead_letter(entry_id, job)
+            else:
+                delay = min(
+                    settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1),
+                    settings.EMAIL_RETRY_MAX_SECONDS
+                )
+                self.metrics["retried"] += 1
+                logger.warning(f"Email to {job['to']} failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {e}")
+                # Jitter so a provider outage doesn't end in a synchronized retry burst
+                await self._reschedule(entry_id, job, delay * random.uniform(0.8, 1.2))
+            return
+
+        self.metrics["sent"] += 1
+        await self._ack(entry_id)
+
+    async def _rate_limit_delay(self, domain: str) -> float:
+        """
+        Seconds until this domain may be sent to again (0 = send now).
+        Only sends are counted: a deferred job doesn't use up a slot, so a
+        burst's own retries can't keep the domain over its limit.
+        """
+        limit = settings.EMAIL_DOMAIN_RATE_OVERRIDES.get(domain, settings.EMAIL_DOMAIN_RATE_PER_MINUTE)
+        if not limit:
+            return 0.0
+        now = time.time()
+        window = int(now // 60)
+        key = f"{self.RATE_PREFIX}{domain}:{window}"
+        if await self._take_send_slot(keys=[key], args=[limit]):
+            return 0.0
+        # Spread deferred jobs over the start of the next window
+        return (window + 1) * 60 - now + random.uniform(0, 5)
+
+    async def _ack(self, entry_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.STREAM, self.GROUP, entry_id)
+            pipe.xdel(self.STREAM, entry_id)
+            await pipe.execute()
+
+    async def _reschedule(self, entry_id: str, job: dict, delay: float):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.RETRY_KEY, {json.dumps(job): time.time() + delay})
+            pipe.xack(self.STREAM, self.GROUP, entry_id)
+            pipe.xdel(self.STREAM, entry_id)
+            await pipe.execute()
+
+    async def _dead_letter(self, entry_id: str, job: dict):
+        self.metrics["dead_lettered"] += 1
+        metrics.inc("notification_deliveries_total", type=job["event_type"], channel="email", outcome="failed")
+        logger.error(f"Email to {job['to']} dead-lettered after {job['attempts']} attempts: {job['last_error']}")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(
+                self.DEAD_LETTER, {"job": json.dumps(job)},
+                maxlen=settings.EMAIL_DEAD_LETTER_MAXLEN, approximate=True
+            )
+            pipe.xack(self.STREAM, self.GROUP, entry_id)
+            pipe.xdel(self.STREAM, entry_id)
+            await pipe.execute()
+
+    async def _dead_letter_malformed(self, entry_id: str, fields: dict, error: Exception):
+        self.metrics["dead_lettered"] += 1
+        logger.error(f"Malformed email job {entry_id} dead-lettered: {error}")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(
+                self.DEAD_LETTER, {**fields, "error": f"malformed job: {error}"},
+                maxlen=settings.EMAIL_DEAD_LETTER_MAXLEN, approximate=True
+            )
+            pipe.xack(self.STREAM, self.GROUP, entry_id)
+            pipe.xdel(self.STREAM, entry_id)
+            await pipe.execute()
+
+    async def depths(self) -> dict:
+        """Ready, waiting-for-retry and dead-lettered job counts"""
+        if self.redis is None:
+            return {}
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.xlen(self.STREAM)
+                pipe.zcard(self.RETRY_KEY)
+                pipe.xlen(self.DEAD_LETTER)
+                ready, retrying, dead = await pipe.execute()
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.error(f"Email queue depth lookup failed: {e}")
+            return {}
+        return {"ready": ready, "retrying": retrying, "dead": dead}
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "redis" if self.redis is not None else "direct",
+            "workers": settings.EMAIL_QUEUE_WORKERS if self.available else 0,
+            **self.metrics
+        }
+
+
+# Global email queue instance
+email_queue = EmailQueue()
@@ -0,0 +1,98 @@
+# app/services/email_templates.py - Precompiled email templates and plain-text alternatives
+import html
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Tuple
+
+from jinja2 import DictLoader, Environment, Template
+
+
+class _TextExtractor(HTMLParser):
+    """Collects readable text from an HTML email, keeping paragraphs, list items and link targets"""
+
+    BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table", "tr", "blockquote"}
+    SKIP_TAGS = {"head", "style", "script", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+        self._links: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag == "a":
+            self._links.append(dict(attrs).get("href") or "")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif tag == "a" and self._links:
+            href = self._links.pop()
+            if href and not href.startswith("#"):
+                self.parts.append(f" ({href})")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            # Source indentation is not content
+            self.parts.append(re.sub(r"\s+", " ", data))
+
+
+_BLANK_LINES = re.compile(r"\n\s*\n(\s*\n)+")
+
+
+def html_to_text(content: str) -> str:
+    """Plain-text alternative for an HTML email"""
+    parser = _TextExtractor()
+    parser.feed(content)
+    parser.close()
+    text = html.unescape("".join(parser.parts))
+    lines = [line.strip() for line in text.splitlines()]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip() + "\n"
+
+
+class EmailTemplates:
+    """
+    Jinja environment holding every email template, compiled once.
+
+    Rendering a cached Template skips the lex/parse/compile that
+    `Template(source)` repeats on every call, which dominates the cost of
+    these small templates. HTML output is autoescaped, so item titles and
+    user messages can't inject markup into emails.
+
+    The plain-text alternative is its own template, derived from the HTML
+    source at startup (Jinja tags pass through html_to_text untouched), so
+    sends don't pay for HTML parsing.
+    """
+
+    def __init__(self, sources: Dict[str, str]):
+        self.env = Environment(
+            loader=DictLoader(sources),
+            autoescape=True,
+            # Sources never change at runtime: skip the up-to-date check per lookup
+            auto_reload=False,
+            cache_size=-1
+        )
+        self.text_env = Environment(autoescape=False, auto_reload=False, cache_size=-1, keep_trailing_newline=True)
+        self._templates: Dict[str, Template] = {
+            name: self.env.get_template(name) for name in sources
+        }
+        self._text_templates: Dict[str, Template] = {
+            name: self.text_env.from_string(html_to_text(source)) for name, source in sources.items()
+        }
+
+    def render(self, name: str, **context) -> Tuple[str, str]:
+        """Render a template; returns (html, text)"""
+        html_content = self._templates[name].render(**context)
+        # Blocks left out by {% if %} leave runs of blank lines behind
+        text_content = _BLANK_LINES.sub("\n\n", self._text_templates[name].render(**context))
+        return html_content, text_content
@@ -0,0 +1,189 @@
+# app/services/image_cache.py - Disk LRU cache for the on-demand image resize proxy
+"""
+GET /api/v1/upload/images/{filename}?w=320&fmt=webp resizes lazily: the
+first request renders the copy in the image worker processes and stores it
+under IMAGE_CACHE_DIR, later requests are served straight from disk.
+
+The cache is bounded by IMAGE_CACHE_MAX_BYTES. Entries are kept in LRU
+order in memory and persisted to an index file, so a restart keeps both the
+files and their recency; without an index the directory is rescanned by
+mtime. Concurrent requests for a copy that is still rendering wait on the
+same render (singleflight) instead of rendering it again.
+
+Each app worker process keeps its own index over the shared directory; a
+copy evicted by another worker is simply rendered again.
+"""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import logging
+
+from app.config import settings
+from app.services.image_processing import image_processor, resize_image_file
+
+logger = logging.getLogger(__name__)
+
+
+def snap_width(width: int) -> int:
+    """Round a requested width up to an allowed one, so clients can't fill the cache with every width"""
+    widths = sorted(settings.IMAGE_RESIZE_WIDTHS)
+    for allowed in widths:
+        if allowed >= width:
+            return allowed
+    return widths[-1]
+
+
+class ImageResizeCache:
+    """Size-bounded LRU of resized images on disk, with singleflight rendering"""
+
+    INDEX_FILE = "index.json"
+    INDEX_FLUSH_INTERVAL = 30  # Seconds between index writes while it has changes
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or settings.IMAGE_CACHE_DIR
+        self.max_bytes = max_bytes or settings.IMAGE_CACHE_MAX_BYTES
+        # key -> file size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._rendering: Dict[str, asyncio.Task] = {}
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0
+        }
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def load(self):
+        """Rebuild the LRU from the index file, or from the directory if there is none"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries.clear()
+        index_path = self.path(self.INDEX_FILE)
+        try:
+            with open(index_path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Image cache index unreadable, rescanning: {e}")
+            entries = None
+
+        if entries is None:
+            files = [
+                entry for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name != self.INDEX_FILE and not entry.name.endswith(".tmp")
+            ]
+            files.sort(key=lambda entry: entry.stat().st_mtime)
+            entries = [(entry.name, entry.stat().st_size) for entry in files]
+
+        for key, size in entries:
+            # Files deleted while we were down
+            if os.path.exists(self.path(key)):
+                self._entries[key] = size
+        self._bytes = sum(self._entries.values())
+        self._evict()
+        self._dirty = True
+
+    def save_index(self, entries: Optional[List[list]] = None):
+        """Write the index atomically (entries defaults to the current LRU order)"""
+        if entries is None:
+            entries = [[key, size] for key, size in self._entries.items()]
+        index_path = self.path(self.INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, separators=(",", ":"))
+        os.replace(tmp_path, index_path)
+
+    async def start(self):
+        if self._task is None:
+            await asyncio.to_thread(self.load)
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            self.save_index()
+        except OSError as e:
+            logger.error(f"Failed to save image cache index: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.INDEX_FLUSH_INTERVAL)
+            if not self._dirty:
+                continue
+            self._dirty = False
+            # Snapshot here; the LRU keeps changing while the thread writes
+            entries = [[key, size] for key, size in self._entries.items()]
+            try:
+                await asyncio.to_thread(self.save_index, entries)
+            except OSError as e:
+                self._dirty = True
+                logger.error(f"Failed to save image cache index: {e}")
+
+    async def get(self, source_path: str, width: Optional[int], ext: str) -> str:
+        """Path of source_path resized to width and encoded as ext, rendering it on a miss"""
+        key = f"{os.path.basename(source_path)}.{width or 'full'}.{ext}"
+        path = self.path(key)
+
+        if key in self._entries and os.path.exists(path):
+            self._entries.move_to_end(key)
+            self._dirty = True
+            self.metrics["hits"] += 1
+            return path
+
+        task = self._rendering.get(key)
+        if task is None:
+            self.metrics["misses"] += 1
+            task = asyncio.create_task(self._render(key, source_path, width, ext))
+            self._rendering[key] = task
+            task.add_done_callback(lambda _: self._rendering.pop(key, None))
+        else:
+            self.metrics["coalesced"] += 1
+        # Shielded: a client disconnecting doesn't abort a render others are waiting on
+        return await asyncio.shield(task)
+
+    async def _render(self, key: str, source_path: str, width: Optional[int], ext: str) -> str:
+        path = self.path(key)
+        size = await image_processor.submit(resize_image_file, source_path, path, width, ext)
+        self._bytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        self._dirty = True
+        self._evict()
+        return path
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.metrics["evictions"] += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to evict cached image {key}: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "rendering": len(self._rendering),
+            **self.metrics
+        }
+
+
+# Global image resize cache instance
+image_cache = ImageResizeCache()
@@ -0,0 +1,254 @@
+# app/services/image_processing.py - CPU-bound image work in a process pool
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import logging
+
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401  (registers the AVIF encoder with Pillow)
+except ImportError:
+    pillow_avif = None
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_DIMENSION = 2048  # Max width/height in pixels
+
+# Responsive variant encodings, best compression first:
+# extension -> (Pillow format, MIME type, save options)
+VARIANT_ENCODINGS = {
+    "avif": ("AVIF", "image/avif", {"quality": 60}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+Image.init()
+# Only formats this Pillow build can encode (AVIF needs pillow-avif-plugin)
+VARIANT_FORMATS = [ext for ext, (fmt, _, _) in VARIANT_ENCODINGS.items() if fmt in Image.SAVE]
+
+
+class ImageProcessingError(Exception):
+    """The upload isn't a usable image"""
+
+
+class ImageQueueFull(Exception):
+    """Too many images processing or waiting; the client should retry later"""
+
+
+def variant_path(path: str, width: int, ext: str) -> str:
+    """Path or URL of an image's variant: /uploads/abc.jpg -> /uploads/abc_480w.webp"""
+    stem, _ = os.path.splitext(path)
+    return f"{stem}_{width}w.{ext}"
+
+
+def variant_widths(source_width: int) -> List[int]:
+    """
+    Widths of the variants written for an image source_width pixels wide:
+    the IMAGE_VARIANT_WIDTHS below it, plus its own width unless it is wider
+    than all of them (then the largest variant is downscaled too)
+    """
+    widths = [width for width in settings.IMAGE_VARIANT_WIDTHS if width < source_width]
+    if source_width <= max(settings.IMAGE_VARIANT_WIDTHS):
+        widths.append(source_width)
+    return sorted(widths)
+
+
+def image_file_paths(file_path: str, widths: Optional[List[int]] = None) -> List[str]:
+    """
+    An uploaded image's file followed by every variant it may have; widths
+    are the ones recorded when it was processed (default IMAGE_VARIANT_WIDTHS)
+    """
+    if widths is None:
+        widths = settings.IMAGE_VARIANT_WIDTHS
+    return [file_path] + [
+        variant_path(file_path, width, ext)
+        for width in widths for ext in VARIANT_ENCODINGS
+    ]
+
+
+def remove_image_files(file_path: str, widths: Optional[List[int]] = None):
+    """Delete an uploaded image and its variants"""
+    for path in image_file_paths(file_path, widths):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def save_variants(img: Image.Image, file_path: str, widths: List[int]):
+    """
+    Write the responsive variants next to the image: one per width (see
+    variant_widths) and format in VARIANT_FORMATS. Images are never upscaled.
+    """
+    resized = img
+    # Largest first, each resized from the previous one: cheaper than from the full image
+    for width in sorted(widths, reverse=True):
+        if resized.width > width:
+            resized = resized.resize(
+                (width, max(1, round(resized.height * width / resized.width))),
+                Image.Resampling.LANCZOS
+            )
+        for ext in VARIANT_FORMATS:
+            fmt, _, options = VARIANT_ENCODINGS[ext]
+            resized.save(variant_path(file_path, width, ext), fmt, **options)
+
+
+def process_image_file(file_path: str) -> dict:
+    """
+    Decode, flatten to RGB, downscale and re-encode an uploaded image in
+    place, then write its responsive variants. Runs in a worker process;
+    returns the variants written ({"widths": [...], "formats": [...]}).
+    The files are removed if the image can't be processed.
+    """
+    widths = None
+    try:
+        # Open and process image
+        with Image.open(file_path) as img:
+            # Convert RGBA to RGB if needed
+            if img.mode in ('RGBA', 'LA', 'P'):
+                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+                img = rgb_img
+
+            # Resize if image is too large
+            if img.width > MAX_IMAGE_DIMENSION or img.height > MAX_IMAGE_DIMENSION:
+                # draft() lets the JPEG decoder downscale while decoding (no-op for other formats)
+                ratio = MAX_IMAGE_DIMENSION / max(img.width, img.height)
+                img.draft(img.mode, (int(img.width * ratio), int(img.height * ratio)))
+                img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
+
+            # Save optimized image
+            img.save(file_path, "JPEG", quality=85, optimize=True)
+
+            widths = variant_widths(img.width)
+            save_variants(img, file_path, widths)
+
+        return {"widths": widths, "formats": list(VARIANT_FORMATS)}
+    except Exception as e:
+        # Remove files if processing failed
+        remove_image_files(file_path, widths)
+        raise ImageProcessingError(str(e)) from None
+
+
+def resize_image_file(source_path: str, dest_path: str, width: Optional[int], ext: str) -> int:
+    """
+    Write a copy of an image no wider than width, encoded as ext, for the
+    resize proxy. Runs in a worker process; returns the new file's size.
+    """
+    fmt, _, options = VARIANT_ENCODINGS[ext]
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    try:
+        with Image.open(source_path) as img:
+            if width and img.width > width:
+                size = (width, max(1, round(img.height * width / img.width)))
+                img.draft("RGB", size)
+                img = img.resize(size, Image.Resampling.LANCZOS)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(tmp_path, fmt, **options)
+        # Readers never see a partly written file
+        os.replace(tmp_path, dest_path)
+        return os.path.getsize(dest_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise ImageProcessingError(str(e)) from None
+
+
+def responsive_image(image_url: str, variants: Optional[dict]) -> Optional[dict]:
+    """
+    srcset-style description of an image's variants (as returned by
+    process_image_file), for a <picture> element: {"src": ...,
+    "sources": [{"type", "srcset"}, ...]} with the best-compressed format
+    first. None when the image has no variants.
+    """
+    if not variants or not variants.get("widths"):
+        return None
+    widths = sorted(variants["widths"])
+    sources = [
+        {
+            "type": VARIANT_ENCODINGS[ext][1],
+            "srcset": ", ".join(f"{variant_path(image_url, width, ext)} {width}w" for width in widths)
+        }
+        for ext in VARIANT_ENCODINGS if ext in variants.get("formats", ())
+    ]
+    if not sources:
+        return None
+    return {"src": image_url, "sources": sources}
+
+
+class ImageProcessor:
+    """
+    Runs image processing in worker processes, so decoding and encoding use
+    every core instead of holding a request thread and the GIL.
+
+    At most IMAGE_QUEUE_DEPTH images may be processing or waiting; beyond
+    that submit() raises ImageQueueFull rather than letting uploads pile up
+    (each waiting upload holds its file on disk and a client connection).
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_depth: Optional[int] = None):
+        self.workers = workers or settings.IMAGE_PROCESS_WORKERS or os.cpu_count() or 1
+        self.queue_depth = queue_depth or settings.IMAGE_QUEUE_DEPTH
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self.metrics = {
+            "processed": 0,
+            "failed": 0,
+            "rejected": 0
+        }
+
+    def start(self):
+        if self._executor is None:
+            # spawn: forking a process that's running threads (uvicorn, thread pools) can deadlock
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            # Workers are spawned on demand; start them now so the first uploads don't wait
+            for _ in range(self.workers):
+                self._executor.submit(os.getpid)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, func, *args):
+        """Run func(*args) in a worker process"""
+        if self._in_flight >= self.queue_depth:
+            self.metrics["rejected"] += 1
+            raise ImageQueueFull(f"{self._in_flight} images already processing")
+        if self._executor is None:
+            self.start()
+
+        self._in_flight += 1
+        try:
+            result = await asyncio.wrap_future(self._executor.submit(func, *args))
+        except ImageProcessingError:
+            self.metrics["failed"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        self.metrics["processed"] += 1
+        return result
+
+    async def process(self, file_path: str) -> dict:
+        return await self.submit(process_image_file, file_path)
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            **self.metrics
+        }
+
+
+# Global image processor instance
+image_processor = ImageProcessor()
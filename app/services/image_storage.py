@@ -0,0 +1,266 @@
+# app/services/image_storage.py - Content-addressed storage for uploaded images
+"""
+Each distinct upload is stored once under UPLOAD_DIR, named by the SHA-256
+of the uploaded bytes and sharded two directory levels deep so no directory
+grows past a few thousand entries:
+
+    uploads/ab/cd/abcd1234....jpg      (and its _160w.webp etc. variants)
+
+Re-uploading the same photo (relisting an item) reuses the stored files:
+no processing, no new files. A StoredImage row counts the listings using
+it: attach() and detach() change the count in the same transaction as the
+item, and once it commits delete_released() removes images no listing uses
+any more. Withdrawn and rejected listings release their images too, but
+those are left for the upload GC to delete after its grace period, so a
+mistaken rejection can still be approved.
+
+Images uploaded before this live flat in UPLOAD_DIR under uuid names; their
+/uploads/ URLs keep working and the upload GC removes them once unused.
+"""
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+import logging
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Item, StoredImage
+from app.services.image_processing import image_file_paths, image_processor, remove_image_files, responsive_image
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_URL_PREFIX = "/uploads/"
+
+# Item statuses whose listings no longer use their images
+RELEASED_ITEM_STATUSES = ["withdrawn", "rejected"]
+
+
+def shard_path(content_hash: str) -> str:
+    """Storage path of a content hash, relative to UPLOAD_DIR"""
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.jpg"
+
+
+def upload_url(relative_path: str) -> str:
+    return f"{UPLOADS_URL_PREFIX}{relative_path}"
+
+
+def relative_upload_path(path: str) -> Optional[str]:
+    """Normalized path under UPLOAD_DIR, or None if it would leave it"""
+    relative = os.path.normpath(path)
+    if os.path.isabs(relative) or relative.startswith("."):
+        return None
+    return relative
+
+
+def holds_images(item: Item) -> bool:
+    """Whether an item's images count as in use (withdrawn/inactive and rejected items release them)"""
+    return bool(item.is_active) and item.status not in RELEASED_ITEM_STATUSES
+
+
+def variant_widths_of(image: Optional[StoredImage]) -> Optional[List[int]]:
+    """Variant widths recorded for a stored image (None: the IMAGE_VARIANT_WIDTHS default)"""
+    if image is None or not image.variants:
+        return None
+    return image.variants.get("widths")
+
+
+class ImageStore:
+    """Deduplicating, reference-counted image storage"""
+
+    PENDING_ATTACH_SECONDS = 3600  # A re-upload is attached within its request; this covers slow ones and clock skew
+
+    def __init__(self):
+        self.metrics = {
+            "stored": 0,
+            "deduplicated": 0,
+            "released": 0,
+            "deleted": 0
+        }
+
+    def full_path(self, relative_path: str) -> str:
+        return os.path.join(settings.UPLOAD_DIR, relative_path)
+
+    async def ingest(self, incoming_path: str, content_hash: str) -> str:
+        """
+        Store a validated upload and return its URL; incoming_path is
+        consumed either way. Nothing is counted until a listing attaches
+        the URL. Raises ImageQueueFull / ImageProcessingError from processing.
+        """
+        variants = None
+        try:
+            relative = await asyncio.to_thread(self._touch_existing, content_hash)
+            if relative is not None:
+                self.metrics["deduplicated"] += 1
+                return upload_url(relative)
+
+            variants = await image_processor.process(incoming_path)
+            relative = await asyncio.to_thread(self._store_new, content_hash, incoming_path, variants)
+            self.metrics["stored"] += 1
+            return upload_url(relative)
+        finally:
+            remove_image_files(incoming_path, variants["widths"] if variants else None)
+
+    def _touch_existing(self, content_hash: str) -> Optional[str]:
+        """
+        Path of already stored content, marked as just uploaded so it isn't
+        deleted before the listing attaches it; None if it isn't stored
+        """
+        db = SessionLocal()
+        try:
+            image = db.query(StoredImage).filter(StoredImage.content_hash == content_hash).first()
+            if image is None or not os.path.exists(self.full_path(image.path)):
+                return None
+            # No row if it was deleted in the meantime
+            updated = db.query(StoredImage).filter(StoredImage.id == image.id).update({
+                "last_referenced_at": func.now()
+            }, synchronize_session=False)
+            db.commit()
+            return image.path if updated else None
+        finally:
+            db.close()
+
+    def _store_new(self, content_hash: str, processed_path: str, variants: dict) -> str:
+        """Move a processed upload and its variants into place and record it"""
+        relative = shard_path(content_hash)
+        destination = self.full_path(relative)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        widths = variants["widths"]
+        # Variants first: the main file appearing means the set is complete
+        for source, target in reversed(list(zip(image_file_paths(processed_path, widths), image_file_paths(destination, widths)))):
+            if os.path.exists(source):
+                os.replace(source, target)
+
+        db = SessionLocal()
+        try:
+            db.add(StoredImage(
+                content_hash=content_hash,
+                path=relative,
+                size=os.path.getsize(destination),
+                variants=variants,
+                ref_count=0
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                # The same content was stored concurrently (or its row outlived its files)
+                db.rollback()
+                db.query(StoredImage).filter(StoredImage.content_hash == content_hash).update({
+                    "last_referenced_at": func.now()
+                }, synchronize_session=False)
+                db.commit()
+        finally:
+            db.close()
+        return relative
+
+    def _stored_paths(self, image_urls: Iterable[Optional[str]]) -> Counter:
+        """Paths under UPLOAD_DIR of uploaded image URLs, with how often each occurs"""
+        paths = Counter()
+        for image_url in image_urls:
+            if image_url and image_url.startswith(UPLOADS_URL_PREFIX):
+                relative = relative_upload_path(image_url[len(UPLOADS_URL_PREFIX):])
+                if relative is not None:
+                    paths[relative] += 1
+        return paths
+
+    def attach(self, db: Session, image_urls: Iterable[Optional[str]]):
+        """Count a listing's use of images; part of the caller's transaction"""
+        for relative, count in self._stored_paths(image_urls).items():
+            db.query(StoredImage).filter(StoredImage.path == relative).update({
+                "ref_count": StoredImage.ref_count + count
+            }, synchronize_session=False)
+
+    def detach(self, db: Session, image_urls: Iterable[Optional[str]]) -> List[str]:
+        """
+        Drop a listing's use of images; part of the caller's transaction.
+        Returns the paths no listing uses any more: pass them to
+        delete_released once the transaction has committed.
+        """
+        paths = self._stored_paths(image_urls)
+        if not paths:
+            return []
+        released = []
+        images = (
+            db.query(StoredImage)
+            .filter(StoredImage.path.in_(list(paths)))
+            .order_by(StoredImage.id)  # Same lock order for every caller
+            .with_for_update()
+            .all()
+        )
+        for image in images:
+            image.ref_count = max(0, image.ref_count - paths[image.path])
+            self.metrics["released"] += 1
+            if image.ref_count == 0:
+                released.append(image.path)
+        return released
+
+    def delete_released(self, relative_paths: List[str]) -> int:
+        """
+        Delete images returned by detach (after its transaction committed)
+        that are still unused and weren't uploaded again in the last
+        PENDING_ATTACH_SECONDS; returns how many were deleted
+        """
+        uploaded_before = datetime.now(timezone.utc) - timedelta(seconds=self.PENDING_ATTACH_SECONDS)
+        deleted = 0
+        db = SessionLocal()
+        try:
+            for relative in relative_paths:
+                image = db.query(StoredImage).filter(StoredImage.path == relative).with_for_update().first()
+                if image is None or image.ref_count > 0 or image.last_referenced_at > uploaded_before:
+                    # Attached again, or uploaded again and about to be
+                    db.rollback()
+                    continue
+                # Deleted under the row lock, so a concurrent re-upload can't pick
+                # up files on their way out (it stores them afresh instead)
+                remove_image_files(self.full_path(relative), variant_widths_of(image))
+                db.delete(image)
+                db.commit()
+                deleted += 1
+                self.metrics["deleted"] += 1
+        finally:
+            db.close()
+        return deleted
+
+    def delete_unreferenced(self, relative_path: str, referenced_before: datetime) -> bool:
+        """
+        Delete an image no listing uses (found by the upload GC), unless a
+        listing attached it or it was uploaded again since the GC looked;
+        True if deleted
+        """
+        db = SessionLocal()
+        try:
+            image = db.query(StoredImage).filter(StoredImage.path == relative_path).with_for_update().first()
+            if image is not None and (image.ref_count > 0 or image.last_referenced_at > referenced_before):
+                # Attached since the scan (e.g. a rejected item approved again), or
+                # just handed out and probably not attached to its listing yet
+                return False
+            remove_image_files(self.full_path(relative_path), variant_widths_of(image))
+            if image is not None:
+                db.delete(image)
+                db.commit()
+            self.metrics["deleted"] += 1
+            return True
+        finally:
+            db.close()
+
+    def responsive_variants(self, db: Session, image_url: Optional[str]) -> Optional[dict]:
+        """srcset description of an uploaded image, from the variants recorded for it"""
+        if not image_url or not image_url.startswith(UPLOADS_URL_PREFIX):
+            return None
+        relative = relative_upload_path(image_url[len(UPLOADS_URL_PREFIX):])
+        if relative is None:
+            return None
+        variants = db.query(StoredImage.variants).filter(StoredImage.path == relative).scalar()
+        return responsive_image(image_url, variants)
+
+    def get_stats(self) -> dict:
+        return dict(self.metrics)
+
+
+# Global image store instance
+image_store = ImageStore()
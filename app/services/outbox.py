@@ -0,0 +1,211 @@
+# app/services/outbox.py - Transactional outbox and its relay
+"""
+Routes add events to the session before committing, so the event exists if
+and only if the change does:
+
+    db.add(swap)
+    db.flush()                                  # assigns swap.id
+    add_outbox_event(db, SwapCreated(swap_id=swap.id, ...))
+    db.commit()
+    outbox_relay.wake()
+
+The relay claims due rows with FOR UPDATE SKIP LOCKED (several workers can
+run it side by side), leases them by pushing available_at forward, dispatches
+them to the event bus subscribers and marks them done. A crash mid-dispatch
+just lets the lease lapse and the row is claimed again: delivery is
+at-least-once, so handlers must tolerate the occasional duplicate.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.events import DomainEvent, event_bus, event_from_payload, event_to_payload
+from app.database import SessionLocal
+from app.models import OutboxEvent, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+# (id, event_type, payload, attempts)
+ClaimedRow = Tuple[int, str, dict, int]
+
+
+def add_outbox_event(db: Session, event: DomainEvent) -> OutboxEvent:
+    """Stage an event in the caller's transaction (committed with it)"""
+    row = OutboxEvent(
+        event_type=type(event).__name__,
+        payload=event_to_payload(event),
+        status=OutboxStatus.PENDING.value,
+        attempts=0
+    )
+    db.add(row)
+    return row
+
+
+class OutboxRelay:
+    """Background task moving committed outbox rows to the event subscribers"""
+
+    def __init__(self):
+        self.batch_size = settings.OUTBOX_BATCH_SIZE
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.metrics = {
+            "batches": 0,
+            "dispatched": 0,
+            "retried": 0,
+            "failed": 0,
+            "purged": 0,
+            "last_batch_ms": 0.0
+        }
+
+    def wake(self):
+        """Skip the poll wait: a route just committed new events"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self.relay_once()
+                if time.monotonic() - self._last_purge > 60:
+                    self._last_purge = time.monotonic()
+                    self.metrics["purged"] += await asyncio.to_thread(self._purge)
+            except Exception as e:
+                logger.error(f"Outbox relay error: {e}")
+                claimed = 0
+
+            # A full batch means more rows are probably waiting
+            if claimed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def relay_once(self) -> int:
+        """Claim, dispatch and settle one batch; returns the number of rows claimed"""
+        rows = await asyncio.to_thread(self._claim_batch)
+        if not rows:
+            return 0
+
+        started = time.perf_counter()
+        limit = asyncio.Semaphore(settings.EVENT_BUS_WORKERS)
+
+        async def deliver(row: ClaimedRow) -> Optional[str]:
+            row_id, event_type, payload, _ = row
+            async with limit:
+                try:
+                    event = event_from_payload(event_type, payload)
+                except (KeyError, TypeError) as e:
+                    return f"Undecodable event: {e}"
+                if not await event_bus.dispatch(event):
+                    return "One or more handlers failed"
+            return None
+
+        errors = await asyncio.gather(*(deliver(row) for row in rows))
+        done = [row[0] for row, error in zip(rows, errors) if error is None]
+        failed = [(row[0], row[3], error) for row, error in zip(rows, errors) if error is not None]
+        await asyncio.to_thread(self._settle, done, failed)
+
+        self.metrics["batches"] += 1
+        self.metrics["dispatched"] += len(done)
+        self.metrics["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return len(rows)
+
+    def _claim_batch(self) -> List[ClaimedRow]:
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            rows = (
+                db.query(OutboxEvent)
+                .filter(
+                    OutboxEvent.status == OutboxStatus.PENDING.value,
+                    OutboxEvent.available_at <= now
+                )
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            lease_until = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            claimed = []
+            for row in rows:
+                row.available_at = lease_until
+                row.attempts += 1
+                claimed.append((row.id, row.event_type, row.payload, row.attempts))
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _settle(self, done: List[int], failed: List[Tuple[int, int, str]]):
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            if done:
+                db.query(OutboxEvent).filter(OutboxEvent.id.in_(done)).update(
+                    {"status": OutboxStatus.DONE.value, "processed_at": now},
+                    synchronize_session=False
+                )
+            for row_id, attempts, error in failed:
+                values = {"last_error": error}
+                if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    values.update(status=OutboxStatus.FAILED.value, processed_at=now)
+                    self.metrics["failed"] += 1
+                    logger.error(f"Outbox event {row_id} failed permanently: {error}")
+                else:
+                    # Exponential backoff, capped at one hour
+                    delay = min(settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 3600)
+                    values["available_at"] = now + timedelta(seconds=delay)
+                    self.metrics["retried"] += 1
+                db.query(OutboxEvent).filter(OutboxEvent.id == row_id).update(
+                    values, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def _purge(self, limit: int = 5000) -> int:
+        """Delete dispatched rows past the retention window (failed rows are kept)"""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+            expired = (
+                select(OutboxEvent.id)
+                .where(OutboxEvent.status == OutboxStatus.DONE.value, OutboxEvent.processed_at < cutoff)
+                .limit(limit)
+            )
+            deleted = db.query(OutboxEvent).filter(OutboxEvent.id.in_(expired)).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            **self.metrics
+        }
+
+
+# Global outbox relay instance
+outbox_relay = OutboxRelay()
@@ -0,0 +1,180 @@
+# app/services/presence.py - Cross-worker presence tracking in Redis
+import asyncio
+import os
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Set
+import logging
+
+import redis.asyncio as aioredis
+
+from app.config import settings
+from app.core.websockets import manager
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceService:
+    """
+    Tracks which users have a live notification connection on any worker.
+
+    Each user has a Redis hash `presence:u:{user_id}` mapping worker id to the
+    time that worker's claim expires. Workers refresh claims for their own
+    users periodically, so a crashed worker's claims simply lapse. Lookups are
+    one pipelined HVALS per queried user: O(k) regardless of total users.
+    Without Redis every answer falls back to this worker's connections.
+    """
+
+    KEY_PREFIX = "presence:u:"
+
+    def __init__(self):
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.redis: Optional[aioredis.Redis] = None
+        # Pending state changes, written in one pipeline per flush interval
+        self._changes: Dict[int, bool] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.metrics = {
+            "flushes": 0,
+            "refreshes": 0,
+            "redis_errors": 0
+        }
+        manager.presence_listeners.append(self)
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+
+    # Connection manager callbacks (sync, so they only record the change)
+    def user_online(self, user_id: int):
+        self._changes[user_id] = True
+
+    def user_offline(self, user_id: int):
+        self._changes[user_id] = False
+
+    async def start(self):
+        """Connect to Redis and start the flush/refresh loops"""
+        if settings.REDIS_URL:
+            try:
+                self.redis = aioredis.from_url(settings.REDIS_URL)
+                await self.redis.ping()
+            except Exception as e:
+                logger.warning(f"Presence falling back to local connections, Redis unavailable: {e}")
+                self.redis = None
+
+        if self.redis is not None:
+            self._tasks = [
+                asyncio.create_task(self._flush_loop()),
+                asyncio.create_task(self._refresh_loop())
+            ]
+
+    async def stop(self):
+        """Stop background loops and withdraw this worker's claims"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+        if self.redis is not None:
+            self._changes = {user_id: False for user_id in manager.get_connected_users()}
+            await self.flush()
+            await self.redis.close()
+            self.redis = None
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_REFRESH_INTERVAL)
+            await self.refresh()
+
+    async def flush(self):
+        """Write pending online/offline changes in a single pipeline"""
+        if not self._changes or self.redis is None:
+            return
+
+        changes, self._changes = self._changes, {}
+        expires_at = int(time.time()) + settings.PRESENCE_TTL
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id, online in changes.items():
+                    key = self._key(user_id)
+                    if online:
+                        pipe.hset(key, self.node_id, expires_at)
+                        pipe.expire(key, settings.PRESENCE_TTL)
+                    else:
+                        pipe.hdel(key, self.node_id)
+                await pipe.execute()
+            self.metrics["flushes"] += 1
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.error(f"Presence flush failed: {e}")
+
+    async def refresh(self, chunk_size: int = 1000):
+        """Extend this worker's claims for every locally connected user"""
+        if self.redis is None:
+            return
+
+        user_ids = manager.get_connected_users()
+        expires_at = int(time.time()) + settings.PRESENCE_TTL
+        try:
+            for start in range(0, len(user_ids), chunk_size):
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for user_id in user_ids[start:start + chunk_size]:
+                        key = self._key(user_id)
+                        pipe.hset(key, self.node_id, expires_at)
+                        pipe.expire(key, settings.PRESENCE_TTL)
+                    await pipe.execute()
+            self.metrics["refreshes"] += 1
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.error(f"Presence refresh failed: {e}")
+
+    async def online_among(self, user_ids: Iterable[int]) -> Set[int]:
+        """Return the subset of user_ids with a live connection on any worker"""
+        user_ids = list(dict.fromkeys(user_ids))
+        # Local connections answer without a round trip
+        online = {user_id for user_id in user_ids if manager.is_user_online(user_id)}
+        remaining = [user_id for user_id in user_ids if user_id not in online]
+
+        if not remaining or self.redis is None:
+            return online
+
+        now = time.time()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id in remaining:
+                    pipe.hvals(self._key(user_id))
+                claims = await pipe.execute()
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.error(f"Presence lookup failed: {e}")
+            return online
+
+        for user_id, expiries in zip(remaining, claims):
+            # Ignore claims left behind by workers that stopped refreshing
+            if any(int(expiry) > now for expiry in expiries):
+                online.add(user_id)
+
+        return online
+
+    async def is_online(self, user_id: int) -> bool:
+        """Check if a user is connected to any worker"""
+        return user_id in await self.online_among([user_id])
+
+    def get_stats(self) -> dict:
+        return {
+            "node_id": self.node_id,
+            "backend": "redis" if self.redis is not None else "local",
+            "pending_changes": len(self._changes),
+            **self.metrics
+        }
+
+
+# Global presence service instance
+presence_service = PresenceService()
@@ -0,0 +1,201 @@
+# app/services/resumable_uploads.py - Sessions for tus-style resumable uploads
+"""
+A resumable upload is a session created with the total length, then filled
+by any number of PATCH requests, each appending at the offset the client
+last saw acknowledged. A dropped connection loses only the chunk in flight:
+the client asks for the current offset (HEAD) and continues from there.
+
+Each session is two files under UPLOAD_INCOMING_DIR/resumable, so any app
+worker can serve any request of a session:
+
+    {id}.json    owner, declared length, filename, created_at
+    {id}.part    the bytes received so far (its size is the offset)
+
+Chunks are streamed to disk as they arrive, so memory use doesn't depend on
+the file size. Sessions not written to for RESUMABLE_UPLOAD_EXPIRY_SECONDS
+are deleted by a periodic cleanup.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import re
+import time
+import uuid
+from typing import AsyncIterator, Optional
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadConflict(Exception):
+    """PATCH at the wrong offset, or while another PATCH of the session is running"""
+
+
+class UploadTooLarge(Exception):
+    """More bytes sent than the session's declared length"""
+
+
+class UploadSession:
+    """Metadata of a resumable upload"""
+    __slots__ = ("id", "user_id", "length", "filename", "created_at")
+
+    def __init__(self, id: str, user_id: int, length: int, filename: str, created_at: float):
+        self.id = id
+        self.user_id = user_id
+        self.length = length
+        self.filename = filename
+        self.created_at = created_at
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ResumableUploadStore:
+    """Resumable upload sessions on disk, with cleanup of abandoned ones"""
+
+    CLEANUP_INTERVAL = 600  # Seconds between stale session sweeps
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(settings.UPLOAD_INCOMING_DIR, "resumable")
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "created": 0,
+            "completed": 0,
+            "bytes_received": 0,
+            "expired": 0
+        }
+
+    def _path(self, upload_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}{suffix}")
+
+    def part_path(self, upload_id: str) -> str:
+        return self._path(upload_id, ".part")
+
+    def create(self, user_id: int, length: int, filename: str) -> UploadSession:
+        os.makedirs(self.directory, exist_ok=True)
+        session = UploadSession(uuid.uuid4().hex, user_id, length, filename, time.time())
+        open(self.part_path(session.id), "wb").close()
+        with open(self._path(session.id, ".json"), "w") as f:
+            json.dump(session.to_dict(), f)
+        self.metrics["created"] += 1
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            return None
+        try:
+            with open(self._path(upload_id, ".json")) as f:
+                return UploadSession(**json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def offset(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self.part_path(upload_id))
+        except FileNotFoundError:
+            return 0
+
+    def expires_at(self, upload_id: str) -> float:
+        """When the session is deleted unless written to again"""
+        try:
+            last_write = os.path.getmtime(self.part_path(upload_id))
+        except FileNotFoundError:
+            last_write = time.time()
+        return last_write + settings.RESUMABLE_UPLOAD_EXPIRY_SECONDS
+
+    async def append(self, session: UploadSession, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Append a request body at offset, chunk by chunk; returns the new
+        offset. Whatever was written before an error (a dropped
+        connection) is kept, so the client can resume after it.
+        """
+        buffer = open(self.part_path(session.id), "ab")
+        try:
+            try:
+                # One writer per session; a second concurrent PATCH is refused, not interleaved
+                fcntl.flock(buffer.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict("Another request is writing to this upload")
+
+            current = os.fstat(buffer.fileno()).st_size
+            if offset != current:
+                raise UploadConflict(f"Upload-Offset is {offset}, expected {current}")
+
+            async for chunk in chunks:
+                if current + len(chunk) > session.length:
+                    raise UploadTooLarge(f"Upload exceeds its declared length of {session.length} bytes")
+                await asyncio.to_thread(buffer.write, chunk)
+                current += len(chunk)
+                self.metrics["bytes_received"] += len(chunk)
+            return current
+        finally:
+            buffer.close()
+
+    def take(self, session: UploadSession, destination: str):
+        """Move a complete upload's file to destination and end the session"""
+        os.replace(self.part_path(session.id), destination)
+        self.delete(session.id)
+        self.metrics["completed"] += 1
+
+    def delete(self, upload_id: str):
+        for suffix in (".json", ".part"):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def cleanup_stale(self) -> int:
+        """Delete sessions past their expiry; returns how many"""
+        if not os.path.isdir(self.directory):
+            return 0
+        cutoff = time.time() - settings.RESUMABLE_UPLOAD_EXPIRY_SECONDS
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                upload_id, suffix = os.path.splitext(entry.name)
+                # Sessions are keyed by their .part; a lone .json means creation was cut short
+                if suffix == ".json" and os.path.exists(self.part_path(upload_id)):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        self.delete(upload_id)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        self.metrics["expired"] += removed
+        return removed
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.cleanup_stale)
+                if removed:
+                    logger.info(f"Removed {removed} stale resumable uploads")
+            except Exception as e:
+                logger.error(f"Resumable upload cleanup failed: {e}")
+            await asyncio.sleep(self.CLEANUP_INTERVAL)
+
+    def get_stats(self) -> dict:
+        return dict(self.metrics)
+
+
+# Global resumable upload store instance
+resumable_uploads = ResumableUploadStore()
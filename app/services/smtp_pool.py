@@ -0,0 +1,192 @@
+# app/services/smtp_pool.py - Reusable authenticated SMTP connections
+import smtplib
+import ssl
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, List, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    True if the session is unusable (dropped, timed out, reset). SMTP replies
+    like a refused recipient leave the session fine; note SMTPException is
+    itself an OSError, so it has to be told apart explicitly.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class PooledSMTP:
+    """An open SMTP session plus the bookkeeping the pool needs"""
+    __slots__ = ("smtp", "last_used", "messages_sent")
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.messages_sent = 0
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of connected, STARTTLS'd and logged-in SMTP sessions.
+
+    Sends reuse an idle session instead of paying connect + EHLO + STARTTLS +
+    AUTH per message. Sessions idle longer than `idle_timeout` are closed
+    (servers drop them anyway); sessions idle longer than
+    `healthcheck_after` are checked with NOOP before use. A session that
+    fails mid-send is discarded and the message retried once on a fresh one.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: bool = True,
+        max_size: int = 3,
+        idle_timeout: float = 60.0,
+        healthcheck_after: float = 10.0,
+        max_messages: int = 100,
+        timeout: float = 30.0
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.healthcheck_after = healthcheck_after
+        self.max_messages = max_messages
+        self.timeout = timeout
+
+        self._idle: Deque[PooledSMTP] = deque()
+        self._lock = threading.Lock()
+        # Bounds open sessions (idle + in use)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._ssl_context = ssl.create_default_context() if use_tls else None
+        self.metrics = {
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "connections_closed": 0,
+            "healthchecks_failed": 0,
+            "send_retries": 0,
+            "messages_sent": 0
+        }
+
+    def _open(self) -> PooledSMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.use_tls:
+                smtp.starttls(context=self._ssl_context)
+                smtp.ehlo()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            self._quietly_close(smtp)
+            raise
+        self.metrics["connections_opened"] += 1
+        return PooledSMTP(smtp)
+
+    def _quietly_close(self, smtp: smtplib.SMTP):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _discard(self, connection: PooledSMTP):
+        self.metrics["connections_closed"] += 1
+        self._quietly_close(connection.smtp)
+
+    def _is_usable(self, connection: PooledSMTP) -> bool:
+        idle = time.monotonic() - connection.last_used
+        if idle > self.idle_timeout or connection.messages_sent >= self.max_messages:
+            return False
+        if idle > self.healthcheck_after:
+            try:
+                code, _ = connection.smtp.noop()
+            except OSError:
+                code = 0
+            if code != 250:
+                self.metrics["healthchecks_failed"] += 1
+                return False
+        return True
+
+    def _checkout(self) -> PooledSMTP:
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._open()
+            if self._is_usable(connection):
+                self.metrics["connections_reused"] += 1
+                return connection
+            self._discard(connection)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a session; it goes back to the pool unless the block raised a connection error"""
+        self._slots.acquire()
+        try:
+            connection = self._checkout()
+            try:
+                yield connection.smtp
+            except Exception as e:
+                if is_connection_error(e):
+                    self._discard(connection)
+                    raise
+                # SMTP-level rejection (bad recipient etc.): reset and keep the session
+                try:
+                    connection.smtp.rset()
+                except OSError:
+                    self._discard(connection)
+                    raise e
+                connection.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(connection)
+                raise
+            else:
+                connection.last_used = time.monotonic()
+                connection.messages_sent += 1
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def send(self, from_addr: str, to_addrs: Union[str, List[str]], message: Union[str, bytes]) -> dict:
+        """sendmail() on a pooled session; retried once if the session had gone stale"""
+        for attempt in range(2):
+            try:
+                with self.connection() as smtp:
+                    refused = smtp.sendmail(from_addr, to_addrs, message)
+                self.metrics["messages_sent"] += 1
+                return refused
+            except OSError as e:
+                if attempt or not is_connection_error(e):
+                    raise
+                self.metrics["send_retries"] += 1
+                logger.warning(f"SMTP session to {self.host} dropped, retrying on a new connection")
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._discard(connection)
+
+    def get_stats(self) -> dict:
+        return {
+            "idle": len(self._idle),
+            "max_size": self.max_size,
+            **self.metrics
+        }
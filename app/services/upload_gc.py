@@ -0,0 +1,277 @@
+# app/services/upload_gc.py - Garbage collection of uploaded images no listing uses
+"""
+Images uploaded but never attached to an item, or left behind by items
+that were withdrawn or rejected, would otherwise stay on disk forever.
+Each sweep:
+
+  1. builds the set of referenced images from a keyset scan of items
+     (image_urls, primary_image_url) and users (profile_image_url);
+     withdrawn and rejected items stop counting UPLOAD_GC_GRACE_SECONDS
+     after their last update, so a mistaken rejection can still be undone
+  2. streams UPLOAD_DIR (flat legacy files and ab/cd/ shards) and checks
+     each image against the set
+  3. deletes unreferenced images older than the grace period, with their
+     variants, in batches of UPLOAD_GC_BATCH_SIZE with a pause between
+
+A dry run does 1 and 2 and only reports what would be deleted. One app
+worker sweeps per interval (Redis lock); without Redis every worker may
+sweep, which is wasteful but safe.
+"""
+import asyncio
+import os
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Set, Tuple
+import logging
+
+import redis.asyncio as aioredis
+from sqlalchemy import and_, not_, or_
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Item, User
+from app.services.image_processing import image_file_paths
+from app.services.image_storage import RELEASED_ITEM_STATUSES, UPLOADS_URL_PREFIX, image_store
+
+logger = logging.getLogger(__name__)
+
+# Responsive variant of an image: <stem>_<width>w.<ext>
+VARIANT_NAME = re.compile(r"^(?P<stem>.+)_\d+w\.(?:jpg|webp|avif)$")
+
+
+class UploadGarbageCollector:
+    """Periodic sweep deleting uploaded images nothing refers to"""
+
+    LOCK_KEY = "upload:gc:lock"
+    SCAN_BATCH_SIZE = 1000  # Rows per keyset page when collecting references
+    REPORT_SAMPLE_SIZE = 50  # Orphan paths listed in a report
+
+    def __init__(self):
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.redis: Optional[aioredis.Redis] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = threading.Event()
+        self.last_report: Optional[dict] = None
+        self.metrics = {
+            "sweeps": 0,
+            "deleted_images": 0,
+            "deleted_bytes": 0
+        }
+
+    def referenced_stems(self) -> Set[str]:
+        """Paths (relative to UPLOAD_DIR, without extension) of every image in use"""
+        cutoff = datetime.now(timezone.utc).timestamp() - settings.UPLOAD_GC_GRACE_SECONDS
+        released_before = datetime.fromtimestamp(cutoff, timezone.utc)
+        # Inactive means withdrawn (soft deleted)
+        released = and_(
+            or_(Item.is_active == False, Item.status.in_(RELEASED_ITEM_STATUSES)),
+            Item.updated_at < released_before
+        )
+
+        stems: Set[str] = set()
+
+        def add(url: Optional[str]):
+            if url and url.startswith(UPLOADS_URL_PREFIX):
+                stems.add(os.path.splitext(os.path.normpath(url[len(UPLOADS_URL_PREFIX):]))[0])
+
+        db = SessionLocal()
+        try:
+            last_id = 0
+            while True:
+                rows = (
+                    db.query(Item.id, Item.image_urls, Item.primary_image_url)
+                    .filter(Item.id > last_id, not_(released))
+                    .order_by(Item.id)
+                    .limit(self.SCAN_BATCH_SIZE)
+                    .all()
+                )
+                for _, image_urls, primary_image_url in rows:
+                    add(primary_image_url)
+                    for url in image_urls or ():
+                        add(url)
+                if len(rows) < self.SCAN_BATCH_SIZE:
+                    break
+                last_id = rows[-1][0]
+
+            last_id = 0
+            while True:
+                rows = (
+                    db.query(User.id, User.profile_image_url)
+                    .filter(User.id > last_id, User.profile_image_url.isnot(None))
+                    .order_by(User.id)
+                    .limit(self.SCAN_BATCH_SIZE)
+                    .all()
+                )
+                for _, profile_image_url in rows:
+                    add(profile_image_url)
+                if len(rows) < self.SCAN_BATCH_SIZE:
+                    break
+                last_id = rows[-1][0]
+        finally:
+            db.close()
+        return stems
+
+    def _iter_files(self) -> Iterator[Tuple[str, os.DirEntry]]:
+        """(path relative to UPLOAD_DIR, entry) for every file, without listing whole directories"""
+        pending = [""]
+        while pending:
+            relative_dir = pending.pop()
+            try:
+                with os.scandir(os.path.join(settings.UPLOAD_DIR, relative_dir)) as entries:
+                    for entry in entries:
+                        if entry.name.startswith("."):
+                            continue
+                        relative = os.path.join(relative_dir, entry.name)
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(relative)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield relative, entry
+            except FileNotFoundError:
+                continue
+
+    def sweep(self, dry_run: bool = False) -> dict:
+        """One GC pass (blocking); returns a report of what was (or would be) deleted"""
+        started = time.perf_counter()
+        grace_cutoff = time.time() - settings.UPLOAD_GC_GRACE_SECONDS
+        referenced_before = datetime.fromtimestamp(grace_cutoff, timezone.utc)
+        # Collected before the scan: images attached meanwhile are newer than the grace period anyway
+        referenced = self.referenced_stems()
+        extensions = {ext.lower() for ext in settings.ALLOWED_EXTENSIONS}
+
+        report = {
+            "dry_run": dry_run,
+            "referenced_images": len(referenced),
+            "scanned_files": 0,
+            "orphans": 0,
+            "orphan_bytes": 0,
+            "deleted": 0,
+            "skipped_recent": 0,
+            "sample": []
+        }
+        in_batch = 0
+
+        for relative, entry in self._iter_files():
+            if self._stopping.is_set():
+                report["interrupted"] = True
+                break
+            report["scanned_files"] += 1
+
+            variant = VARIANT_NAME.match(entry.name)
+            if variant:
+                stem = os.path.join(os.path.dirname(relative), variant["stem"])
+            else:
+                stem, extension = os.path.splitext(relative)
+                if extension.lower() not in extensions:
+                    continue
+            if stem in referenced:
+                continue
+
+            try:
+                if entry.stat().st_mtime > grace_cutoff:
+                    report["skipped_recent"] += 1
+                    continue
+                full_path = os.path.join(settings.UPLOAD_DIR, relative)
+                if variant:
+                    # Variants go with their image; only ones whose image is gone are removed alone
+                    base = os.path.join(settings.UPLOAD_DIR, stem)
+                    if any(os.path.exists(base + ext) for ext in extensions):
+                        continue
+                    files = [full_path]
+                else:
+                    files = [path for path in image_file_paths(full_path) if os.path.exists(path)]
+                size = sum(os.path.getsize(path) for path in files)
+            except FileNotFoundError:
+                # Deleted while we looked (released by its owner, or with its image)
+                continue
+
+            report["orphans"] += 1
+            report["orphan_bytes"] += size
+            if len(report["sample"]) < self.REPORT_SAMPLE_SIZE:
+                report["sample"].append(relative)
+            if dry_run:
+                continue
+
+            try:
+                if variant:
+                    os.remove(full_path)
+                elif not image_store.delete_unreferenced(relative, referenced_before):
+                    continue
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Upload GC failed to delete {relative}: {e}")
+                continue
+
+            report["deleted"] += 1
+            self.metrics["deleted_images"] += 1
+            self.metrics["deleted_bytes"] += size
+            in_batch += 1
+            if in_batch >= settings.UPLOAD_GC_BATCH_SIZE:
+                # Leave disk and database bandwidth for requests
+                in_batch = 0
+                self._stopping.wait(settings.UPLOAD_GC_BATCH_PAUSE)
+
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.metrics["sweeps"] += 1
+        self.last_report = report
+        return report
+
+    async def start(self):
+        if not settings.UPLOAD_GC_ENABLED or self._task is not None:
+            return
+        self._stopping.clear()
+        if settings.REDIS_URL:
+            try:
+                self.redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+                await self.redis.ping()
+            except Exception as e:
+                logger.warning(f"Upload GC running without a cluster lock: {e}")
+                self.redis = None
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop sweeping; a sweep in progress stops at its next file"""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.UPLOAD_GC_INTERVAL_SECONDS)
+            try:
+                # Held for the whole interval: the next sweep is due when it expires
+                if self.redis is not None and not await self.redis.set(
+                    self.LOCK_KEY, self.node_id, nx=True, ex=settings.UPLOAD_GC_INTERVAL_SECONDS
+                ):
+                    continue
+                report = await asyncio.to_thread(self.sweep, settings.UPLOAD_GC_DRY_RUN)
+                logger.info(
+                    f"Upload GC {'dry run' if report['dry_run'] else 'sweep'}: {report['orphans']} orphans "
+                    f"({report['orphan_bytes']} bytes), {report['deleted']} deleted "
+                    f"in {report['duration_ms']:.0f} ms"
+                )
+            except Exception as e:
+                logger.error(f"Upload GC failed: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "last_report": self.last_report,
+            **self.metrics
+        }
+
+
+# Global upload garbage collector instance
+upload_gc = UploadGarbageCollector()
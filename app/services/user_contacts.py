@@ -0,0 +1,170 @@
+# app/services/user_contacts.py - Batched, cached user contact lookups for notifications
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class UserContact:
+    """
+    The few user fields notifications need, detached from any DB session.
+    Duck-types as User for the email templates (email, username, first_name).
+    User stores no per-user notification preferences; is_active is the one
+    flag that decides whether a user gets mail at all.
+    """
+    __slots__ = ("id", "email", "username", "first_name", "last_name", "is_active")
+
+    def __init__(self, id: int, email: str, username: str, first_name: Optional[str],
+                 last_name: Optional[str], is_active: bool = True):
+        self.id = id
+        self.email = email
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.is_active = is_active
+
+    @property
+    def wants_email(self) -> bool:
+        return bool(self.email) and self.is_active
+
+    def __repr__(self):
+        return f"<UserContact(id={self.id}, username='{self.username}')>"
+
+
+class UserContactCache:
+    """
+    id -> UserContact with a short TTL and LRU bound.
+
+    Misses requested in the same event-loop iteration (e.g. both parties of a
+    swap, or several events dispatched concurrently) are merged into one
+    `WHERE id IN (...)` query run in a worker thread, and concurrent requests
+    for an id that is already being fetched wait for that fetch. Unknown ids
+    are cached as None so they don't hit the database on every notification.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_size: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else settings.USER_CONTACT_CACHE_TTL
+        self.max_size = max_size or settings.USER_CONTACT_CACHE_SIZE
+        self._cache: "OrderedDict[int, Tuple[Optional[UserContact], float]]" = OrderedDict()
+        # Ids being fetched (or about to be) -> future resolving to the contact
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._queued: List[int] = []
+        # Pending fetches, referenced so they aren't garbage-collected mid-query
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "queries": 0,
+            "errors": 0
+        }
+
+    def _cached(self, user_id: int):
+        """Return (found, contact) without touching the database"""
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return False, None
+        contact, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._cache[user_id]
+            return False, None
+        self._cache.move_to_end(user_id)
+        return True, contact
+
+    def _store(self, user_id: int, contact: Optional[UserContact]):
+        self._cache[user_id] = (contact, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, user_id: int) -> Optional[UserContact]:
+        return (await self.get_many([user_id])).get(user_id)
+
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, UserContact]:
+        """Contacts for the given ids; unknown ids are left out. Raises if the lookup failed"""
+        contacts: Dict[int, UserContact] = {}
+        waiting: Dict[int, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+
+        for user_id in dict.fromkeys(user_ids):
+            found, contact = self._cached(user_id)
+            if found:
+                self.metrics["hits"] += 1
+                if contact is not None:
+                    contacts[user_id] = contact
+                continue
+
+            self.metrics["misses"] += 1
+            future = self._inflight.get(user_id)
+            if future is None:
+                future = self._inflight[user_id] = loop.create_future()
+                if not self._queued:
+                    # Let other callers in this iteration add their ids first
+                    loop.call_soon(self._start_fetch)
+                self._queued.append(user_id)
+            waiting[user_id] = future
+
+        for user_id, future in waiting.items():
+            contact = await asyncio.shield(future)
+            if contact is not None:
+                contacts[user_id] = contact
+        return contacts
+
+    def _start_fetch(self):
+        user_ids, self._queued = self._queued, []
+        task = asyncio.ensure_future(self._fetch(user_ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, user_ids: List[int]):
+        self.metrics["queries"] += 1
+        try:
+            rows = await asyncio.to_thread(self._query, user_ids)
+        except Exception as e:
+            self.metrics["errors"] += 1
+            logger.error(f"Error fetching users {user_ids}: {e}")
+            # Waiters see the failure rather than "no such user", and nothing is cached
+            for user_id in user_ids:
+                future = self._inflight.pop(user_id, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        for user_id in user_ids:
+            future = self._inflight.pop(user_id, None)
+            contact = rows.get(user_id)
+            self._store(user_id, contact)
+            if future is not None and not future.done():
+                future.set_result(contact)
+
+    @staticmethod
+    def _query(user_ids: List[int]) -> Dict[int, UserContact]:
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                User.id, User.email, User.username, User.first_name, User.last_name, User.is_active
+            ).filter(User.id.in_(user_ids)).all()
+            return {row.id: UserContact(*row) for row in rows}
+        finally:
+            db.close()
+
+    def invalidate(self, user_id: int):
+        """Forget a user after their profile changes (other workers catch up within the TTL)"""
+        self._cache.pop(user_id, None)
+
+    def get_stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "ttl": self.ttl,
+            **self.metrics
+        }
+
+
+# Global user contact cache
+user_contacts = UserContactCache()
@@ -0,0 +1,79 @@
+# benchmarks/email_render.py - Email template render throughput
+"""
+Render each EmailService template with representative data and report
+renders/second for:
+
+  * per-call: jinja2.Template(source).render(...), what _render_template did
+    before (parse + compile on every email)
+  * cached: the precompiled Template from EmailTemplates
+  * cached+text: EmailTemplates.render, i.e. cached HTML plus the
+    plain-text template derived from it at startup (what a send actually pays)
+
+Usage:
+    python -m benchmarks.email_render
+    python -m benchmarks.email_render --renders 20000
+"""
+import argparse
+import time
+
+from jinja2 import Template
+
+from app.services.email import email_service
+
+
+CONTEXTS = {
+    "swap_request": dict(
+        owner_name="Ava", requester_name="Noah", item_title="Vintage Levi's 501 Jeans",
+        item_points=45, item_condition="Good", swap_type="direct_swap",
+        offered_item_title="Wool Peacoat", offered_item_points=60, points_offered=0,
+        requester_message="Would love to swap, happy to meet up!",
+        accept_url="https://rewear.example/swaps/1/accept",
+        reject_url="https://rewear.example/swaps/1/reject",
+        view_url="https://rewear.example/swaps/1"
+    ),
+    "swap_accepted": dict(
+        requester_name="Noah", owner_name="Ava", item_title="Vintage Levi's 501 Jeans",
+        owner_response="Deal! See you Saturday.", view_url="https://rewear.example/swaps/1"
+    ),
+    "swap_completed": dict(
+        user_name="Ava", item_title="Vintage Levi's 501 Jeans", points_earned=45,
+        dashboard_url="https://rewear.example/dashboard"
+    ),
+    "welcome": dict(
+        user_name="Noah", signup_points=100, dashboard_url="https://rewear.example/dashboard"
+    )
+}
+
+SOURCES = {
+    "swap_request": email_service.SWAP_REQUEST_TEMPLATE,
+    "swap_accepted": email_service.SWAP_ACCEPTED_TEMPLATE,
+    "swap_completed": email_service.SWAP_COMPLETED_TEMPLATE,
+    "welcome": email_service.WELCOME_TEMPLATE
+}
+
+
+def rate(render, renders: int) -> float:
+    started = time.perf_counter()
+    for _ in range(renders):
+        render()
+    return renders / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=5000, help="Renders per template and mode")
+    args = parser.parse_args()
+
+    templates = email_service.templates
+    print(f"{'template':<16} {'per-call/s':>12} {'cached/s':>12} {'cached+text/s':>14} {'speedup':>9}")
+    for name, context in CONTEXTS.items():
+        source = SOURCES[name]
+        compiled = templates.env.get_template(name)
+        per_call = rate(lambda: Template(source).render(**context), max(args.renders // 10, 1))
+        cached = rate(lambda: compiled.render(**context), args.renders)
+        with_text = rate(lambda: templates.render(name, **context), args.renders)
+        print(f"{name:<16} {per_call:>12.0f} {cached:>12.0f} {with_text:>14.0f} {with_text / per_call:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/image_upload.py - Upload image processing throughput, serial vs process pool
+"""
+Process a set of camera-sized photos the way an upload does (decode, RGB,
+downscale to 2048px, JPEG optimize) and report uploads/second:
+
+  * serial: process_image_file in this process, one image at a time (what the
+    upload routes did before; a request thread holding the GIL)
+  * pool: ImageProcessor with --workers processes, --concurrency uploads in
+    flight (like several clients uploading at once)
+
+Speedup scales with cores; on a 1-core box the pool only adds overhead.
+
+Usage:
+    python -m benchmarks.image_upload
+    python -m benchmarks.image_upload --images 64 --workers 8 --size 4032x3024
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from app.services.image_processing import ImageProcessor, process_image_file
+
+
+def make_photo(path: str, width: int, height: int, seed: int):
+    """Noisy gradient with shapes: compresses roughly like a real photo"""
+    base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40 + seed % 20).convert("RGB")
+    img = Image.blend(base, noise, 0.35)
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        x, y = (seed * 97 + i * 331) % width, (seed * 53 + i * 197) % height
+        draw.ellipse((x, y, x + width // 6, y + height // 6), fill=((i * 40) % 256, (seed * 30) % 256, 120))
+    img.filter(ImageFilter.GaussianBlur(1)).save(path, "JPEG", quality=92)
+
+
+def fresh_copies(sources, work_dir: str, tag: str):
+    """Processing rewrites files in place, so each run gets its own copies"""
+    copies = []
+    for i, source in enumerate(sources):
+        target = os.path.join(work_dir, f"{tag}-{i}.jpg")
+        shutil.copyfile(source, target)
+        copies.append(target)
+    return copies
+
+
+def run_serial(paths) -> float:
+    started = time.perf_counter()
+    for path in paths:
+        process_image_file(path)
+    return time.perf_counter() - started
+
+
+async def run_pool(processor: ImageProcessor, paths, concurrency: int) -> float:
+    limit = asyncio.Semaphore(concurrency)
+
+    async def upload(path):
+        async with limit:
+            await processor.process(path)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(path) for path in paths))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--size", default="4032x3024", help="Source photo size WIDTHxHEIGHT")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=16, help="Uploads in flight at once")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.lower().split("x"))
+
+    work_dir = tempfile.mkdtemp(prefix="rewear-image-bench-")
+    try:
+        sources = []
+        for i in range(min(args.images, 8)):
+            path = os.path.join(work_dir, f"source-{i}.jpg")
+            make_photo(path, width, height, i)
+            sources.append(path)
+        sources = [sources[i % len(sources)] for i in range(args.images)]
+        source_mb = sum(os.path.getsize(p) for p in sources) / len(sources) / 1e6
+
+        serial = run_serial(fresh_copies(sources, work_dir, "serial"))
+
+        processor = ImageProcessor(workers=args.workers, queue_depth=max(args.concurrency, 1))
+        processor.start()
+        # Exclude process spawn time from the measurement
+        asyncio.run(run_pool(processor, fresh_copies(sources[:args.workers], work_dir, "warm"), args.workers))
+        pooled = asyncio.run(run_pool(processor, fresh_copies(sources, work_dir, "pool"), args.concurrency))
+        processor.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{args.images} images of {width}x{height} (~{source_mb:.1f} MB), {os.cpu_count()} CPUs")
+    print(f"{'mode':<28} {'uploads/s':>10} {'total s':>9}")
+    print(f"{'serial (in request)':<28} {args.images / serial:>10.2f} {serial:>9.2f}")
+    print(f"{f'pool ({args.workers} workers)':<28} {args.images / pooled:>10.2f} {pooled:>9.2f}")
+    print(f"speedup: {serial / pooled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
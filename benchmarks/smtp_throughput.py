@@ -0,0 +1,163 @@
+# benchmarks/smtp_throughput.py - Email send throughput: connection per message vs pooled sessions
+"""
+Send the same message through a local aiosmtpd server two ways and report
+messages/second and per-send latency:
+
+  * per-message: connect + EHLO + MAIL/RCPT/DATA + QUIT for every email (what
+    EmailService did before SMTPConnectionPool)
+  * pooled: SMTPConnectionPool, one session per worker thread, reused
+
+The local server answers instantly, so --rtt-ms delays each EHLO, MAIL, RCPT
+and DATA reply to stand in for the network round trips to a real relay. TLS
+and AUTH aren't simulated; against a real provider they add several more
+round trips plus a handshake to every per-message send, so the measured gap
+is a lower bound.
+
+Needs aiosmtpd (pip install aiosmtpd); it's not an app dependency.
+
+Usage:
+    python -m benchmarks.smtp_throughput
+    python -m benchmarks.smtp_throughput --messages 2000 --workers 3 --rtt-ms 20
+"""
+import argparse
+import asyncio
+import smtplib
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Callable, List
+
+from aiosmtpd.controller import Controller
+
+from app.services.smtp_pool import SMTPConnectionPool
+
+
+FROM_ADDR = "noreply@rewear.test"
+TO_ADDR = "user@rewear.test"
+
+
+class CountingHandler:
+    """Accepts everything, optionally delaying each reply by rtt seconds"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.received = 0
+
+    async def _delay(self):
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await self._delay()
+        session.host_name = hostname
+        return responses
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        await self._delay()
+        envelope.mail_from = address
+        envelope.mail_options.extend(mail_options)
+        return "250 OK"
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        await self._delay()
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        await self._delay()
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def build_message() -> str:
+    """Roughly the size of the swap request email"""
+    message = MIMEMultipart("alternative")
+    message["Subject"] = "New Swap Request for Vintage Levi's 501 Jeans - ReWear"
+    message["From"] = FROM_ADDR
+    message["To"] = TO_ADDR
+    message.attach(MIMEText("Someone wants to swap for your item.\n" * 20, "plain"))
+    message.attach(MIMEText("<p>Someone wants to swap for your item.</p>\n" * 80, "html"))
+    return message.as_string()
+
+
+def send_per_message(host: str, port: int, raw_message: str):
+    with smtplib.SMTP(host, port) as server:
+        server.ehlo()
+        server.sendmail(FROM_ADDR, TO_ADDR, raw_message)
+
+
+def run(label: str, send: Callable[[], None], messages: int, workers: int) -> dict:
+    latencies: List[float] = []
+
+    def timed_send():
+        started = time.perf_counter()
+        send()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(timed_send) for _ in range(messages)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "label": label,
+        "msgs_per_s": messages / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "elapsed_s": elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=3, help="Sender threads (and pool size), like SMTP_POOL_SIZE")
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="Simulated round trip per SMTP command")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    handler = CountingHandler(args.rtt_ms / 1000)
+    controller = Controller(handler, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    raw_message = build_message()
+
+    try:
+        results = [
+            run(
+                "per-message",
+                lambda: send_per_message(controller.hostname, controller.port, raw_message),
+                args.messages, args.workers
+            )
+        ]
+
+        pool = SMTPConnectionPool(
+            host=controller.hostname, port=controller.port, use_tls=False, max_size=args.workers
+        )
+        results.append(run(
+            "pooled",
+            lambda: pool.send(FROM_ADDR, TO_ADDR, raw_message),
+            args.messages, args.workers
+        ))
+        pool_stats = pool.get_stats()
+        pool.close_all()
+    finally:
+        controller.stop()
+
+    print(f"{args.messages} messages, {args.workers} workers, {args.rtt_ms:g} ms simulated RTT, "
+          f"{len(raw_message)} byte message")
+    print(f"{'mode':<12} {'msgs/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'total s':>10}")
+    for result in results:
+        print(f"{result['label']:<12} {result['msgs_per_s']:>10.1f} {result['p50_ms']:>10.2f} "
+              f"{result['p95_ms']:>10.2f} {result['elapsed_s']:>10.2f}")
+    print(f"speedup: {results[1]['msgs_per_s'] / results[0]['msgs_per_s']:.1f}x")
+    print(f"pool: {pool_stats['connections_opened']} connections opened, "
+          f"{pool_stats['connections_reused']} reuses, {pool_stats['send_retries']} retries")
+    print(f"server received {handler.received} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# benchmarks/ws_encoding.py - CPU vs bytes-on-wire for notification encodings
+"""
+Encode typical NotificationService payloads with each wire encoding and report
+encode time and frame size, raw and after permessage-deflate (simulated with
+zlib raw deflate the same way the websockets library does it).
+
+Usage:
+    python -m benchmarks.ws_encoding
+    python -m benchmarks.ws_encoding --messages 20000 --window-bits 12 --mem-level 5
+"""
+import argparse
+import random
+import time
+import zlib
+
+from app.core.encoding import COMPACT_CODEC, JSON_CODEC, MSGPACK_CODEC, msgpack
+
+
+ITEM_TITLES = [
+    "Vintage Levi's 501 Jeans", "Wool Peacoat", "Linen Shirt", "Floral Midi Dress",
+    "Leather Chelsea Boots", "Cashmere Sweater", "Denim Jacket", "Silk Scarf"
+]
+
+
+def sample_notifications(rng: random.Random):
+    """One round of payloads shaped like the ones NotificationService sends"""
+    now = time.monotonic()
+    title = rng.choice(ITEM_TITLES)
+    swap_id = rng.randint(1, 10_000_000)
+    item_id = rng.randint(1, 10_000_000)
+    points = rng.randint(5, 200)
+    return [
+        {
+            "type": "swap_request",
+            "title": "New Swap Request",
+            "message": f"Someone wants to swap for your item: {title}",
+            "data": {"swap_id": swap_id, "requester_id": rng.randint(1, 1_000_000), "item_id": item_id, "swap_type": "direct_swap"},
+            "timestamp": now,
+            "action_required": True
+        },
+        {
+            "type": "swap_response",
+            "title": "Swap Request Accepted",
+            "message": f"Your swap request for '{title}' was accepted",
+            "data": {"swap_id": swap_id, "owner_id": rng.randint(1, 1_000_000), "item_id": item_id, "status": "accepted"},
+            "timestamp": now,
+            "action_required": True
+        },
+        {
+            "type": "points_earned",
+            "title": "Points Earned!",
+            "message": f"You earned {points} points: Listed new item: {title}",
+            "data": {"points": points, "reason": f"Listed new item: {title}"},
+            "timestamp": now,
+            "action_required": False
+        },
+        {
+            "type": "item_approved",
+            "title": "Item Approved",
+            "message": f"Your item '{title}' is now live on ReWear!",
+            "data": {"item_id": item_id, "title": title},
+            "timestamp": now,
+            "action_required": False
+        },
+        {
+            "type": "system_announcement",
+            "title": "ReWear Announcement",
+            "message": "Scheduled maintenance tonight from 02:00 to 02:30 UTC.",
+            "timestamp": now,
+            "action_required": False
+        },
+    ]
+
+
+def deflate_sizes(frames, window_bits, mem_level, context_takeover):
+    """Total permessage-deflate payload bytes for a stream of frames"""
+    def new_encoder():
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -window_bits, mem_level)
+
+    encoder = new_encoder()
+    total = 0
+    for frame in frames:
+        data = frame if isinstance(frame, bytes) else frame.encode("utf-8")
+        if not context_takeover:
+            encoder = new_encoder()
+        compressed = encoder.compress(data) + encoder.flush(zlib.Z_SYNC_FLUSH)
+        # permessage-deflate strips the trailing empty block marker
+        total += len(compressed) - 4
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000, help="Frames encoded per codec")
+    parser.add_argument("--window-bits", type=int, default=12)
+    parser.add_argument("--mem-level", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    stream = []
+    while len(stream) < args.messages:
+        stream.extend(sample_notifications(rng))
+    stream = stream[:args.messages]
+
+    codecs = [JSON_CODEC, COMPACT_CODEC]
+    if msgpack is not None:
+        codecs.append(MSGPACK_CODEC)
+    else:
+        print("msgpack not installed - skipping rewear.msgpack.v1\n")
+
+    print(
+        f"{'encoding':<20} {'encode us/msg':>13} {'raw B/msg':>10} "
+        f"{'deflate B/msg':>14} {'deflate+ctx B/msg':>18} {'deflate us/msg':>15}"
+    )
+    for codec in codecs:
+        started = time.perf_counter()
+        frames = [codec.encode(message) for message in stream]
+        encode_us = (time.perf_counter() - started) / len(stream) * 1e6
+
+        raw = sum(len(frame) for frame in frames) / len(frames)
+
+        started = time.perf_counter()
+        no_ctx = deflate_sizes(frames, args.window_bits, args.mem_level, context_takeover=False) / len(frames)
+        deflate_us = (time.perf_counter() - started) / len(frames) * 1e6
+        with_ctx = deflate_sizes(frames, args.window_bits, args.mem_level, context_takeover=True) / len(frames)
+
+        print(
+            f"{codec.subprotocol:<20} {encode_us:>13.2f} {raw:>10.1f} "
+            f"{no_ctx:>14.1f} {with_ctx:>18.1f} {deflate_us:>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
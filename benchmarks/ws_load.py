@@ -0,0 +1,245 @@
+# benchmarks/ws_load.py - Fan-out load test for the notification WebSocket
+"""
+Open N authenticated sockets against a LOCAL server, broadcast announcements
+through the debug API and report:
+
+  * end-to-end delivery latency (trigger -> frame received) percentiles
+  * server memory per connection (RSS delta, needs --server-pid)
+  * event-loop lag: heartbeat round trips on probe sockets while a broadcast
+    is in flight (server side), and sleep overshoot in this process (client
+    side, to make sure the harness itself isn't the bottleneck)
+
+The server must run with DEBUG=true (the broadcast endpoint is debug-only) and
+share this checkout's .env so tokens can be minted for existing active users.
+Connections are spread round-robin over those users.
+
+Usage:
+    uvicorn app.main:app --port 8000 &
+    python -m benchmarks.ws_load --connections 5000 --rounds 20 --server-pid $!
+    python -m benchmarks.ws_load --connections 200 --user-ids 1 2 3
+"""
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import time
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Optional
+
+import websockets
+
+from app.core.security import create_access_token
+
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process in KiB (Linux /proc)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def active_user_ids(limit: int) -> List[int]:
+    from app.database import SessionLocal
+    from app.models import User
+
+    db = SessionLocal()
+    try:
+        rows = db.query(User.id).filter(User.is_active == True).order_by(User.id).limit(limit).all()
+        return [row[0] for row in rows]
+    finally:
+        db.close()
+
+
+class LoadClient:
+    """One socket: answers server pings and timestamps load-test frames"""
+
+    def __init__(self, websocket, results: Dict[int, List[float]]):
+        self.websocket = websocket
+        self.results = results
+        self.heartbeats: Dict[float, asyncio.Future] = {}
+
+    async def run(self):
+        try:
+            async for frame in self.websocket:
+                received = time.perf_counter()
+                body = json.loads(frame)
+                for message in body if isinstance(body, list) else [body]:
+                    await self.handle(message, received)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def handle(self, message: dict, received: float):
+        message_type = message.get("type")
+        if message_type == "ping":
+            await self.websocket.send(json.dumps({"type": "pong"}))
+        elif message_type == "heartbeat_response":
+            waiter = self.heartbeats.pop(message.get("timestamp"), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(received)
+        elif message_type == "system_announcement":
+            text = message.get("message", "")
+            if text.startswith("loadtest:"):
+                self.results.setdefault(int(text.split(":", 1)[1]), []).append(received)
+
+    async def heartbeat_rtt(self) -> float:
+        sent = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self.heartbeats[sent] = waiter
+        await self.websocket.send(json.dumps({"type": "heartbeat", "timestamp": sent}))
+        received = await asyncio.wait_for(waiter, timeout=30)
+        return (received - sent) * 1000
+
+
+async def monitor_loop_lag(samples: List[float], interval: float = 0.01):
+    """Record how late this process's event loop wakes up"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+
+def post_broadcast(base_url: str, message: str) -> dict:
+    query = urllib.parse.urlencode({"message": message})
+    request = urllib.request.Request(
+        f"{base_url}/api/v1/ws/admin/broadcast-test-notification?{query}", method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+async def main_async(args):
+    parsed = urllib.parse.urlparse(args.url)
+    if parsed.hostname not in LOCAL_HOSTS:
+        raise SystemExit(f"Refusing to load-test non-local host {parsed.hostname!r}")
+    ws_base = f"{'wss' if parsed.scheme == 'https' else 'ws'}://{parsed.netloc}"
+
+    user_ids = args.user_ids or active_user_ids(args.connections)
+    if not user_ids:
+        raise SystemExit("No active users found; pass --user-ids or register some users first")
+    tokens = {user_id: create_access_token({"sub": str(user_id)}) for user_id in user_ids}
+
+    # Every socket is a file descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.connections + 100:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    rss_before = rss_kb(args.server_pid) if args.server_pid else None
+    results: Dict[int, List[float]] = {}
+    clients: List[LoadClient] = []
+    readers: List[asyncio.Task] = []
+    failures = 0
+    gate = asyncio.Semaphore(args.connect_concurrency)
+
+    async def open_one(index: int):
+        nonlocal failures
+        token = tokens[user_ids[index % len(user_ids)]]
+        async with gate:
+            try:
+                websocket = await websockets.connect(
+                    f"{ws_base}/api/v1/ws/notifications/{token}",
+                    ping_interval=None, open_timeout=30, max_queue=None
+                )
+                # Skip the welcome frame so it doesn't count as a delivery
+                await websocket.recv()
+            except Exception:
+                failures += 1
+                return
+        client = LoadClient(websocket, results)
+        clients.append(client)
+        readers.append(asyncio.create_task(client.run()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(open_one(index) for index in range(args.connections)))
+    connect_seconds = time.perf_counter() - started
+    print(f"connected {len(clients)}/{args.connections} sockets in {connect_seconds:.1f}s ({failures} failed)")
+
+    await asyncio.sleep(1)
+    rss_after = rss_kb(args.server_pid) if args.server_pid else None
+
+    client_lag: List[float] = []
+    lag_task = asyncio.create_task(monitor_loop_lag(client_lag))
+    probes = clients[:args.probes]
+    latencies: List[float] = []
+    server_lag: List[float] = []
+    fanout_ms: List[float] = []
+    delivered = 0
+
+    for round_id in range(args.rounds):
+        triggered = time.perf_counter()
+        probe_rtts = asyncio.gather(*(probe.heartbeat_rtt() for probe in probes), return_exceptions=True)
+        response = await asyncio.to_thread(post_broadcast, args.url, f"loadtest:{round_id}")
+        fanout_ms.append(response["fanout_ms"])
+        server_lag.extend(rtt for rtt in await probe_rtts if isinstance(rtt, float))
+
+        deadline = time.perf_counter() + args.round_timeout
+        while len(results.get(round_id, [])) < len(clients) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+        received = results.get(round_id, [])
+        delivered += len(received)
+        latencies.extend((at - triggered) * 1000 for at in received)
+        await asyncio.sleep(args.pause)
+
+    lag_task.cancel()
+    for client in clients:
+        await client.websocket.close()
+    for reader in readers:
+        reader.cancel()
+
+    expected = len(clients) * args.rounds
+    print(f"\ndelivered {delivered}/{expected} frames over {args.rounds} rounds")
+    print(f"{'metric':<28} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name, values in (
+        ("delivery latency ms", latencies),
+        ("server fan-out call ms", fanout_ms),
+        ("server heartbeat rtt ms", server_lag),
+        ("client loop lag ms", client_lag),
+    ):
+        print(
+            f"{name:<28} {percentile(values, 50):>9.2f} {percentile(values, 95):>9.2f} "
+            f"{percentile(values, 99):>9.2f} {max(values, default=float('nan')):>9.2f}"
+        )
+    if latencies:
+        print(f"mean delivery latency: {statistics.fmean(latencies):.2f} ms")
+
+    if rss_before is not None and rss_after is not None and clients:
+        per_connection = (rss_after - rss_before) * 1024 / len(clients)
+        print(f"server RSS {rss_before / 1024:.1f} -> {rss_after / 1024:.1f} MiB, ~{per_connection:.0f} B/connection")
+    elif args.server_pid:
+        print(f"could not read /proc/{args.server_pid}/status for memory numbers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Local server base URL")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10, help="Broadcasts to send")
+    parser.add_argument("--pause", type=float, default=0.5, help="Seconds between broadcasts")
+    parser.add_argument("--round-timeout", type=float, default=10.0, help="Max wait for one broadcast to arrive everywhere")
+    parser.add_argument("--probes", type=int, default=10, help="Sockets sending heartbeats during each broadcast")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="Handshakes in flight at once")
+    parser.add_argument("--user-ids", type=int, nargs="+", help="Users to connect as (default: active users from the DB)")
+    parser.add_argument("--server-pid", type=int, help="Server process id for RSS-per-connection numbers")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()